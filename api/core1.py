@@ -0,0 +1,168 @@
+# core1.py
+
+import _thread
+import utime
+from ring import Ring, SLOT_WIDTH
+from motor import IDLE, COOLDOWN
+from history import SOURCE_MANUAL, FLAG_CANCELLED, FLAG_ERROR
+
+RING_SIZE = 16
+POLL_MS = 20  # Loop period while a pump is running
+IDLE_MS = 200  # Loop period otherwise, still well under the scheduler's 1 s resolution
+
+# Commands, core 0 to core 1
+CMD_RUN = 1  # zone, source
+CMD_STOP = 2  # zone
+CMD_SCHEDULE = 3  # zone, next watering, interval, duration ms
+
+# Events, core 1 to core 0
+EV_STARTED = 1  # zone, duration ms
+EV_FINISHED = 2  # zone, started at, requested ms, forward ms, flags | source << 8
+EV_SCHEDULED = 3  # zone, next watering: a due zone moved on, or a CMD_SCHEDULE was applied
+
+# Zone states published for core 0, one byte per zone
+ZONE_IDLE = 0
+ZONE_QUEUED = 1  # Waiting for its supply
+ZONE_PUMPING = 2  # Running forward or reverse
+ZONE_COOLDOWN = 3
+
+# Ring slots only hold integers, durations can be fractional seconds
+def to_ms(seconds):
+    return int(round(seconds * 1000))
+
+def from_ms(ms):
+    return ms // 1000 if ms % 1000 == 0 else ms / 1000
+
+class Core1:
+    """Runs the zone scheduler and the motor state machines on the second core.
+
+    Core 0 keeps Wi-Fi, HTTP and flash. Once start() has been called it
+    only changes the scheduler by sending commands through one ring, and
+    hears about starts, finishes and reschedules through another. Motor
+    timing only depends on this loop, so network stalls on core 0 don't
+    stretch a watering. On CPython the loop is an ordinary thread.
+
+    Core 0 still reads some zone fields directly for its replies, without
+    a lock, while core 1 may be writing them:
+
+    - next_watering, anchor, interval and duration, in Zone.info(),
+      udp_status() and the state store. Each read gets a whole old or new
+      value, but fields read together can straddle a tick or a
+      CMD_SCHEDULE, and the EV_SCHEDULED that follows puts that right.
+    - motor.state, in Zone.info(), udp_status() and the heartbeat. It is
+      the live state, which can be ahead of the published state byte.
+
+    zone_state() and supply_busy() read the state bytes instead, which are
+    at most one loop old. No direct read feeds back into core 1.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.commands = Ring(RING_SIZE)
+        self.events = Ring(RING_SIZE)
+        self.running = False
+        self.loops = 0
+        self.max_loop_us = 0
+        self._command = [0] * SLOT_WIDTH
+        self._slots = {}  # zone id -> index into states
+        self.states = bytearray(0)
+        scheduler.listener = self._on_zone_event
+
+    def start(self):
+        # Zones are all added by now, the slot table doesn't change after this
+        zones = self.scheduler.zones
+        self._slots = {zone_id: i for i, zone_id in enumerate(zones)}
+        self.states = bytearray(len(zones))
+        self._publish_states()
+        self.running = True
+        _thread.start_new_thread(self._run, ())
+
+    def _on_zone_event(self, event, zone):
+        if event == 'watering_started':
+            self.events.put(EV_STARTED, zone.id, to_ms(zone.duration))
+        elif event == 'watering_finished':
+            motor = zone.motor
+            flags = (FLAG_CANCELLED if motor.cancelled else 0) | (FLAG_ERROR if motor.error else 0)
+            self.events.put(EV_FINISHED, zone.id, motor.started_at, to_ms(motor.duration), motor.forward_ms,
+                            flags | zone.source << 8)
+
+    def _apply(self, command):
+        scheduler = self.scheduler
+        zone = scheduler.get(command[1])
+        if zone is None:
+            return
+        kind = command[0]
+        if kind == CMD_RUN:
+            scheduler.run(zone, command[2])
+        elif kind == CMD_STOP:
+            scheduler.stop(zone)
+        elif kind == CMD_SCHEDULE:
+            zone.interval = command[3]
+            zone.duration = from_ms(command[4])
+            scheduler.schedule(zone, command[2])
+            self.events.put(EV_SCHEDULED, zone.id, zone.next_watering)
+
+    def _publish_states(self):
+        states = self.states
+        waiting = self.scheduler.waiting
+        for zone_id, i in self._slots.items():
+            zone = self.scheduler.zones[zone_id]
+            state = zone.motor.state
+            if state == COOLDOWN:
+                states[i] = ZONE_COOLDOWN
+            elif state != IDLE:
+                states[i] = ZONE_PUMPING
+            elif zone in waiting.get(zone.supply, ()):
+                states[i] = ZONE_QUEUED
+            else:
+                states[i] = ZONE_IDLE
+
+    def _run(self):
+        scheduler = self.scheduler
+        command = self._command
+        while self.running:
+            started = utime.ticks_us()
+            while self.commands.get(command):
+                self._apply(command)
+            for zone in scheduler.tick(utime.time()):
+                self.events.put(EV_SCHEDULED, zone.id, zone.next_watering)
+            scheduler.poll()
+            self._publish_states()
+            took = utime.ticks_diff(utime.ticks_us(), started)
+            if took > self.max_loop_us:
+                self.max_loop_us = took
+            self.loops += 1
+            utime.sleep_ms(POLL_MS if scheduler.busy() else IDLE_MS)
+
+    # Core 0 side
+
+    def run(self, zone, source=SOURCE_MANUAL):
+        return self.commands.put(CMD_RUN, zone.id, source)
+
+    def stop(self, zone):
+        return self.commands.put(CMD_STOP, zone.id)
+
+    def schedule(self, zone, next_watering, interval=None, duration=None):
+        return self.commands.put(CMD_SCHEDULE, zone.id, next_watering,
+                                 zone.interval if interval is None else interval,
+                                 to_ms(zone.duration if duration is None else duration))
+
+    def zone_state(self, zone):
+        """The zone's state as of core 1's last loop, one of the ZONE_ constants."""
+        return self.states[self._slots[zone.id]]
+
+    def supply_busy(self, zone):
+        """True if another zone holds the pump zone draws from."""
+        for other in self.scheduler.zones.values():
+            if other is not zone and other.supply == zone.supply and self.zone_state(other) >= ZONE_PUMPING:
+                return True
+        return False
+
+    def status(self):
+        return {
+            "running": self.running,
+            "loops": self.loops,
+            "max_loop_us": self.max_loop_us,
+            "commands_dropped": self.commands.dropped,
+            "events_dropped": self.events.dropped
+        }
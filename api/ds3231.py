@@ -1,44 +1,159 @@
 # ds3231.py
 
-from machine import I2C, Pin
-import ustruct
 import utime
 
-# Set up I2C
-i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=100000)
 DS3231_I2C_ADDR = 0x68
 
-def ds3231_read(reg, nbytes=1):
-    return i2c.readfrom_mem(DS3231_I2C_ADDR, reg, nbytes)
-
-def ds3231_write(reg, data):
-    i2c.writeto_mem(DS3231_I2C_ADDR, reg, data)
-
-def set_alarm(timestamp):
-    # Convert timestamp to datetime
-    t = utime.localtime(timestamp)
-    
-    # Set Alarm 1 to trigger at the specific date and time
-    ds3231_write(0x07, ustruct.pack('B', ((t[5] // 10) << 4) | (t[5] % 10)))  # Seconds
-    ds3231_write(0x08, ustruct.pack('B', ((t[4] // 10) << 4) | (t[4] % 10)))  # Minutes
-    ds3231_write(0x09, ustruct.pack('B', ((t[3] // 10) << 4) | (t[3] % 10)))  # Hours
-    ds3231_write(0x0A, ustruct.pack('B', ((t[2] // 10) << 4) | (t[2] % 10)))  # Day of month
-    
-    # Enable Alarm 1
-    control = ds3231_read(0x0E)[0]
-    ds3231_write(0x0E, ustruct.pack('B', control | 0x05))  # Enable Alarm 1 interrupt
-
-def get_alarm():
-    # Read Alarm 1 registers
-    seconds = int(((ds3231_read(0x07)[0] & 0x70) >> 4) * 10 + (ds3231_read(0x07)[0] & 0x0F))
-    minutes = int(((ds3231_read(0x08)[0] & 0x70) >> 4) * 10 + (ds3231_read(0x08)[0] & 0x0F))
-    hours = int(((ds3231_read(0x09)[0] & 0x30) >> 4) * 10 + (ds3231_read(0x09)[0] & 0x0F))
-    day = int(((ds3231_read(0x0A)[0] & 0x30) >> 4) * 10 + (ds3231_read(0x0A)[0] & 0x0F))
-    
-    # Get current year and month (assuming they haven't changed)
-    current_time = utime.localtime()
-    year, month = current_time[0], current_time[1]
-    
-    # Create a timestamp
-    alarm_time = utime.mktime((year, month, day, hours, minutes, seconds, 0, 0))
-    return alarm_time
\ No newline at end of file
+# Registers
+REG_TIME = 0x00  # Seconds, minutes, hours, weekday, date, month, year
+REG_ALARM1 = 0x07  # Seconds, minutes, hours, date
+REG_ALARM2 = 0x0B  # Minutes, hours, date
+REG_CONTROL = 0x0E
+REG_STATUS = 0x0F
+REG_TEMP = 0x11
+
+# Control bits
+A1IE = 0x01
+A2IE = 0x02
+INTCN = 0x04
+
+# Status bits
+A1F = 0x01
+A2F = 0x02
+OSF = 0x80  # Oscillator stopped, the time can't be trusted
+
+# Lookup tables between binary and BCD, so no register needs arithmetic
+_TO_BCD = bytes(((n // 10) << 4) | (n % 10) for n in range(100))
+_FROM_BCD = bytes((b >> 4) * 10 + (b & 0x0F) for b in range(256))
+
+class DS3231:
+    """DS3231 driver that moves each register block in a single I2C transaction.
+
+    All transfers go through preallocated buffers, so reading the time or
+    an alarm doesn't allocate beyond the returned values.
+    """
+
+    def __init__(self, i2c, addr=DS3231_I2C_ADDR):
+        self.i2c = i2c
+        self.addr = addr
+        self._time_buf = bytearray(7)
+        self._alarm1_buf = bytearray(4)
+        self._alarm2_buf = bytearray(3)
+        self._temp_buf = bytearray(2)
+        self._reg_buf = bytearray(1)
+
+    def _read(self, reg, buf):
+        self.i2c.readfrom_mem_into(self.addr, reg, buf)
+        return buf
+
+    def _write(self, reg, buf):
+        self.i2c.writeto_mem(self.addr, reg, buf)
+
+    def _read_reg(self, reg):
+        return self._read(reg, self._reg_buf)[0]
+
+    def _write_reg(self, reg, value):
+        self._reg_buf[0] = value
+        self._write(reg, self._reg_buf)
+
+    def datetime(self):
+        """Returns (year, month, mday, hour, minute, second, weekday), weekday 0 = Monday."""
+        b = self._read(REG_TIME, self._time_buf)
+        return (
+            2000 + _FROM_BCD[b[6]] + (100 if b[5] & 0x80 else 0),
+            _FROM_BCD[b[5] & 0x1F],
+            _FROM_BCD[b[4] & 0x3F],
+            _FROM_BCD[b[2] & 0x3F],
+            _FROM_BCD[b[1] & 0x7F],
+            _FROM_BCD[b[0] & 0x7F],
+            (b[3] & 0x07) - 1
+        )
+
+    def set_datetime(self, t):
+        """Sets the clock from a utime.localtime() style tuple."""
+        b = self._time_buf
+        b[0] = _TO_BCD[t[5]]
+        b[1] = _TO_BCD[t[4]]
+        b[2] = _TO_BCD[t[3]]  # 24 hour mode
+        b[3] = t[6] + 1
+        b[4] = _TO_BCD[t[2]]
+        b[5] = _TO_BCD[t[1]] | (0x80 if t[0] >= 2100 else 0)
+        b[6] = _TO_BCD[t[0] % 100]
+        self._write(REG_TIME, b)
+        self.clear_flags(OSF)
+
+    def time(self):
+        t = self.datetime()
+        return utime.mktime((t[0], t[1], t[2], t[3], t[4], t[5], t[6], 0))
+
+    def set_time(self, timestamp):
+        self.set_datetime(utime.localtime(timestamp))
+
+    def _enable(self, bits):
+        self._write_reg(REG_CONTROL, self._read_reg(REG_CONTROL) | INTCN | bits)
+
+    def set_alarm(self, timestamp):
+        """Sets Alarm 1 to match the date, hour, minute and second of timestamp."""
+        t = utime.localtime(timestamp)
+        b = self._alarm1_buf
+        b[0] = _TO_BCD[t[5]]
+        b[1] = _TO_BCD[t[4]]
+        b[2] = _TO_BCD[t[3]]
+        b[3] = _TO_BCD[t[2]]  # A1M4 and DY/DT clear: match on day of month
+        self._write(REG_ALARM1, b)
+        self._enable(A1IE)
+
+    def set_alarm2(self, timestamp):
+        """Sets Alarm 2 to match the date, hour and minute of timestamp."""
+        t = utime.localtime(timestamp)
+        b = self._alarm2_buf
+        b[0] = _TO_BCD[t[4]]
+        b[1] = _TO_BCD[t[3]]
+        b[2] = _TO_BCD[t[2]]
+        self._write(REG_ALARM2, b)
+        self._enable(A2IE)
+
+    def _next_match(self, day, hours, minutes, seconds):
+        # The alarm only stores the day of month, so it fires in the first
+        # month from now that has that day at a time not already past
+        now = self.datetime()
+        year, month = now[0], now[1]
+        current = utime.mktime((now[0], now[1], now[2], now[3], now[4], now[5], 0, 0))
+        for _ in range(13):
+            alarm_time = utime.mktime((year, month, day, hours, minutes, seconds, 0, 0))
+            if utime.localtime(alarm_time)[2] == day and alarm_time >= current:
+                return alarm_time
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+        return None
+
+    def get_alarm(self):
+        b = self._read(REG_ALARM1, self._alarm1_buf)
+        return self._next_match(_FROM_BCD[b[3] & 0x3F], _FROM_BCD[b[2] & 0x3F],
+                                _FROM_BCD[b[1] & 0x7F], _FROM_BCD[b[0] & 0x7F])
+
+    def get_alarm2(self):
+        b = self._read(REG_ALARM2, self._alarm2_buf)
+        return self._next_match(_FROM_BCD[b[2] & 0x3F], _FROM_BCD[b[1] & 0x3F],
+                                _FROM_BCD[b[0] & 0x7F], 0)
+
+    def flags(self):
+        return self._read_reg(REG_STATUS)
+
+    def alarm_fired(self, flag=A1F):
+        return bool(self.flags() & flag)
+
+    def clear_flags(self, mask=A1F | A2F):
+        status = self._read_reg(REG_STATUS)
+        if status & mask:
+            self._write_reg(REG_STATUS, status & ~mask & 0xFF)
+
+    def lost_power(self):
+        return bool(self.flags() & OSF)
+
+    def temperature(self):
+        b = self._read(REG_TEMP, self._temp_buf)
+        msb = b[0] - 256 if b[0] & 0x80 else b[0]
+        return msb + (b[1] >> 6) * 0.25
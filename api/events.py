@@ -0,0 +1,60 @@
+# events.py
+
+import asyncio
+import json
+
+MAX_SUBSCRIBERS = 2
+QUEUE_SIZE = 8  # Events buffered per subscriber before the oldest is dropped
+HEARTBEAT_INTERVAL = 15  # Seconds between heartbeat events
+
+EVENT_STREAM_TYPE = b"Content-type: text/event-stream\r\n"
+STREAM_HEADERS = b"Cache-Control: no-cache\r\n"
+
+class Subscriber:
+    def __init__(self):
+        self.pending = []
+        self.ready = asyncio.Event()
+
+class EventBus:
+    """Fans Server-Sent Events out to a bounded set of subscribers.
+
+    publish() never waits: each event is encoded once and queued for every
+    subscriber, dropping the oldest event if a client falls behind. Each
+    subscriber's stream coroutine does the socket writes.
+    """
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers = []
+
+    def full(self):
+        return len(self.subscribers) >= self.max_subscribers
+
+    def publish(self, name, data):
+        if not self.subscribers:
+            return
+        message = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+        for subscriber in self.subscribers:
+            if len(subscriber.pending) >= QUEUE_SIZE:
+                subscriber.pending.pop(0)
+            subscriber.pending.append(message)
+            subscriber.ready.set()
+
+    async def stream(self, writer):
+        if self.full():
+            return
+        subscriber = Subscriber()
+        self.subscribers.append(subscriber)
+        print(f"Event subscriber added ({len(self.subscribers)}/{self.max_subscribers})")
+        try:
+            writer.write(b"retry: 5000\n\n")
+            await writer.drain()
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.pending:
+                    writer.write(subscriber.pending.pop(0))
+                await writer.drain()
+        finally:
+            self.subscribers.remove(subscriber)
+            print(f"Event subscriber removed ({len(self.subscribers)}/{self.max_subscribers})")
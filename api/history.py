@@ -0,0 +1,129 @@
+# history.py
+
+import struct
+
+CAPACITY = 256  # Watering events kept, older ones are overwritten
+BLOCK_RECORDS = 16  # Records mirrored to flash per write
+HISTORY_FILE = 'history.bin'
+CHUNK_SIZE = 256  # Bytes of JSON sent per write when streaming
+
+# Trigger sources
+SOURCE_SCHEDULE = 0
+SOURCE_MANUAL = 1
+SOURCE_MOISTURE = 2
+SOURCE_NAMES = ('schedule', 'manual', 'moisture')
+
+# Flags
+FLAG_CANCELLED = 0x01
+FLAG_ERROR = 0x02
+
+# timestamp, zone, requested seconds, actual seconds, source, flags, reserved
+RECORD_FORMAT = '<IBHHBBB'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+class History:
+    """Fixed-size ring buffer of watering events, packed into one bytearray.
+
+    The buffer's flash mirror is a file of the same size. Each filled block
+    of BLOCK_RECORDS records is written in place at its slot, so flash
+    writes stay small and the file never grows. At most one unwritten block
+    is lost on a power cut. RAM use is CAPACITY * RECORD_SIZE bytes,
+    however long the device runs.
+    """
+
+    def __init__(self, capacity=CAPACITY, path=HISTORY_FILE):
+        self.capacity = capacity
+        self.path = path
+        self.buf = bytearray(capacity * RECORD_SIZE)
+        self.count = 0  # Records ever added, the next one goes in slot count % capacity
+        self.flushed = 0  # Records mirrored to flash
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                n = f.readinto(self.buf)
+        except OSError:
+            return
+        # The newest record has the largest timestamp, empty slots read as 0
+        newest = -1
+        newest_ts = 0
+        full = n == len(self.buf)
+        for slot in range(n // RECORD_SIZE):
+            ts = struct.unpack_from('<I', self.buf, slot * RECORD_SIZE)[0]
+            if ts == 0:
+                full = False
+            elif ts >= newest_ts:
+                newest, newest_ts = slot, ts
+        self.count = newest + 1 + (self.capacity if full else 0)
+        self.flushed = self.count
+
+    def add(self, timestamp, zone, requested, actual, source, flags=0):
+        slot = self.count % self.capacity
+        struct.pack_into(RECORD_FORMAT, self.buf, slot * RECORD_SIZE,
+                         timestamp, zone, min(round(requested), 0xFFFF), min(actual, 0xFFFF), source, flags, 0)
+        self.count += 1
+        if self.count - self.flushed >= BLOCK_RECORDS:
+            self.flush()
+
+    def flush(self):
+        if self.flushed == self.count:
+            return
+        mv = memoryview(self.buf)
+        try:
+            f = open(self.path, 'r+b')
+        except OSError:
+            f = open(self.path, 'wb')
+            f.write(self.buf)
+            f.close()
+            self.flushed = self.count
+            return
+        with f:
+            # Unflushed records are contiguous except where they wrap around
+            start = self.flushed % self.capacity
+            end = self.count % self.capacity
+            if self.count - self.flushed >= self.capacity:
+                start, end = 0, self.capacity
+            if end <= start and self.count - self.flushed < self.capacity:
+                f.seek(start * RECORD_SIZE)
+                f.write(mv[start * RECORD_SIZE:])
+                start = 0
+            f.seek(start * RECORD_SIZE)
+            f.write(mv[start * RECORD_SIZE:end * RECORD_SIZE])
+        self.flushed = self.count
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def _format(self, slot):
+        ts, zone, requested, actual, source, flags, _ = struct.unpack_from(RECORD_FORMAT, self.buf, slot * RECORD_SIZE)
+        source = SOURCE_NAMES[source] if source < len(SOURCE_NAMES) else str(source)
+        cancelled = 'true' if flags & FLAG_CANCELLED else 'false'
+        error = 'true' if flags & FLAG_ERROR else 'false'
+        return (
+            f'{{"time": {ts}, "zone": {zone}, "requested": {requested}, "actual": {actual}, '
+            f'"source": "{source}", "cancelled": {cancelled}, "error": {error}}}'
+        )
+
+    async def stream(self, writer, since=0, limit=CAPACITY):
+        """Write records newer than since, oldest first, as a JSON list."""
+        chunk = bytearray()
+        chunk.extend(b'[')
+        sent = 0
+        first = self.count - len(self)
+        for index in range(first, self.count):
+            if sent >= limit:
+                break
+            slot = index % self.capacity
+            if struct.unpack_from('<I', self.buf, slot * RECORD_SIZE)[0] <= since:
+                continue
+            if sent:
+                chunk.extend(b',')
+            chunk.extend(self._format(slot).encode())
+            sent += 1
+            if len(chunk) >= CHUNK_SIZE:
+                writer.write(chunk)
+                await writer.drain()
+                chunk = bytearray()
+        chunk.extend(b']')
+        writer.write(chunk)
+        await writer.drain()
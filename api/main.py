@@ -1,217 +1,706 @@
-import socket
-import network
+import asyncio
+import gc
 import utime
-import ntptime
-from machine import Pin, PWM
+
+boot_ticks = utime.ticks_ms()  # Taken before anything slow, for the boot metrics
+
 import json
 import config
 import os
+import random
+from machine import I2C, Pin
+from ds3231 import DS3231
+import webserver
+import profiler
+from zones import Zone, ZoneScheduler, MISSED_ONCE, CATCH_UP_SPACING
+from power import PowerManager, AWAKE_WINDOW
+from timesync import TimeService
+from store import StateStore
+from wifi import WifiSupervisor
+from udp import UdpService, MOTOR_STATES, DEFAULT_ZONE
+from history import History, FLAG_CANCELLED, FLAG_ERROR, SOURCE_MANUAL, SOURCE_MOISTURE
+from moisture import MoistureSensor, SAMPLE_INTERVAL as MOISTURE_INTERVAL
+from events import EventBus, EVENT_STREAM_TYPE, STREAM_HEADERS, HEARTBEAT_INTERVAL
+from ring import SLOT_WIDTH
+from core1 import Core1, EV_STARTED, EV_FINISHED, EV_SCHEDULED, ZONE_IDLE, ZONE_QUEUED, ZONE_PUMPING, from_ms
+from metrics import Histogram, RouteMetrics, MetricsWriter, CONTENT_TYPE as METRICS_TYPE
 
 # Constants
 PORT = 8080
 WATERING_DURATION_DEFAULT = 10  # Default 5 seconds
 WATERING_DELAY_DEFAULT = 86400 * 14 # Default 14 day in seconds
+SCHEDULER_INTERVAL = 1  # Seconds between schedule checks
+MOTOR_POLL_INTERVAL = 0.05  # Seconds between motor state checks while running
+COMMIT_DELAY = 5  # Seconds schedule changes are collected before one flash write
+MAX_BATCH = 16  # Operations in one /batch request
+MAX_DURATION = 0xFFFF  # Seconds, the most a history record or UDP status datagram holds
+MAX_DELAY = 365  # Days, keeps the next watering well inside 32 bits everywhere it is stored
+MAX_ZONE_ID = 254  # Zone ids are one byte in the store, history and UDP, and 255 is UDP's default zone
+BATCH_OPS = ('update_watering', 'start_motor', 'stop_motor', 'info')
+LOW_POWER_MODE = getattr(config, 'low_power', None)  # None, 'light' or 'deep'
+MISSED_WATERING = getattr(config, 'missed_watering', MISSED_ONCE)  # 'once', 'skip' or 'all'
+DUAL_CORE = getattr(config, 'dual_core', False)  # Scheduler and motors on the second core
+if DUAL_CORE and LOW_POWER_MODE:
+    print("dual_core is ignored with low_power, sleeping needs both cores idle")
+    DUAL_CORE = False
 
-# Motor control setup with L293D
+# DS3231 real-time clock on I2C0
+sdaPIN = 0
+sclPIN = 1
+
+# Motor control setup with L293D, used when config.py defines no zones
 pwmPIN = 16
 dir1Pin = 14
 dir2Pin = 15
 
-# Initialize motor control GPIO
-speed_gp = PWM(Pin(pwmPIN))
-dir1_gp = Pin(dir1Pin, Pin.OUT)
-dir2_gp = Pin(dir2Pin, Pin.OUT)
-speed_gp.freq(50)  # Set PWM frequency to 50Hz
+def build_zones():
+    # config.zones example: [{"id": 1, "pins": (16, 14, 15), "duration": 10, "delay": 14, "supply": 0, "missed": "all"}]
+    zone_config = getattr(config, 'zones', None) or [{"id": 0, "pins": (pwmPIN, dir1Pin, dir2Pin)}]
+    for z in zone_config:
+        zone_id = z["id"]
+        if not isinstance(zone_id, int) or isinstance(zone_id, bool) or not 0 <= zone_id <= MAX_ZONE_ID:
+            raise ValueError(f"config.zones: zone id {zone_id!r} must be an integer from 0 to {MAX_ZONE_ID}")
+    return [
+        Zone(
+            z["id"],
+            tuple(z["pins"]),
+            z.get("duration", WATERING_DURATION_DEFAULT),
+            int(z.get("delay", WATERING_DELAY_DEFAULT / 86400) * 86400),
+            z.get("supply", 0),
+            z.get("missed", MISSED_WATERING),
+            z.get("catch_up_spacing", CATCH_UP_SPACING)
+        )
+        for z in zone_config
+    ]
+
+def build_sensors():
+    # Zones can add "moisture": {"adc": 26, "power": 22, "dry": 50000, "wet": 20000, "low": 30, "high": 45}
+    sensors = {}
+    for z in getattr(config, 'zones', None) or ():
+        m = z.get("moisture")
+        if m:
+            sensors[z["id"]] = MoistureSensor(
+                m["adc"], m.get("power"),
+                **{key: m[key] for key in ("dry", "wet", "low", "high") if key in m}
+            )
+    return sensors
+
+def record_watering(zone_id, started_at, requested, forward_ms, source, flags):
+    counters = motor_metrics[zone_id]
+    counters[0] += 1
+    counters[1] += forward_ms
+    history.add(started_at, zone_id, requested, (forward_ms + 500) // 1000, source, flags)
+
+def on_zone_event(event, zone):
+    if event == 'watering_started':
+        motor_wakeup.set()
+    elif event == 'watering_finished':
+        motor = zone.motor
+        flags = (FLAG_CANCELLED if motor.cancelled else 0) | (FLAG_ERROR if motor.error else 0)
+        record_watering(zone.id, motor.started_at, motor.duration, motor.forward_ms, zone.source, flags)
+    events.publish(event, {"zone": zone.id, "duration": zone.duration})
+
+def on_clock_jump(delta):
+    print(f"Clock corrected by {delta} seconds")
+    # Times worked out from an unsynced clock move with it, persisted ones were already right
+    if not floating_zones:
+        return
+    for zone in zone_list:
+        if zone.id in floating_zones:
+            if not reschedule(zone, zone.anchor + delta):
+                print(f"Zone {zone.id}: could not move the schedule, the core 1 queue is full")
+    floating_zones.clear()
+
+def on_wifi_up(ip):
+    global boot_to_network_ms
+    if boot_to_network_ms is None:
+        boot_to_network_ms = utime.ticks_diff(utime.ticks_ms(), boot_ticks)
+    print(f'Listening on http://{ip}:{PORT}')
+
+def udp_status(zone_id):
+    zone = default_zone if zone_id == DEFAULT_ZONE else scheduler.get(zone_id)
+    if zone is None:
+        return None
+    now = utime.time()
+    return (zone.id, MOTOR_STATES.index(zone.motor.state), schedule_version, zone.next_watering,
+            max(0, zone.next_watering - now), zone.interval, int(zone.duration))
+
+def mark_floating(zone):
+    if not time_service.trusted():
+        floating_zones.add(zone.id)
+
+events = EventBus()
+scheduler = ZoneScheduler(on_zone_event)
+core1 = Core1(scheduler) if DUAL_CORE else None  # Takes over the scheduler's listener
+zone_list = build_zones()
+default_zone = zone_list[0]  # The zone behind the single-pump endpoints
+moisture_sensors = build_sensors()  # zone id -> MoistureSensor
+rtc_chip = DS3231(I2C(0, scl=Pin(sclPIN), sda=Pin(sdaPIN), freq=100000))
+power = PowerManager(LOW_POWER_MODE, rtc_chip) if LOW_POWER_MODE else None
+time_service = TimeService(rtc_chip, on_clock_jump)
+floating_zones = set()  # Zones scheduled relative to a clock that wasn't trusted yet
+store = StateStore()
+history = History()
+wifi = WifiSupervisor(config.ssid, config.password, on_wifi_up)
+
+# Metrics, allocated up front so recording a sample only bumps integers
+route_metrics = {}  # path -> RouteMetrics, filled in once every route is registered
+other_metrics = RouteMetrics()  # Requests that matched no route
+loop_lag = Histogram()  # How late the scheduler loop wakes up, in ms
+motor_metrics = {zone.id: [0, 0] for zone in zone_list}  # zone id -> [cycles, forward ms]
 
 # Global variables
-watering_duration = WATERING_DURATION_DEFAULT
-watering_delay = WATERING_DELAY_DEFAULT
-next_watering_time = None
+schedule_version = 0  # Bumped whenever the schedule changes, used as the ETag
+boot_id = random.getrandbits(16)  # Keeps ETags from one boot from matching the next
+watering_info_cache = None  # (etag header, encoded body up to time_remaining)
+motor_wakeup = asyncio.Event()
+boot_to_first_tick_ms = None  # How long after boot the scheduler first ran
+boot_to_network_ms = None
+udp = UdpService(boot_id, boot_ticks, getattr(config, 'name', ''), len(zone_list), udp_status)
 
-def save_watering_time(timestamp):
-    with open('watering_time.txt', 'w') as f:
-        f.write(str(timestamp))
+def save_zone_state():
+    # Only changed zones are queued, persist_task writes them out in one go
+    for zone in zone_list:
+        store.put(zone.id, zone.anchor, zone.interval, zone.duration)
 
-def load_watering_time():
+def flush_zone_state():
+    # A failed write leaves the changes pending, the next flush tries again
+    sample = profiler.start()
     try:
-        with open('watering_time.txt', 'r') as f:
-            return int(f.read().strip())
-    except OSError:
-        return None  # File doesn't exist yet
+        store.flush()
+    except Exception as e:
+        print(f"Could not save zone state: {e}")
+    profiler.stop(profiler.FLASH, sample)
 
-def sync_time():
+def load_zone_state():
+    state = store.load()
+    if state is not None:
+        return state
+    # First boot with the state store, pick up the time from watering_time.txt
     try:
-        ntptime.settime()
-        print("Time synced with NTP server")
-    except:
-        print("Could not sync with NTP server")
-
-def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(config.ssid, config.password)
-    max_wait = 10
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print('Waiting for connection...')
-        utime.sleep(1)
-    if wlan.status() != 3:
-        raise RuntimeError('Network connection failed')
-    else:
-        print('Connected')
-        status = wlan.ifconfig()
-        print('Device IP:', status[0])
-    return status[0]
+        with open('watering_time.txt', 'r') as f:
+            return {default_zone.id: (int(f.read().strip()), None, None)}
+    except (OSError, ValueError):
+        return {}  # File doesn't exist yet
 
-def run_motor(duration, reverse=False):
-    print("Attempting to run motor")
-    try:
-        if reverse:
-            dir1_gp.value(0)
-            dir2_gp.value(1)
-        else:
-            dir1_gp.value(1)
-            dir2_gp.value(0)
-    
-        speed_gp.duty_u16(65535)  # Full speed
-        print("Motor should be running now")
-        utime.sleep(duration)
-    
-        # Stop motor
-        speed_gp.duty_u16(0)
-        dir1_gp.value(0)
-        dir2_gp.value(0)
-        print("Motor should have stopped")
-    except Exception as e:
-        print(f"Error running motor: {e}")
-    
-    return f'Motor ran {"in reverse " if reverse else ""}for {duration} seconds'
+# With dual_core the scheduler belongs to core 1: these send it commands and
+# answer from the zone states it published on its last loop, which can be a
+# command or IDLE_MS behind
+
+def run_zone(zone, source=SOURCE_MANUAL):
+    if core1 is not None:
+        return core1.run(zone, source)
+    return scheduler.run(zone, source)
+
+def reschedule(zone, next_watering, interval=None, duration=None, save=True):
+    if core1 is not None:
+        # Core 1 confirms with EV_SCHEDULED, event_task bumps the version and saves then
+        return core1.schedule(zone, next_watering, interval, duration)
+    if interval is not None:
+        zone.interval = interval
+    if duration is not None:
+        zone.duration = duration
+    scheduler.schedule(zone, next_watering)
+    bump_schedule_version(zone)
+    if save:
+        save_zone_state()
+    return True
 
-def get_time_remaining():
+def start_motor(zone):
+    if core1 is None:
+        if not scheduler.run(zone):
+            return "Motor is already running"
+        if scheduler.active.get(zone.supply) is not zone:
+            return "Waiting for the pump"
+        return f'Motor running for {zone.duration} seconds'
+    if core1.zone_state(zone) != ZONE_IDLE:
+        return "Motor is already running"
+    if not core1.run(zone):
+        raise webserver.HTTPError(503, "Motor core is busy")
+    if core1.supply_busy(zone):
+        return "Waiting for the pump"
+    return f'Motor running for {zone.duration} seconds'
+
+def stop_motor(zone):
+    if core1 is None:
+        if not scheduler.stop(zone):
+            return "Motor is not running"
+        return "Motor stopped"
+    if core1.zone_state(zone) not in (ZONE_QUEUED, ZONE_PUMPING):
+        return "Motor is not running"
+    if not core1.stop(zone):
+        raise webserver.HTTPError(503, "Motor core is busy")
+    return "Motor stopped"
+
+def get_time_remaining(zone=default_zone):
     current_time = utime.time()
-    remaining = next_watering_time - current_time
+    remaining = zone.next_watering - current_time
     return max(0, remaining)  # Ensure we don't return negative values
 
-def update_watering_schedule(duration, delay):
-    global watering_duration, watering_delay, next_watering_time
+def bump_schedule_version(zone):
+    global schedule_version, watering_info_cache
+    schedule_version += 1
+    watering_info_cache = None
+    if events.subscribers:
+        info = zone.info(utime.time())
+        info["zone"] = zone.id  # Named like the watering events' field
+        info["version"] = schedule_version
+        events.publish('schedule_updated', info)
+
+def current_etag():
+    # Weak, the countdown in the body changes while the schedule behind it doesn't
+    return f'W/"{boot_id:x}-{schedule_version}"'
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def check_schedule(duration, delay):
+    # Written so NaN fails every comparison and infinity fails the upper bound
+    if not is_number(duration) or not 0 < duration <= MAX_DURATION:
+        raise webserver.HTTPError(400, f'duration must be a number of seconds above 0 and up to {MAX_DURATION}')
+    if not is_number(delay) or not 1 <= delay * 86400 <= MAX_DELAY * 86400:
+        raise webserver.HTTPError(400, f'delay must be a number of days from 1 second up to {MAX_DELAY}')
+
+def update_watering_schedule(duration, delay, zone=default_zone, save=True):
     current_time = utime.time()
     
-    watering_duration = duration
-    watering_delay = int(delay * 86400)  # Convert days to seconds
-    next_watering_time = current_time + watering_delay
-    
-    save_watering_time(next_watering_time)
+    interval = int(delay * 86400)  # Convert days to seconds
+    next_watering = current_time + interval
+    mark_floating(zone)
+    if not reschedule(zone, next_watering, interval, duration, save):
+        raise webserver.HTTPError(503, "Motor core is busy")
     
-    print(f"Current UTC: {current_time}, Next watering UTC: {next_watering_time}, Delay: {watering_delay}")
+    print(f"Zone {zone.id}: Current UTC: {current_time}, Next watering UTC: {next_watering}, Delay: {interval}")
     
     return {
-        "duration": watering_duration,
-        "delay": watering_delay / 86400,  # Convert back to days for display
+        "zone": zone.id,
+        "duration": duration,
+        "delay": interval / 86400,  # Convert back to days for display
         "current_time": current_time,
-        "next_watering": next_watering_time,
-        "time_remaining": get_time_remaining()
+        "next_watering": next_watering,
+        "time_remaining": interval
     }
 
-def handle_request(request):
-    global watering_duration, watering_delay
-    
-    if isinstance(request, bytes):
-        request = request.decode('utf-8')
-
-    headers = (
-        "HTTP/1.0 200 OK\r\n"
-        "Content-type: application/json\r\n"
-        "Access-Control-Allow-Origin: *\r\n"
-        "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
-        "Access-Control-Allow-Headers: Content-Type\r\n"
-        "\r\n"
-    )
-
-    if request.startswith('OPTIONS'):
-        return headers.encode('utf-8')
-
-    response_body = ""
-    if 'POST /update_watering' in request:
+def zone_from_request(request):
+    try:
+        zone = scheduler.get(int(request.query.get('id', '')))
+    except ValueError:
+        raise webserver.HTTPError(400, 'Invalid zone id')
+    if zone is None:
+        raise webserver.HTTPError(404, 'Unknown zone')
+    return zone
+
+app = webserver.Router()
+
+def update_watering_from_request(request, zone):
+    try:
+        data = request.json()
+    except ValueError:
+        raise webserver.HTTPError(400, 'Invalid JSON')
+    if not isinstance(data, dict):
+        raise webserver.HTTPError(400, 'Expected a JSON object')
+    duration = data.get('duration', WATERING_DURATION_DEFAULT)
+    delay = data.get('delay', WATERING_DELAY_DEFAULT / 86400)
+    check_schedule(duration, delay)
+    return update_watering_schedule(duration, delay, zone)
+
+@app.route('POST', '/update_watering')
+def handle_update_watering(request):
+    return update_watering_from_request(request, default_zone)
+
+@app.route('GET', '/watering_info')
+def handle_watering_info(request):
+    global watering_info_cache
+    etag = current_etag()
+    if watering_info_cache is None:
+        # Everything but time_remaining only changes with the schedule version
+        prefix = json.dumps({
+            "zone": default_zone.id,
+            "duration": default_zone.duration,
+            "delay": default_zone.interval / 86400,
+            "next_watering": default_zone.next_watering,
+            "version": schedule_version
+        })[:-1] + ', "time_remaining": '
+        watering_info_cache = (f"ETag: {etag}\r\nCache-Control: no-cache\r\n".encode(), prefix.encode())
+    etag_header, prefix = watering_info_cache
+    if request.headers.get('if-none-match') == etag:
+        return webserver.Response(304, content_type=b"", headers=etag_header)
+    return webserver.Response(200, (prefix, get_time_remaining(), b"}"), headers=etag_header)
+
+@app.route('GET', '/events')
+def handle_events(request):
+    if events.full():
+        raise webserver.HTTPError(503, "Too many event subscribers")
+    return webserver.Response(200, content_type=EVENT_STREAM_TYPE, headers=STREAM_HEADERS, stream=events.stream)
+
+@app.route('HEAD', '/health')
+def handle_health(request):
+    return webserver.Response(204, content_type=b"")
+
+@app.route('POST', '/start_motor')
+def handle_start_motor(request):
+    return {"status": start_motor(default_zone)}
+
+@app.route('POST', '/stop_motor')
+def handle_stop_motor(request):
+    return {"status": stop_motor(default_zone)}
+
+@app.route('GET', '/motor_status')
+def handle_motor_status(request):
+    return default_zone.motor.status()
+
+@app.route('GET', '/zones')
+def handle_zones(request):
+    current_time = utime.time()
+    return {"zones": [zone.info(current_time) for zone in zone_list]}
+
+@app.route('GET', '/zones/info')
+def handle_zone_info(request):
+    return zone_from_request(request).info(utime.time())
+
+@app.route('POST', '/zones/update')
+def handle_zone_update(request):
+    return update_watering_from_request(request, zone_from_request(request))
+
+@app.route('POST', '/zones/start')
+def handle_zone_start(request):
+    return {"status": start_motor(zone_from_request(request))}
+
+@app.route('POST', '/zones/stop')
+def handle_zone_stop(request):
+    return {"status": stop_motor(zone_from_request(request))}
+
+def batch_zone(i, op):
+    if not isinstance(op, dict) or op.get('op') not in BATCH_OPS:
+        raise webserver.HTTPError(400, f'Operation {i}: op must be one of {", ".join(BATCH_OPS)}')
+    zone = default_zone
+    if 'zone' in op:
+        zone_id = op['zone']
+        zone = scheduler.get(zone_id) if isinstance(zone_id, int) and not isinstance(zone_id, bool) else None
+        if zone is None:
+            raise webserver.HTTPError(404, f'Operation {i}: unknown zone')
+    if op['op'] == 'update_watering':
         try:
-            body_start = request.index('\r\n\r\n') + 4
-            body = request[body_start:]
-            data = json.loads(body)
-            duration = data.get('duration', WATERING_DURATION_DEFAULT)
-            delay = data.get('delay', WATERING_DELAY_DEFAULT / 86400)
-            result = update_watering_schedule(duration, delay)
-            response_body = json.dumps(result)
-        except ValueError:
-            response_body = json.dumps({'error': 'Invalid JSON'})
-    elif 'GET /watering_info' in request:
-        response_body = json.dumps({
-            "duration": watering_duration,
-            "delay": watering_delay / 86400,
-            "time_remaining": get_time_remaining()
-        })
-    elif 'POST /start_motor' in request:
-        response_body = json.dumps({"status": run_motor(watering_duration)})
-        run_motor(10, reverse=True)
-    else:
-        response_body = json.dumps({'error': 'Invalid endpoint'})
-    
-    return (headers + response_body).encode('utf-8')
+            check_schedule(op.get('duration', WATERING_DURATION_DEFAULT), op.get('delay', WATERING_DELAY_DEFAULT / 86400))
+        except webserver.HTTPError as e:
+            raise webserver.HTTPError(400, f'Operation {i}: {e.message}')
+    return zone
+
+@app.route('POST', '/batch')
+def handle_batch(request):
+    # {"ops": [{"op": "update_watering", "zone": 1, "duration": 5, "delay": 2}, {"op": "start_motor"}, ...]}
+    try:
+        data = request.json()
+    except ValueError:
+        raise webserver.HTTPError(400, 'Invalid JSON')
+    ops = data.get('ops') if isinstance(data, dict) else None
+    if not isinstance(ops, list) or not 0 < len(ops) <= MAX_BATCH:
+        raise webserver.HTTPError(400, f'ops must be a list of 1 to {MAX_BATCH} operations')
+    # Every operation is checked before any runs, so a bad batch changes nothing
+    zones = [batch_zone(i, op) for i, op in enumerate(ops)]
+    if core1 is not None and sum(op['op'] != 'info' for op in ops) > core1.commands.free():
+        raise webserver.HTTPError(503, "Motor core is busy")
+    results = []
+    updated = {}  # zone id -> the schedule an earlier operation in this batch set
+    for op, zone in zip(ops, zones):
+        name = op['op']
+        if name == 'update_watering':
+            result = update_watering_schedule(op.get('duration', WATERING_DURATION_DEFAULT),
+                                              op.get('delay', WATERING_DELAY_DEFAULT / 86400), zone, False)
+            updated[zone.id] = result
+        elif name == 'info':
+            result = zone.info(utime.time())
+            # With dual_core the update is still on its way to core 1, report what it will apply.
+            # The motor state is as of core 1's last loop either way.
+            update = updated.get(zone.id)
+            if update is not None:
+                for key in ('duration', 'delay', 'next_watering', 'time_remaining'):
+                    result[key] = update[key]
+        else:
+            status = start_motor(zone) if name == 'start_motor' else stop_motor(zone)
+            result = {"zone": zone.id, "status": status}
+        result["op"] = name
+        results.append(result)
+    save_zone_state()  # One store update for the whole batch, persist_task writes it out
+    return {"results": results}
+
+@app.route('GET', '/moisture')
+def handle_moisture(request):
+    sensors = []
+    for zone_id, sensor in moisture_sensors.items():
+        status = sensor.status()
+        status["zone"] = zone_id
+        sensors.append(status)
+    return {"sensors": sensors}
+
+@app.route('GET', '/time')
+def handle_time(request):
+    return time_service.status()
+
+@app.route('GET', '/history')
+def handle_history(request):
+    try:
+        since = int(request.query.get('since', 0))
+        limit = int(request.query.get('limit', len(history)))
+    except ValueError:
+        raise webserver.HTTPError(400, 'Invalid since or limit')
+    return webserver.Response(200, stream=lambda writer: history.stream(writer, since, limit))
+
+@app.route('GET', '/network')
+def handle_network(request):
+    status = wifi.status()
+    status["udp"] = udp.stats()
+    return status
+
+@app.route('GET', '/boot')
+def handle_boot(request):
+    return {
+        "boot_to_first_tick_ms": boot_to_first_tick_ms,
+        "boot_to_network_ms": boot_to_network_ms,
+        "uptime_ms": utime.ticks_diff(utime.ticks_ms(), boot_ticks)
+    }
+
+@app.route('GET', '/cores')
+def handle_cores(request):
+    if core1 is None:
+        return {"dual_core": False}
+    status = core1.status()
+    status["dual_core"] = True
+    return status
+
+@app.route('GET', '/memory')
+def handle_memory(request):
+    if request.query.get('collect'):
+        gc.collect()
+    return webserver.memory_stats()
+
+@app.route('GET', '/storage')
+def handle_storage(request):
+    return store.stats()
+
+@app.route('GET', '/power')
+def handle_power(request):
+    if power is None:
+        return {"mode": None}
+    return power.stats()
+
+def on_request(path, status, ms):
+    route_metrics.get(path, other_metrics).observe(status, ms)
+
+async def write_metrics(writer):
+    w = MetricsWriter(writer)
+    await w.header('pico_http_requests_total', 'counter', 'Responses sent, by route')
+    for path, m in route_metrics.items():
+        await w.sample('pico_http_requests_total', m.latency.count, f'route="{path}"')
+    await w.sample('pico_http_requests_total', other_metrics.latency.count, 'route="other"')
+    await w.header('pico_http_errors_total', 'counter', 'Responses with a 4xx or 5xx status, by route')
+    for path, m in route_metrics.items():
+        await w.sample('pico_http_errors_total', m.errors, f'route="{path}"')
+    await w.sample('pico_http_errors_total', other_metrics.errors, 'route="other"')
+    await w.header('pico_http_request_duration_ms', 'histogram', 'Time from a complete request to the response being sent')
+    for path, m in route_metrics.items():
+        if m.latency.count:
+            await w.histogram('pico_http_request_duration_ms', m.latency, f'route="{path}"')
+    await w.header('pico_loop_lag_ms', 'histogram', 'How late the scheduler loop woke up')
+    await w.histogram('pico_loop_lag_ms', loop_lag)
+    await w.header('pico_motor_cycles_total', 'counter', 'Completed watering cycles, by zone')
+    for zone_id, counters in motor_metrics.items():
+        await w.sample('pico_motor_cycles_total', counters[0], f'zone="{zone_id}"')
+    await w.header('pico_motor_on_ms_total', 'counter', 'Time the pump ran forward, by zone')
+    for zone_id, counters in motor_metrics.items():
+        await w.sample('pico_motor_on_ms_total', counters[1], f'zone="{zone_id}"')
+    await w.metric('pico_wifi_connected', 'gauge', 'Whether the Wi-Fi link is up', int(wifi.isconnected()))
+    await w.metric('pico_wifi_connects_total', 'counter', 'Times the Wi-Fi link came up', wifi.connects)
+    await w.metric('pico_wifi_drops_total', 'counter', 'Times an established Wi-Fi link was lost', wifi.drops)
+    sync_age = utime.time() - time_service.last_sync if time_service.last_sync is not None else None
+    await w.metric('pico_ntp_sync_age_seconds', 'gauge', 'Seconds since the last NTP sync', sync_age)
+    await w.metric('pico_ntp_failures', 'gauge', 'NTP syncs failed in a row', time_service.failures)
+    memory = webserver.memory_stats()
+    await w.metric('pico_heap_free_bytes', 'gauge', 'Free heap', memory["mem_free"])
+    await w.metric('pico_heap_allocated_bytes', 'gauge', 'Allocated heap', memory["mem_alloc"])
+    await w.metric('pico_boot_to_first_tick_ms', 'gauge', 'Time from boot to the first scheduler run', boot_to_first_tick_ms)
+    await w.close()
+
+@app.route('GET', '/profile')
+def handle_profile(request):
+    return profiler.report()
+
+@app.route('POST', '/profile')
+def handle_profile_toggle(request):
+    # ?enable=1 starts a fresh profile, ?enable=0 stops it and keeps the results
+    enable = request.query.get('enable')
+    if enable not in ('0', '1'):
+        raise webserver.HTTPError(400, 'enable must be 0 or 1')
+    profiler.enable(enable == '1')
+    return {"enabled": profiler.enabled}
+
+@app.route('GET', '/metrics')
+def handle_metrics(request):
+    return webserver.Response(200, content_type=METRICS_TYPE, stream=write_metrics)
+
+for path in app.routes:
+    route_metrics[path] = RouteMetrics()
+app.observer = on_request
 
 def check_watering():
-    global next_watering_time
-    current_time = utime.time()
-    if current_time >= next_watering_time:
-        run_motor(watering_duration)
-        run_motor(10, reverse=True)
-        next_watering_time = current_time + watering_delay
-        save_watering_time(next_watering_time)
-
-def main():
-    global next_watering_time
-    
-    ip = connect_wifi()
+    global boot_to_first_tick_ms
+    if boot_to_first_tick_ms is None:
+        boot_to_first_tick_ms = utime.ticks_diff(utime.ticks_ms(), boot_ticks)
+        print(f"Scheduler running {boot_to_first_tick_ms} ms after boot")
+    due_zones = scheduler.tick(utime.time())
+    if due_zones:
+        for zone in due_zones:
+            mark_floating(zone)
+            bump_schedule_version(zone)
+        save_zone_state()
+
+async def motor_task():
+    while True:
+        if not scheduler.busy():
+            motor_wakeup.clear()
+            await motor_wakeup.wait()
+        sample = profiler.start()
+        scheduler.poll()
+        profiler.stop(profiler.MOTOR, sample)
+        await asyncio.sleep(MOTOR_POLL_INTERVAL)
+
+async def heartbeat_task():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        if events.subscribers:
+            events.publish('heartbeat', {"time_remaining": get_time_remaining(), "motor": default_zone.motor.state})
+
+async def scheduler_task():
+    while True:
+        started = utime.ticks_ms()
+        sample = profiler.start()
+        check_watering()
+        profiler.stop(profiler.SCHEDULER, sample)
+        await asyncio.sleep(SCHEDULER_INTERVAL)
+        loop_lag.observe(max(0, utime.ticks_diff(utime.ticks_ms(), started) - SCHEDULER_INTERVAL * 1000))
+
+async def moisture_task():
+    while True:
+        for zone_id, sensor in moisture_sensors.items():
+            try:
+                await sensor.sample()
+            except OSError as e:
+                print(f"Zone {zone_id}: could not read moisture sensor: {e}")
+                continue
+            if sensor.check(utime.time()):
+                print(f"Zone {zone_id}: soil at {sensor.percent()}%, watering")
+                if not run_zone(scheduler.get(zone_id), SOURCE_MOISTURE):
+                    # Already watering, or core 1's queue is full: try again on the next sample
+                    sensor.rearm()
+        await asyncio.sleep(MOISTURE_INTERVAL)
+
+def handle_core1_event(event):
+    # Core 1's side of the watering and schedule callbacks
+    kind = event[0]
+    zone = scheduler.get(event[1])
+    if kind == EV_STARTED:
+        events.publish('watering_started', {"zone": zone.id, "duration": from_ms(event[2])})
+    elif kind == EV_FINISHED:
+        requested = from_ms(event[3])
+        record_watering(zone.id, event[2], requested, event[4], event[5] >> 8, event[5] & 0xFF)
+        events.publish('watering_finished', {"zone": zone.id, "duration": requested})
+    elif kind == EV_SCHEDULED:
+        mark_floating(zone)
+        bump_schedule_version(zone)
+        save_zone_state()
+
+async def event_task():
+    event = [0] * SLOT_WIDTH
+    while True:
+        while core1.events.get(event):
+            try:
+                handle_core1_event(event)
+            except Exception as e:
+                print(f"Error handling core 1 event {event[0]}: {e}")
+        await asyncio.sleep(MOTOR_POLL_INTERVAL)
+
+async def persist_task():
+    while True:
+        await asyncio.sleep(COMMIT_DELAY)
+        if store.dirty():
+            flush_zone_state()
+
+async def power_task():
+    while True:
+        await asyncio.sleep(AWAKE_WINDOW)
+        next_due = scheduler.next_due()
+        if scheduler.busy() or next_due is None or next_due - utime.time() <= AWAKE_WINDOW:
+            continue
+        flush_zone_state()
+        history.flush()
+        wifi.suspend()
+        power.sleep_until(next_due)
+        # Back from lightsleep: the scheduler task picks up the due watering
+        wifi.resume()
+
+async def time_task():
+    await wifi.connected.wait()
+    await time_service.run()
+
+async def server_task():
+    # The server attaches once the link is first up and stays bound across reconnects
+    await wifi.connected.wait()
+    await webserver.start_server(app, '0.0.0.0', PORT)
+
+async def udp_task():
+    await wifi.connected.wait()
+    await udp.run(PORT)
+
+async def main():
+    global boot_to_first_tick_ms
+    # Check before anything else so a DS3231 wake goes straight to watering
+    woke_by_alarm = power is not None and power.check_alarm()
+    if woke_by_alarm:
+        print("Woken by DS3231 alarm")
     
-    sync_time()
+    time_service.seed_from_rtc()
     
-    next_watering_time = load_watering_time()
+    history.load()
+    saved_state = load_zone_state()
     current_time = utime.time()
-    if next_watering_time is None or next_watering_time <= current_time:
-        next_watering_time = current_time + watering_delay
-        save_watering_time(next_watering_time)
+    for zone in zone_list:
+        next_watering_time, interval, duration = saved_state.get(zone.id, (None, None, None))
+        if interval:
+            zone.interval = interval
+        if duration:
+            zone.duration = duration
+        # An overdue time is kept, the scheduler applies the zone's missed policy to it
+        if next_watering_time is None:
+            next_watering_time = current_time + zone.interval
+            mark_floating(zone)
+        scheduler.add(zone, next_watering_time)
+    save_zone_state()
+    flush_zone_state()
     
-    print(f"Current time after sync: {current_time}")
-    print(f"Next watering time: {next_watering_time}")
-    print(f"Time remaining: {get_time_remaining()}")
+    print(f"Current time: {current_time} ({time_service.source or 'not synced'})")
+    for zone in zone_list:
+        print(f"Zone {zone.id}: next watering time {zone.next_watering}, time remaining {get_time_remaining(zone)}")
     
-    addr = socket.getaddrinfo('0.0.0.0', PORT)[0][-1]
-    s = socket.socket()
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind(addr)
-    s.listen(1)
-    print(f'Listening on http://{ip}:{PORT}')
+    if core1 is not None:
+        core1.start()
+        boot_to_first_tick_ms = utime.ticks_diff(utime.ticks_ms(), boot_ticks)
+        asyncio.create_task(event_task())
+    else:
+        asyncio.create_task(scheduler_task())
+        asyncio.create_task(motor_task())
+    asyncio.create_task(wifi.run())
+    asyncio.create_task(server_task())
+    asyncio.create_task(time_task())
+    asyncio.create_task(udp_task())
+    asyncio.create_task(heartbeat_task())
+    asyncio.create_task(persist_task())
+    if moisture_sensors:
+        asyncio.create_task(moisture_task())
+    if power is not None:
+        asyncio.create_task(power_task())
     
     while True:
-        check_watering()
-        
-        s.setblocking(False)
-        try:
-            cl, addr = s.accept()
-            print(f'Client connected from {addr}')
-            cl.setblocking(False)
-            request = b""
-            while b"\r\n\r\n" not in request:
-                try:
-                    request += cl.recv(1024)
-                except OSError:
-                    pass
-            response = handle_request(request)
-            cl.send(response)
-            cl.close()
-        except OSError:
-            pass
-        
-        utime.sleep(1)
+        await asyncio.sleep(3600)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
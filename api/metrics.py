@@ -0,0 +1,83 @@
+# metrics.py
+
+import array
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+CHUNK_SIZE = 256  # Bytes of text sent per write when a scraper reads them
+CONTENT_TYPE = b"Content-type: text/plain; version=0.0.4\r\n"
+
+class Histogram:
+    """Fixed-bucket histogram of integer samples.
+
+    The bucket counts live in a preallocated array, so observe() only
+    compares and increments integers.
+    """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = array.array('L', [0] * (len(buckets) + 1))  # The last one is +Inf
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value):
+        buckets = self.buckets
+        i = 0
+        n = len(buckets)
+        while i < n and value > buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+class RouteMetrics:
+    def __init__(self):
+        self.errors = 0  # Responses with a 4xx or 5xx status
+        self.latency = Histogram()
+
+    def observe(self, status, ms):
+        if status >= 400:
+            self.errors += 1
+        self.latency.observe(ms)
+
+class MetricsWriter:
+    """Writes the Prometheus text format to a stream in small chunks."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.chunk = bytearray()
+
+    async def _line(self, line):
+        self.chunk.extend(line)
+        self.chunk.extend(b"\n")
+        if len(self.chunk) >= CHUNK_SIZE:
+            self.writer.write(self.chunk)
+            await self.writer.drain()
+            self.chunk = bytearray()
+
+    async def header(self, name, kind, help_text):
+        await self._line(f"# HELP {name} {help_text}".encode())
+        await self._line(f"# TYPE {name} {kind}".encode())
+
+    async def sample(self, name, value, labels=""):
+        if value is None:
+            return
+        await self._line(f"{name}{{{labels}}} {value}".encode() if labels else f"{name} {value}".encode())
+
+    async def metric(self, name, kind, help_text, value, labels=""):
+        await self.header(name, kind, help_text)
+        await self.sample(name, value, labels)
+
+    async def histogram(self, name, histogram, labels=""):
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            await self.sample(name + "_bucket", cumulative, f'{labels}{sep}le="{bound}"')
+        await self.sample(name + "_bucket", histogram.count, f'{labels}{sep}le="+Inf"')
+        await self.sample(name + "_sum", histogram.total, labels)
+        await self.sample(name + "_count", histogram.count, labels)
+
+    async def close(self):
+        if self.chunk:
+            self.writer.write(self.chunk)
+            await self.writer.drain()
@@ -0,0 +1,111 @@
+# moisture.py
+
+import array
+import asyncio
+import utime
+from machine import ADC, Pin
+
+BURST = 9  # ADC reads per sample, the median of them is kept
+SETTLE_MS = 50  # Time the sensor needs after power-up before it reads true
+EMA_DIVISOR = 4  # Each sample moves the filtered value a quarter of the way
+SAMPLE_INTERVAL = 60  # Seconds between samples
+DRY_DEFAULT = 50000  # Raw reading in dry air
+WET_DEFAULT = 20000  # Raw reading in water
+LOW_DEFAULT = 30  # Water when moisture falls to this percentage
+HIGH_DEFAULT = 45  # and don't water again for moisture until it is back above this
+LOCKOUT = 1800  # Seconds after a moisture watering before another one, so it can soak in
+
+class MoistureSensor:
+    """Capacitive soil-moisture sensor on an ADC pin, powered only while sampling.
+
+    Each sample is a burst of BURST reads into a preallocated array. The
+    median of the burst is taken in place, then smoothed with an integer
+    EMA. check() turns the filtered reading into watering decisions with
+    hysteresis: it fires once at or below low and re-arms only above high.
+    """
+
+    def __init__(self, adc_pin, power_pin=None, dry=DRY_DEFAULT, wet=WET_DEFAULT,
+                 low=LOW_DEFAULT, high=HIGH_DEFAULT):
+        self.adc = ADC(Pin(adc_pin))
+        self.power = Pin(power_pin, Pin.OUT, value=0) if power_pin is not None else None
+        self.dry = dry
+        self.wet = wet
+        self.low = low
+        self.high = high
+        self.burst = array.array('H', [0] * BURST)
+        self.raw = None  # Median of the last burst
+        self.filtered = None  # EMA of the medians
+        self.armed = True
+        self.last_sample = None  # utime.time() of the last sample
+        self.last_trigger = None  # utime.time() of the last moisture watering
+        self.triggers = 0
+
+    async def sample(self):
+        if self.power:
+            self.power.value(1)
+            await asyncio.sleep(SETTLE_MS / 1000)
+        burst = self.burst
+        try:
+            for i in range(BURST):
+                burst[i] = self.adc.read_u16()
+        finally:
+            if self.power:
+                self.power.value(0)
+        # Insertion sort in place, the burst is only BURST values long
+        for i in range(1, BURST):
+            value = burst[i]
+            j = i - 1
+            while j >= 0 and burst[j] > value:
+                burst[j + 1] = burst[j]
+                j -= 1
+            burst[j + 1] = value
+        self.raw = burst[BURST // 2]
+        if self.filtered is None:
+            self.filtered = self.raw
+        else:
+            self.filtered += (self.raw - self.filtered) // EMA_DIVISOR
+        self.last_sample = utime.time()
+        return self.filtered
+
+    def percent(self):
+        if self.filtered is None:
+            return None
+        span = self.dry - self.wet
+        return max(0, min(100, (self.dry - self.filtered) * 100 // span))
+
+    def check(self, now):
+        """Returns True if the soil is dry enough to water now."""
+        moisture = self.percent()
+        if moisture is None:
+            return False
+        if moisture > self.high:
+            self.armed = True
+            return False
+        if not self.armed or moisture > self.low:
+            return False
+        if self.last_trigger is not None and now - self.last_trigger < LOCKOUT:
+            return False
+        self.armed = False
+        self.last_trigger = now
+        self.triggers += 1
+        return True
+
+    def rearm(self):
+        """Take back the last trigger, for when its watering couldn't start."""
+        if not self.armed:
+            self.armed = True
+            self.last_trigger = None  # check() only fires once any earlier lockout is over
+            self.triggers -= 1
+
+    def status(self):
+        return {
+            "moisture": self.percent(),
+            "raw": self.raw,
+            "filtered": self.filtered,
+            "low": self.low,
+            "high": self.high,
+            "armed": self.armed,
+            "last_sample": self.last_sample,
+            "last_trigger": self.last_trigger,
+            "triggers": self.triggers
+        }
@@ -0,0 +1,114 @@
+# motor.py
+
+from machine import Pin, PWM
+import utime
+
+# Motor states
+IDLE = 'idle'
+FORWARD = 'forward'
+REVERSE = 'reverse'
+COOLDOWN = 'cooldown'
+
+FULL_SPEED = 65535
+REVERSE_DURATION_DEFAULT = 10  # Seconds to run backwards after watering
+COOLDOWN_DEFAULT = 2  # Seconds the motor rests before it can start again
+
+class MotorController:
+    """Runs a watering cycle (forward, reverse, cooldown) on an L293D channel.
+
+    Nothing here blocks: start() and stop() only switch the outputs and set a
+    ticks_ms deadline, and poll() advances the state machine once the
+    deadline has passed. Call poll() regularly from the main loop.
+    """
+
+    def __init__(self, pwm_pin, dir1_pin, dir2_pin,
+                 reverse_duration=REVERSE_DURATION_DEFAULT, cooldown=COOLDOWN_DEFAULT):
+        self.speed = PWM(Pin(pwm_pin))
+        self.dir1 = Pin(dir1_pin, Pin.OUT)
+        self.dir2 = Pin(dir2_pin, Pin.OUT)
+        self.speed.freq(50)  # Set PWM frequency to 50Hz
+        self.reverse_duration = reverse_duration
+        self.cooldown = cooldown
+        self.state = IDLE
+        self.duration = 0
+        self.deadline = 0
+        # Outcome of the current or last cycle, for the watering history
+        self.started_at = None  # utime.time() the cycle started
+        self.forward_ms = 0  # How long the pump actually ran forward
+        self.cancelled = False
+        self.error = False
+        self._forward_start = 0
+        self._drive(0, 0, 0)
+
+    def _drive(self, dir1, dir2, duty):
+        try:
+            self.speed.duty_u16(0)
+            self.dir1.value(dir1)
+            self.dir2.value(dir2)
+            self.speed.duty_u16(duty)
+        except Exception as e:
+            self.error = True
+            print(f"Error running motor: {e}")
+
+    def _enter(self, state, seconds):
+        now = utime.ticks_ms()
+        if self.state == FORWARD:
+            self.forward_ms = utime.ticks_diff(now, self._forward_start)
+        self.state = state
+        self.deadline = utime.ticks_add(now, int(seconds * 1000))
+        if state == FORWARD:
+            self._forward_start = now
+            self._drive(1, 0, FULL_SPEED)
+        elif state == REVERSE:
+            self._drive(0, 1, FULL_SPEED)
+        else:
+            self._drive(0, 0, 0)
+        print(f"Motor {state}")
+
+    def start(self, duration):
+        """Start a watering cycle. Returns False if a cycle is already running."""
+        if self.state != IDLE:
+            return False
+        self.duration = duration
+        self.started_at = utime.time()
+        self.forward_ms = 0
+        self.cancelled = False
+        self.error = False
+        self._enter(FORWARD, duration)
+        return True
+
+    def stop(self):
+        """Cancel the current cycle. Returns False if the motor was idle."""
+        if self.state in (IDLE, COOLDOWN):
+            return False
+        self.cancelled = True
+        self._enter(COOLDOWN, self.cooldown)
+        return True
+
+    def busy(self):
+        return self.state != IDLE
+
+    def remaining(self):
+        if self.state == IDLE:
+            return 0
+        return max(0, utime.ticks_diff(self.deadline, utime.ticks_ms())) / 1000
+
+    def poll(self):
+        """Advance the state machine. Returns the new state if it changed."""
+        if self.state == IDLE or utime.ticks_diff(self.deadline, utime.ticks_ms()) > 0:
+            return None
+        if self.state == FORWARD:
+            self._enter(REVERSE, self.reverse_duration)
+        elif self.state == REVERSE:
+            self._enter(COOLDOWN, self.cooldown)
+        else:
+            self.state = IDLE
+            print("Motor idle")
+        return self.state
+
+    def status(self):
+        return {
+            "state": self.state,
+            "duration": self.duration,
+            "remaining": self.remaining()
+        }
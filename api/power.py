@@ -0,0 +1,99 @@
+# power.py
+
+import machine
+import utime
+
+LIGHT = 'light'
+DEEP = 'deep'
+AWAKE_WINDOW = 60  # Seconds to stay up after waking so the API can be reached
+MAX_SLEEP_MS = 3600 * 1000  # The RP2040 timer can't sleep much past an hour at once, light or deep
+STATS_FILE = 'power_stats.txt'
+
+class PowerManager:
+    """Sleeps between waterings instead of spinning the main loop.
+
+    Before sleeping, Alarm 1 of the DS3231 is set for the next watering.
+    In light mode the Pico lightsleeps in chunks of at most an hour until the
+    watering is due. In deep mode it deepsleeps for at most an hour too, and
+    the DS3231 INT/SQW line (wired to RUN) or the sleep timer resets the
+    board. An alarm wake boots straight back into main() with the alarm flag
+    set, a timer wake boots, finds nothing due and goes back to sleep after
+    the awake window.
+
+    Wakeups and awake time are kept in STATS_FILE, because deepsleep loses RAM.
+    """
+
+    def __init__(self, mode, rtc):
+        self.mode = mode
+        self.rtc = rtc  # ds3231.DS3231
+        self.wakeups = 0
+        self.awake_ms = 0
+        self.since = utime.time()
+        self.awake_since = utime.ticks_ms()
+        self.woke_by_alarm = False
+        self._load_stats()
+
+    def _load_stats(self):
+        try:
+            with open(STATS_FILE, 'r') as f:
+                wakeups, awake_ms, since = f.read().split()
+            self.wakeups, self.awake_ms, self.since = int(wakeups), int(awake_ms), int(since)
+        except (OSError, ValueError):
+            pass  # First boot in low-power mode
+
+    def _save_stats(self):
+        with open(STATS_FILE, 'w') as f:
+            f.write(f"{self.wakeups} {self.awake_ms} {self.since}")
+
+    def check_alarm(self):
+        """Returns True (once) if this boot or wake was caused by the DS3231 alarm."""
+        try:
+            self.woke_by_alarm = self.rtc.alarm_fired()
+            if self.woke_by_alarm:
+                self.rtc.clear_flags()
+        except OSError as e:
+            print(f"Could not read DS3231: {e}")
+            self.woke_by_alarm = False
+        return self.woke_by_alarm
+
+    def _count_wakeup(self):
+        self.wakeups += 1
+        self.awake_since = utime.ticks_ms()
+
+    def sleep_until(self, timestamp):
+        self.awake_ms += utime.ticks_diff(utime.ticks_ms(), self.awake_since)
+        try:
+            self.rtc.clear_flags()
+            self.rtc.set_alarm(timestamp)
+        except OSError as e:
+            print(f"Could not set DS3231 alarm: {e}")
+        self._save_stats()
+
+        seconds = timestamp - utime.time()
+        print(f"Sleeping ({self.mode}) for {seconds} seconds")
+        if self.mode == DEEP:
+            self.wakeups += 1
+            self._save_stats()
+            machine.deepsleep(min(seconds * 1000, MAX_SLEEP_MS))  # Resets the board on wake
+
+        while True:
+            remaining = timestamp - utime.time()
+            if remaining <= 0:
+                break
+            machine.lightsleep(min(remaining * 1000, MAX_SLEEP_MS))
+            self._count_wakeup()
+            if self.check_alarm():
+                break
+        self._save_stats()
+
+    def stats(self):
+        awake_ms = self.awake_ms + utime.ticks_diff(utime.ticks_ms(), self.awake_since)
+        elapsed = max(1, utime.time() - self.since)
+        return {
+            "mode": self.mode,
+            "wakeups": self.wakeups,
+            "wakeups_per_day": self.wakeups * 86400 / elapsed,
+            "awake_seconds": awake_ms // 1000,
+            "awake_ratio": awake_ms / 1000 / elapsed,
+            "since": self.since
+        }
@@ -0,0 +1,92 @@
+# profiler.py
+
+import array
+import utime
+
+# Stages
+READ = 0  # Reading and parsing a request
+DISPATCH = 1  # Running the route handler
+SERIALIZE = 2  # Building the response bytes
+WRITE = 3  # Sending the response
+SCHEDULER = 4  # One check_watering() pass
+FLASH = 5  # State and history writes
+MOTOR = 6  # One motor poll
+STAGE_NAMES = ('read', 'dispatch', 'serialize', 'write', 'scheduler', 'flash', 'motor')
+
+RING_SIZE = 128  # Recent samples kept for the slowest-samples list
+SLOWEST = 10
+
+enabled = False
+
+# Ring of recent samples: stage, ticks_us at the start, duration in us
+_stages = bytearray(RING_SIZE)
+_starts = array.array('L', [0] * RING_SIZE)
+_durations = array.array('L', [0] * RING_SIZE)
+_next = 0
+_samples = 0
+
+# Per-stage totals since the profiler was last enabled
+_counts = array.array('L', [0] * len(STAGE_NAMES))
+_totals = array.array('L', [0] * len(STAGE_NAMES))
+_mins = array.array('L', [0] * len(STAGE_NAMES))
+_maxes = array.array('L', [0] * len(STAGE_NAMES))
+
+def start():
+    """Returns a timestamp for stop(), or None while profiling is off."""
+    return utime.ticks_us() if enabled else None
+
+def stop(stage, started):
+    global _next, _samples
+    if started is None:
+        return
+    duration = utime.ticks_diff(utime.ticks_us(), started)
+    if duration < 0:
+        return
+    i = _next
+    _stages[i] = stage
+    _starts[i] = started
+    _durations[i] = duration
+    _next = (i + 1) % RING_SIZE
+    _samples += 1
+    if _counts[stage] == 0 or duration < _mins[stage]:
+        _mins[stage] = duration
+    if duration > _maxes[stage]:
+        _maxes[stage] = duration
+    _counts[stage] += 1
+    _totals[stage] = (_totals[stage] + duration) & 0xFFFFFFFF
+
+def reset():
+    global _next, _samples
+    _next = 0
+    _samples = 0
+    for i in range(len(STAGE_NAMES)):
+        _counts[i] = _totals[i] = _mins[i] = _maxes[i] = 0
+
+def enable(on=True):
+    global enabled
+    if on and not enabled:
+        reset()
+    enabled = on
+
+def report():
+    stages = {}
+    for i, name in enumerate(STAGE_NAMES):
+        count = _counts[i]
+        if count:
+            stages[name] = {
+                "count": count,
+                "min_us": _mins[i],
+                "mean_us": _totals[i] // count,
+                "max_us": _maxes[i]
+            }
+    recent = min(_samples, RING_SIZE)
+    slots = sorted(range(recent), key=lambda i: _durations[i], reverse=True)[:SLOWEST]
+    return {
+        "enabled": enabled,
+        "samples": _samples,
+        "stages": stages,
+        "slowest": [
+            {"stage": STAGE_NAMES[_stages[i]], "start_us": _starts[i], "duration_us": _durations[i]}
+            for i in slots
+        ]
+    }
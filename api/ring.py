@@ -0,0 +1,60 @@
+# ring.py
+
+import array
+
+SLOT_WIDTH = 6  # kind plus up to five integer arguments
+
+class Ring:
+    """Lock-free single-producer, single-consumer queue of integer messages.
+
+    One core only calls put() and the other only calls get(). The producer
+    fills a slot before it publishes the new head, and the consumer reads
+    the slot before it publishes the new tail. Each index is written by one
+    side only, so no lock is needed. Messages are fixed-width rows of a
+    preallocated array, and queueing one doesn't allocate.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity + 1  # One slot stays empty to tell full from empty
+        self.slots = array.array('l', [0] * (self.capacity * SLOT_WIDTH))
+        self.index = array.array('l', [0, 0])  # head (next write), tail (next read)
+        self.dropped = 0  # Messages put() refused because the ring was full
+
+    def put(self, kind, a=0, b=0, c=0, d=0, e=0):
+        head = self.index[0]
+        after = head + 1
+        if after == self.capacity:
+            after = 0
+        if after == self.index[1]:
+            self.dropped += 1
+            return False
+        slots = self.slots
+        i = head * SLOT_WIDTH
+        slots[i] = kind
+        slots[i + 1] = a
+        slots[i + 2] = b
+        slots[i + 3] = c
+        slots[i + 4] = d
+        slots[i + 5] = e
+        self.index[0] = after
+        return True
+
+    def get(self, out):
+        """Copy the oldest message into out (a list of SLOT_WIDTH). Returns False if empty."""
+        tail = self.index[1]
+        if tail == self.index[0]:
+            return False
+        slots = self.slots
+        i = tail * SLOT_WIDTH
+        for j in range(SLOT_WIDTH):
+            out[j] = slots[i + j]
+        tail += 1
+        self.index[1] = 0 if tail == self.capacity else tail
+        return True
+
+    def __len__(self):
+        return (self.index[0] - self.index[1]) % self.capacity
+
+    def free(self):
+        """Messages put() can take right now. The consumer only ever adds room."""
+        return self.capacity - 1 - len(self)
@@ -0,0 +1,169 @@
+# store.py
+
+import binascii
+import os
+import struct
+
+LOG_FILES = ('state0.log', 'state1.log')
+MAX_RECORDS = 64  # Records per log file before it is compacted into the other one
+
+MAGIC = 0x5753
+KIND_ZONE = 1  # key = zone id, values = (next watering, interval, duration in ms)
+KIND_SNAPSHOT_END = 2  # Marks a complete snapshot at the start of a log file
+
+# magic, kind, key, sequence, three values, then a CRC32 of all of that
+RECORD_FORMAT = '<HBBIIII'
+MAX_VALUE = 0xFFFFFFFF
+RECORD_BODY_SIZE = struct.calcsize(RECORD_FORMAT)
+RECORD_SIZE = RECORD_BODY_SIZE + 4
+
+def _crc(buf):
+    return binascii.crc32(buf) & 0xFFFFFFFF
+
+def _u32(n):
+    return min(max(0, int(n)), MAX_VALUE)
+
+class StateStore:
+    """Append-only, checksummed store for the per-zone watering state.
+
+    put() only records the new values in RAM, and flush() appends every
+    changed key as a fixed-size record in a single write, so a burst of
+    updates costs one flash write. A torn or corrupt record fails its CRC
+    and load() stops there, keeping the last good state. Once a log holds
+    MAX_RECORDS records, a snapshot of the state goes into the other file
+    and the old one is removed. A log is only trusted if its snapshot is
+    complete, so a power cut during compaction falls back to the old log.
+    Log files are bounded, so load() takes the same time however long the
+    device has run.
+    """
+
+    def __init__(self, files=LOG_FILES, max_records=MAX_RECORDS):
+        self.files = files
+        self.max_records = max_records
+        # Values are kept as they are packed, with c in ms
+        self.state = {}  # key -> (a, b, c) as committed to flash
+        self.pending = {}  # key -> (a, b, c) waiting for flush()
+        self.active = 0  # Index into files of the log being appended to
+        self.records = 0  # Records in the active log
+        self.seq = 0
+        self.buf = bytearray(RECORD_SIZE)
+        self.flushes = 0
+        self.records_written = 0
+        self.bytes_written = 0
+        self.compactions = 0
+
+    def _read_log(self, path):
+        # Returns (state, last sequence, valid records, file size) or None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        state = {}
+        seq = 0
+        complete = False
+        valid = 0
+        mv = memoryview(data)
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            body = mv[offset:offset + RECORD_BODY_SIZE]
+            crc = struct.unpack_from('<I', data, offset + RECORD_BODY_SIZE)[0]
+            if _crc(body) != crc:
+                break
+            magic, kind, key, seq, a, b, c = struct.unpack_from(RECORD_FORMAT, data, offset)
+            if magic != MAGIC:
+                break
+            if kind == KIND_ZONE:
+                state[key] = (a, b, c)
+            elif kind == KIND_SNAPSHOT_END:
+                complete = True
+            valid += 1
+        if not complete:
+            return None
+        return state, seq, valid, len(data)
+
+    def load(self):
+        """Recover the newest complete log. Returns {key: (a, b, c)}, c in seconds."""
+        best = None
+        for index, path in enumerate(self.files):
+            log = self._read_log(path)
+            if log is not None and (best is None or log[1] > best[1][1]):
+                best = (index, log)
+        if best is None:
+            return None
+        index, (state, seq, valid, size) = best
+        self.state = state
+        self.seq = seq
+        self.active = index
+        self.records = valid
+        if valid * RECORD_SIZE < size:
+            print(f"State log {self.files[index]} has a damaged tail, compacting")
+            self.compact()
+        return {key: (a, b, c // 1000 if c % 1000 == 0 else c / 1000) for key, (a, b, c) in state.items()}
+
+    def put(self, key, a, b, c):
+        """Queue new values for key, c is seconds to the ms. Each is clamped to fit a record."""
+        values = (_u32(a), _u32(b), _u32(round(c * 1000)))
+        if self.pending.get(key, self.state.get(key)) != values:
+            self.pending[key] = values
+
+    def dirty(self):
+        return bool(self.pending)
+
+    def _pack(self, kind, key, values):
+        self.seq += 1
+        a, b, c = values
+        struct.pack_into(RECORD_FORMAT, self.buf, 0, MAGIC, kind, key, self.seq, a, b, c)
+        struct.pack_into('<I', self.buf, RECORD_BODY_SIZE, _crc(memoryview(self.buf)[:RECORD_BODY_SIZE]))
+        return bytes(self.buf)
+
+    def _write(self, path, mode, records):
+        data = b''.join(records)
+        with open(path, mode) as f:
+            f.write(data)
+        self.records_written += len(records)
+        self.bytes_written += len(data)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.records == 0 or self.records + len(self.pending) > self.max_records:
+            # No complete log yet, or the active one is full
+            self.compact()
+            return
+        records = [self._pack(KIND_ZONE, key, values) for key, values in self.pending.items()]
+        self._write(self.files[self.active], 'ab', records)
+        self.flushes += 1
+        self.records += len(records)
+        self.state.update(self.pending)
+        self.pending = {}
+
+    def compact(self):
+        """Write the whole state as a snapshot into the other log and drop this one."""
+        state = dict(self.state)
+        state.update(self.pending)
+        records = [self._pack(KIND_ZONE, key, values) for key, values in state.items()]
+        records.append(self._pack(KIND_SNAPSHOT_END, 0, (0, 0, 0)))
+        old = self.files[self.active]
+        self._write(self.files[1 - self.active], 'wb', records)
+        # Only once the snapshot is written, so a failed write is retried from the same state
+        self.state = state
+        self.pending = {}
+        self.active = 1 - self.active
+        self.flushes += 1
+        self.compactions += 1
+        self.records = len(records)
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {
+            "active_file": self.files[self.active],
+            "records": self.records,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "compactions": self.compactions
+        }
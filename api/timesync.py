@@ -0,0 +1,85 @@
+# timesync.py
+
+import asyncio
+import machine
+import ntptime
+import utime
+
+SYNC_INTERVAL = 86400  # Seconds between NTP syncs once one has succeeded
+RETRY_MIN = 5  # First retry delay after a failed sync, doubled on every failure
+RETRY_MAX = 3600
+JUMP_THRESHOLD = 2  # Corrections of at least this many seconds count as a clock jump
+
+class TimeService:
+    """Keeps the system clock right without holding up boot.
+
+    At boot the clock is seeded from the DS3231, unless the DS3231 has lost
+    power. NTP then runs in the background and retries with exponential
+    backoff. Each NTP result is written back to the DS3231. The first sync
+    of an untrusted clock, and any correction of JUMP_THRESHOLD seconds or
+    more, is reported to on_jump(delta) so the schedule can be reconciled.
+    """
+
+    def __init__(self, rtc_chip, on_jump=None):
+        self.rtc_chip = rtc_chip
+        self.on_jump = on_jump
+        self.source = None  # 'ds3231' or 'ntp' once the clock can be trusted
+        self.last_sync = None  # utime.time() of the last NTP sync
+        self.skew = None  # Seconds the clock was off at the last NTP sync
+        self.failures = 0
+
+    def trusted(self):
+        return self.source is not None
+
+    def seed_from_rtc(self):
+        try:
+            if self.rtc_chip.lost_power():
+                print("DS3231 lost power, waiting for NTP")
+                return False
+            t = self.rtc_chip.datetime()
+        except OSError as e:
+            print(f"Could not read DS3231: {e}")
+            return False
+        machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+        self.source = 'ds3231'
+        print(f"Clock seeded from DS3231: {utime.time()}")
+        return True
+
+    def sync(self):
+        before = utime.time()
+        ntptime.settime()
+        now = utime.time()
+        was_trusted = self.trusted()
+        self.skew = now - before
+        self.last_sync = now
+        self.source = 'ntp'
+        print(f"Time synced with NTP server, skew {self.skew} seconds")
+        try:
+            self.rtc_chip.set_time(now)
+        except OSError as e:
+            print(f"Could not update DS3231: {e}")
+        if self.on_jump and (abs(self.skew) >= JUMP_THRESHOLD or not was_trusted):
+            self.on_jump(self.skew)
+
+    async def run(self):
+        while True:
+            try:
+                self.sync()
+                self.failures = 0
+                delay = SYNC_INTERVAL
+            except Exception as e:
+                self.failures += 1
+                delay = min(RETRY_MAX, RETRY_MIN * 2 ** (self.failures - 1))
+                print(f"Could not sync with NTP server ({e}), retrying in {delay} seconds")
+            await asyncio.sleep(delay)
+
+    def status(self):
+        now = utime.time()
+        return {
+            "current_time": now,
+            "source": self.source,
+            "last_sync": self.last_sync,
+            "sync_age": now - self.last_sync if self.last_sync is not None else None,
+            "skew": self.skew,
+            "failures": self.failures
+        }
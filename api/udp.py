@@ -0,0 +1,140 @@
+# udp.py
+
+import asyncio
+import gc
+import socket
+import struct
+import utime
+
+# Every datagram starts with MAGIC, VERSION, a type and a sequence number
+# the reply echoes, so a poller can match answers to questions
+MAGIC = b'PW'
+VERSION = 1
+DISCOVER = 1  # Request: who is there?
+ANNOUNCE = 2  # Reply: boot id, HTTP port, zone count, name
+STATUS_REQUEST = 3  # Request: status of one zone, 0xFF for the default one
+STATUS = 4  # Reply: STATUS_FORMAT
+
+DEFAULT_ZONE = 0xFF
+REQUEST_FORMAT = '<2sBBHB'  # magic, version, type, seq, zone (optional)
+ANNOUNCE_FORMAT = '<2sBBHHHB16s'  # magic, version, type, seq, boot id, HTTP port, zones, name
+# magic, version, type, seq, boot id, zone, motor state, schedule version, next watering,
+# time remaining, interval, duration, uptime, heap free. Times are seconds, heap free is
+# 0 where it can't be measured.
+STATUS_FORMAT = '<2sBBHHBBIIIIHII'
+STATUS_SIZE = struct.calcsize(STATUS_FORMAT)  # 36 bytes
+MOTOR_STATES = ('idle', 'forward', 'reverse', 'cooldown')  # Motor state byte -> name
+
+POLL_INTERVAL = 0.05  # Seconds between checks for datagrams on MicroPython
+BURST = 8  # Datagrams answered per check, so a flood can't starve the other tasks
+MAX_REQUEST = 16  # Bytes read per datagram, longer ones are cut short
+
+_mem_free = getattr(gc, 'mem_free', None)  # MicroPython only
+
+# Largest values the B, H and I fields hold
+U8 = 0xFF
+U16 = 0xFFFF
+U32 = 0xFFFFFFFF
+
+def _fit(value, limit):
+    """value as an int clamped to 0..limit, so pack_into can't fail on it."""
+    value = int(value)
+    return 0 if value < 0 else limit if value > limit else value
+
+class UdpService:
+    """Answers discovery probes and binary status requests on a UDP port.
+
+    status(zone_id) returns (zone id, motor state index, schedule version,
+    next watering, time remaining, interval, duration) or None for an
+    unknown zone. Replies are packed into buffers allocated once, so a
+    status answer costs one small read and one sendto.
+    """
+
+    def __init__(self, boot_id, boot_ticks, name, zones, status):
+        self.boot_id = boot_id
+        self.boot_ticks = boot_ticks
+        self.name = name.encode()[:16]
+        self.zones = zones
+        self.status = status
+        self.announce = bytearray(struct.calcsize(ANNOUNCE_FORMAT))
+        self.reply = bytearray(STATUS_SIZE)
+        self.port = None
+        self.requests = 0
+        self.replies = 0
+        self.rejected = 0  # Datagrams that weren't a request we know
+
+    def handle(self, data):
+        """The reply to one datagram, or None to stay quiet."""
+        self.requests += 1
+        if len(data) < 6 or data[:2] != MAGIC or data[2] != VERSION:
+            self.rejected += 1
+            return None
+        kind = data[3]
+        seq = data[4] | data[5] << 8
+        if kind == DISCOVER:
+            struct.pack_into(ANNOUNCE_FORMAT, self.announce, 0, MAGIC, VERSION, ANNOUNCE, seq,
+                             _fit(self.boot_id, U16), _fit(self.port, U16), _fit(self.zones, U8), self.name)
+            return self.announce
+        if kind == STATUS_REQUEST:
+            status = self.status(data[6] if len(data) > 6 else DEFAULT_ZONE)
+            if status is None:
+                self.rejected += 1
+                return None
+            zone_id, motor, version, next_watering, remaining, interval, duration = status
+            uptime = utime.ticks_diff(utime.ticks_ms(), self.boot_ticks) // 1000
+            struct.pack_into(STATUS_FORMAT, self.reply, 0, MAGIC, VERSION, STATUS, seq, _fit(self.boot_id, U16),
+                             _fit(zone_id, U8), _fit(motor, U8), _fit(version, U32), _fit(next_watering, U32),
+                             _fit(remaining, U32), _fit(interval, U32), _fit(duration, U16),
+                             _fit(uptime, U32), _fit(_mem_free() if _mem_free else 0, U32))
+            return self.reply
+        self.rejected += 1
+        return None
+
+    def _answer(self, sock, data, addr):
+        try:
+            reply = self.handle(data)
+        except Exception as e:
+            # One bad datagram or status value must not take the service down
+            self.rejected += 1
+            print(f"Error answering UDP request: {e}")
+            return
+        if reply is not None:
+            try:
+                sock.sendto(reply, addr)
+                self.replies += 1
+            except OSError:
+                pass
+
+    async def run(self, port):
+        """Serve on port, the same number as the HTTP server's."""
+        self.port = port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(socket.getaddrinfo('0.0.0.0', port)[0][-1])
+        sock.setblocking(False)
+        print(f'Answering discovery and status on UDP port {port}')
+        # CPython's loop can wait on a datagram socket, MicroPython's can't, so it is polled there
+        recvfrom = getattr(asyncio.get_event_loop(), 'sock_recvfrom', None)
+        while True:
+            if recvfrom:
+                try:
+                    data, addr = await recvfrom(sock, MAX_REQUEST)
+                except OSError:
+                    continue
+                self._answer(sock, data, addr)
+                continue
+            for _ in range(BURST):
+                try:
+                    data, addr = sock.recvfrom(MAX_REQUEST)
+                except OSError:
+                    break  # Nothing waiting
+                self._answer(sock, data, addr)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "requests": self.requests,
+            "replies": self.replies,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,517 @@
+# webserver.py
+
+import asyncio
+import gc
+import json
+import utime
+import profiler
+
+MAX_HEADER_SIZE = 1024  # Request line and headers
+MAX_BODY_SIZE = 512
+BUFFER_SIZE = MAX_HEADER_SIZE + 4 + MAX_BODY_SIZE  # The body starts after the blank line
+MAX_CONNECTIONS = 4  # Clients served at the same time, one buffer each
+REQUEST_TIMEOUT = 5  # Seconds a client gets to deliver a complete request
+KEEP_ALIVE_TIMEOUT = 5  # Seconds an idle persistent connection is kept open
+MAX_REQUESTS = 20  # Requests on one connection before it is closed, so clients take turns
+EVICT_WAIT = 0.5  # Seconds a new client waits for a buffer when all are taken
+HEAD_SPACE = 512  # Room left for the status line and headers when a response is built in place
+KEPT_HEADERS = (b'content-length', b'if-none-match', b'connection')  # Other request headers are skipped
+NO_BODY = (204, 304)  # Statuses that never carry a body, so they get no Content-Length either
+
+STATUS_TEXT = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# Encoded once at import so building a response only joins byte strings
+STATUS_LINES = {status: f"HTTP/1.1 {status} {text}\r\n".encode() for status, text in STATUS_TEXT.items()}
+KEEP_ALIVE_HEADER = b"Connection: keep-alive\r\nKeep-Alive: timeout=%d, max=%d\r\n" % (KEEP_ALIVE_TIMEOUT, MAX_REQUESTS)
+CLOSE_HEADER = b"Connection: close\r\n"
+CORS_HEADERS = (
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+    b"Access-Control-Allow-Headers: Content-Type, If-None-Match\r\n"
+    b"Access-Control-Expose-Headers: ETag\r\n"
+    b"Access-Control-Max-Age: 86400\r\n"
+)
+JSON_TYPE = b"Content-type: application/json\r\n"
+
+_mem_alloc = getattr(gc, 'mem_alloc', None)  # MicroPython only
+_mem_free = getattr(gc, 'mem_free', None)
+alloc_stats = {}  # path -> [requests, bytes allocated in total, most allocated by one request]
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or STATUS_TEXT.get(status, ""))
+        self.status = status
+        self.message = message or STATUS_TEXT.get(status, "")
+
+class Request:
+    def __init__(self, method, path, query, headers, body, keep_alive=False):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive  # The client asked for the connection to stay open
+
+    def json(self):
+        return json.loads(self.body)
+
+class Response:
+    # body is bytes, or a tuple of bytes and ints that is written out part by
+    # part. data is serialized as JSON straight into the connection's buffer.
+    # A stream response sends its headers, then awaits stream(writer) until
+    # the client goes away instead of sending a fixed body.
+    def __init__(self, status=200, body=b"", content_type=JSON_TYPE, headers=b"", stream=None, data=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers
+        self.stream = stream
+        self.data = data
+        self.connection = b""  # Set by serve_client, KEEP_ALIVE_HEADER or CLOSE_HEADER
+
+    def _head(self):
+        return (STATUS_LINES[self.status], self.content_type, CORS_HEADERS, self.headers, self.connection)
+
+    def encode(self):
+        if self.stream or self.status in NO_BODY:
+            return b"".join(self._head() + (b"\r\n",))
+        body = self.body
+        if self.data is not None:
+            body = json.dumps(self.data).encode()
+        elif isinstance(body, tuple):
+            body = b"".join(part if isinstance(part, bytes) else b"%d" % part for part in body)
+        return b"".join(self._head() + (b"Content-Length: %d\r\n\r\n" % len(body), body))
+
+    def write_into(self, buf):
+        """Build the response in buf. Returns (start, end), or None if it doesn't fit."""
+        try:
+            if self.data is not None:
+                end = write_json(buf, HEAD_SPACE, self.data)
+            elif isinstance(self.body, tuple):
+                end = HEAD_SPACE
+                for part in self.body:
+                    end = _write_bytes(buf, end, part) if isinstance(part, bytes) else _write_int(buf, end, part)
+            else:
+                end = _write_bytes(buf, HEAD_SPACE, self.body)
+        except IndexError:
+            return None
+        # The head goes right in front of the body, so the two are sent as one slice
+        if self.status in NO_BODY:
+            length = b"\r\n"
+        else:
+            length = b"Content-Length: %d\r\n\r\n" % (end - HEAD_SPACE)
+        head = self._head()
+        start = HEAD_SPACE - len(length)
+        for part in head:
+            start -= len(part)
+        if start < 0:
+            return None
+        pos = start
+        for part in head:
+            pos = _write_bytes(buf, pos, part)
+        _write_bytes(buf, pos, length)
+        return start, end
+
+def _write_bytes(buf, pos, data):
+    end = pos + len(data)
+    if end > len(buf):
+        raise IndexError
+    buf[pos:end] = data
+    return end
+
+def _write_int(buf, pos, n):
+    if n < 0:
+        pos = _write_bytes(buf, pos, b"-")
+        n = -n
+    digits = 1
+    while n >= 10 ** digits:
+        digits += 1
+    end = pos + digits
+    if end > len(buf):
+        raise IndexError
+    for i in range(end - 1, pos - 1, -1):
+        buf[i] = 48 + n % 10
+        n //= 10
+    return end
+
+_key_cache = {}  # Encoded '"key": ' for the dict keys handlers use, they are a small fixed set
+
+def _write_str(buf, pos, s):
+    data = s.encode()
+    for byte in data:
+        if byte < 32 or byte == 34 or byte == 92:
+            return _write_bytes(buf, pos, json.dumps(s).encode())  # Needs escaping
+    if pos + len(data) + 2 > len(buf):
+        raise IndexError
+    buf[pos] = 34
+    pos = _write_bytes(buf, pos + 1, data)
+    buf[pos] = 34
+    return pos + 1
+
+def write_json(buf, pos, obj):
+    """Serialize obj into buf at pos the way json.dumps would. Returns the end.
+
+    Raises IndexError if buf is too small.
+    """
+    if obj is None:
+        return _write_bytes(buf, pos, b"null")
+    if obj is True:
+        return _write_bytes(buf, pos, b"true")
+    if obj is False:
+        return _write_bytes(buf, pos, b"false")
+    if isinstance(obj, int):
+        return _write_int(buf, pos, obj)
+    if isinstance(obj, float):
+        return _write_bytes(buf, pos, json.dumps(obj).encode())
+    if isinstance(obj, str):
+        return _write_str(buf, pos, obj)
+    if isinstance(obj, dict):
+        pos = _write_bytes(buf, pos, b"{")
+        first = True
+        for key, value in obj.items():
+            if not first:
+                pos = _write_bytes(buf, pos, b", ")
+            first = False
+            key_bytes = _key_cache.get(key)
+            if key_bytes is None:
+                key_bytes = (json.dumps(key) + ": ").encode()
+                if len(_key_cache) < 64:
+                    _key_cache[key] = key_bytes
+            pos = _write_bytes(buf, pos, key_bytes)
+            pos = write_json(buf, pos, value)
+        return _write_bytes(buf, pos, b"}")
+    if isinstance(obj, (list, tuple)):
+        pos = _write_bytes(buf, pos, b"[")
+        for index, value in enumerate(obj):
+            if index:
+                pos = _write_bytes(buf, pos, b", ")
+            pos = write_json(buf, pos, value)
+        return _write_bytes(buf, pos, b"]")
+    raise TypeError(f"Can't serialize {type(obj).__name__}")
+
+def json_response(obj, status=200):
+    return Response(status, data=obj)
+
+def error_response(status, message):
+    return json_response({"error": message}, status)
+
+class Router:
+    def __init__(self):
+        self.routes = {}  # path -> {method: handler}
+        self.observer = None  # Called as observer(path, status, ms) once a response is sent
+
+    def route(self, method, path):
+        def register(handler):
+            self.routes.setdefault(path, {})[method] = handler
+            return handler
+        return register
+
+    def dispatch(self, request):
+        methods = self.routes.get(request.path)
+        if methods is None:
+            return error_response(404, "Invalid endpoint")
+        handler = methods.get(request.method)
+        if handler is None:
+            if request.method == 'OPTIONS':
+                return Response(204, content_type=b"")
+            response = error_response(405, "Method not allowed")
+            response.headers = f"Allow: {', '.join(methods)}\r\n".encode()
+            return response
+        try:
+            result = handler(request)
+        except HTTPError as e:
+            return error_response(e.status, e.message)
+        except Exception as e:
+            # A handler bug still gets an answer, instead of a reset connection
+            print(f"Error handling {request.method} {request.path}: {e}")
+            return error_response(500, "Internal error")
+        if isinstance(result, Response):
+            return result
+        return json_response(result)
+
+class BufferPool:
+    def __init__(self, count, size):
+        self.free = [bytearray(size) for _ in range(count)]
+
+    def acquire(self):
+        return self.free.pop() if self.free else None
+
+    def release(self, buf):
+        self.free.append(buf)
+
+_pool = BufferPool(MAX_CONNECTIONS, BUFFER_SIZE)
+_idle = []  # Tasks of persistent connections waiting for their next request, oldest first
+_evicted = []  # Idle tasks cancelled to free a buffer, not yet wound down
+
+def _unquote(s):
+    if '%' not in s and '+' not in s:
+        return s
+    s = s.replace('+', ' ')
+    parts = s.split('%')
+    out = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            out.append(int(part[:2], 16))
+            out.extend(part[2:].encode())
+        except ValueError:
+            out.extend(b'%' + part.encode())
+    return out.decode()
+
+def parse_query(query):
+    params = {}
+    for pair in query.split('&'):
+        if pair:
+            key, _, value = pair.partition('=')
+            params[_unquote(key)] = _unquote(value)
+    return params
+
+async def _readinto(reader, mv):
+    # MicroPython streams can read straight into the buffer, CPython ones can't
+    if hasattr(reader, 'readinto'):
+        return await reader.readinto(mv)
+    data = await reader.read(len(mv))
+    mv[:len(data)] = data
+    return len(data)
+
+def _find(buf, sub, start, end):
+    # bytearray has no find() on MicroPython, scan by hand rather than copy the buffer into bytes
+    first = sub[0]
+    n = len(sub)
+    for i in range(start, end - n + 1):
+        if buf[i] == first:
+            j = 1
+            while j < n and buf[i + j] == sub[j]:
+                j += 1
+            if j == n:
+                return i
+    return -1
+
+def _parse_head(buf, header_end):
+    # Works on the buffer line by line, only the request line and KEPT_HEADERS are decoded
+    line_end = _find(buf, b"\r\n", 0, header_end)
+    if line_end < 0:
+        line_end = header_end
+    try:
+        method, target, version = bytes(buf[:line_end]).decode().split(' ')
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    path, _, query = target.partition('?')
+    headers = {}
+    pos = line_end + 2
+    while pos < header_end:
+        line_end = _find(buf, b"\r\n", pos, header_end)
+        if line_end < 0:
+            line_end = header_end
+        colon = _find(buf, b":", pos, line_end)
+        if colon < 0:
+            raise HTTPError(400, "Malformed header")
+        name = bytes(buf[pos:colon]).strip().lower()
+        if name in KEPT_HEADERS:
+            headers[name.decode()] = bytes(buf[colon + 1:line_end]).decode().strip()
+        pos = line_end + 2
+    return method, path, parse_query(query), headers, version
+
+async def read_request(reader, buf, length=0):
+    """Read one request into buf, after the length bytes already there.
+
+    Returns None if the client sent nothing.
+    """
+    mv = memoryview(buf)
+    header_end = _find(buf, b"\r\n\r\n", 0, length) if length else -1
+    while header_end < 0:
+        if length >= MAX_HEADER_SIZE:
+            raise HTTPError(431)
+        n = await _readinto(reader, mv[length:])
+        if not n:
+            if length:
+                raise HTTPError(400, "Incomplete request")
+            return None
+        header_end = _find(buf, b"\r\n\r\n", max(0, length - 3), length + n)
+        length += n
+    if header_end > MAX_HEADER_SIZE:
+        raise HTTPError(431)
+
+    method, path, query, headers, version = _parse_head(buf, header_end)
+
+    body_start = header_end + 4
+    try:
+        content_length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if content_length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if content_length > MAX_BODY_SIZE:
+        raise HTTPError(413)
+    body_end = body_start + content_length
+    while length < body_end:
+        n = await _readinto(reader, mv[length:body_end])
+        if not n:
+            raise HTTPError(400, "Incomplete body")
+        length += n
+
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        keep_alive = connection == 'keep-alive'
+    else:
+        keep_alive = connection != 'close'
+    # A pipelined request behind this one would be overwritten by the response
+    keep_alive = keep_alive and length == body_end
+    return Request(method, path, query, headers, bytes(mv[body_start:body_end]), keep_alive)
+
+def _count_alloc(path, before):
+    used = _mem_alloc() - before
+    if used < 0:
+        return  # A collection ran during the request
+    stats = alloc_stats.get(path)
+    if stats is None:
+        stats = alloc_stats[path] = [0, 0, 0]
+    stats[0] += 1
+    stats[1] += used
+    if used > stats[2]:
+        stats[2] = used
+
+def memory_stats():
+    if _mem_alloc is None:
+        return {"mem_free": None, "mem_alloc": None, "requests": {}}
+    return {
+        "mem_free": _mem_free(),
+        "mem_alloc": _mem_alloc(),
+        "requests": {
+            path: {"requests": count, "average": total // count, "max": most}
+            for path, (count, total, most) in alloc_stats.items()
+        }
+    }
+
+def _evict():
+    task = _idle.pop(0)
+    _evicted.append(task)
+    task.cancel()
+    return task
+
+async def _wait_buffer():
+    """Wait up to EVICT_WAIT for a buffer, closing the longest-idle persistent connection for one."""
+    evicted = _evict() if _idle else None
+    waited = 0
+    while waited < EVICT_WAIT:
+        await asyncio.sleep(0.01)
+        waited += 0.01
+        buf = _pool.acquire()
+        if buf is not None:
+            return buf
+        # A connection may have gone idle since, or another client took the buffer freed for this one
+        if _idle and (evicted is None or evicted.done()):
+            evicted = _evict()
+    return None  # Every connection is busy with a request
+
+async def _wait_request(reader, buf):
+    # The connection is idle until the next request starts, a new client can evict it meanwhile
+    task = asyncio.current_task()
+    _idle.append(task)
+    try:
+        return await asyncio.wait_for(_readinto(reader, memoryview(buf)), KEEP_ALIVE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return 0
+    except asyncio.CancelledError:
+        if task not in _evicted:
+            raise  # Cancelled from elsewhere, a server shutdown for one
+        return 0
+    finally:
+        if task in _idle:
+            _idle.remove(task)
+        if task in _evicted:
+            _evicted.remove(task)
+
+async def serve_client(reader, writer, router):
+    print(f'Client connected from {writer.get_extra_info("peername")}')
+    buf = _pool.acquire()
+    if buf is None:
+        buf = await _wait_buffer()
+    try:
+        if buf is None:
+            response = error_response(503, "Too many connections")
+            response.connection = CLOSE_HEADER
+            writer.write(response.encode())
+            await writer.drain()
+            return
+        served = 0
+        length = 0  # Bytes of the next request already in buf
+        while True:
+            before = _mem_alloc() if _mem_alloc else 0
+            path = None
+            keep = False
+            started = utime.ticks_ms()
+            try:
+                sample = profiler.start()
+                request = await asyncio.wait_for(read_request(reader, buf, length), REQUEST_TIMEOUT)
+                profiler.stop(profiler.READ, sample)
+                started = utime.ticks_ms()  # Latency is counted from a complete request
+                if request is None:
+                    return
+                path = request.path
+                keep = request.keep_alive and served + 1 < MAX_REQUESTS
+                sample = profiler.start()
+                response = router.dispatch(request)
+                profiler.stop(profiler.DISPATCH, sample)
+            except asyncio.TimeoutError:
+                response = error_response(408, "Request timed out")
+            except HTTPError as e:
+                response = error_response(e.status, e.message)
+            if response.stream:
+                break
+            response.connection = KEEP_ALIVE_HEADER if keep else CLOSE_HEADER
+            # The request has been parsed out of buf, so the response is built in its place
+            sample = profiler.start()
+            span = response.write_into(buf)
+            data = response.encode() if span is None else memoryview(buf)[span[0]:span[1]]
+            profiler.stop(profiler.SERIALIZE, sample)
+            sample = profiler.start()
+            writer.write(data)
+            await writer.drain()
+            profiler.stop(profiler.WRITE, sample)
+            if router.observer:
+                router.observer(path, response.status, utime.ticks_diff(utime.ticks_ms(), started))
+            if path is not None and _mem_alloc:
+                _count_alloc(path, before)
+            if not keep:
+                return
+            served += 1
+            length = await _wait_request(reader, buf)
+            if not length:
+                return
+        response.connection = CLOSE_HEADER
+        writer.write(response.encode())
+        await writer.drain()
+        if router.observer:
+            router.observer(path, response.status, utime.ticks_diff(utime.ticks_ms(), started))
+        # Long-lived streams don't need the request buffer any more
+        _pool.release(buf)
+        buf = None
+        await response.stream(writer)
+    except OSError as e:
+        print(f"Error serving client: {e}")
+    finally:
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
+        # Released only once the socket is closed, a write may still point into buf
+        if buf is not None:
+            _pool.release(buf)
+
+def start_server(router, host, port, backlog=5):
+    async def client(reader, writer):
+        await serve_client(reader, writer, router)
+    return asyncio.start_server(client, host, port, backlog=backlog)
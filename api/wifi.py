@@ -0,0 +1,116 @@
+# wifi.py
+
+import asyncio
+import network
+import utime
+
+CONNECT_TIMEOUT = 10  # Seconds to wait for one connection attempt
+CHECK_INTERVAL = 5  # Seconds between link checks while connected
+RETRY_MIN = 2  # First retry delay after a failed attempt, doubled on every failure
+RETRY_MAX = 300
+
+class WifiSupervisor:
+    """Connects to Wi-Fi in the background and reconnects whenever the link drops.
+
+    Nothing waits on the network at boot: run() is a task next to the
+    scheduler and keeps retrying with exponential backoff. on_up(ip) is
+    called every time the link comes up, and connected is set while it is up.
+    """
+
+    def __init__(self, ssid, password, on_up=None):
+        self.ssid = ssid
+        self.password = password
+        self.on_up = on_up
+        self.wlan = network.WLAN(network.STA_IF)
+        self.connected = asyncio.Event()
+        self.ip = None
+        self.suspended = False
+        self.failures = 0
+        self.connects = 0  # Times the link came up
+        self.drops = 0  # Times an established link was lost
+        self.up_since = None  # utime.time() the link last came up
+        self._wakeup = asyncio.Event()
+
+    def isconnected(self):
+        return self.connected.is_set()
+
+    async def _connect(self):
+        wlan = self.wlan
+        wlan.active(True)
+        wlan.connect(self.ssid, self.password)
+        for _ in range(CONNECT_TIMEOUT * 2):
+            status = wlan.status()
+            if status < 0 or status >= 3:
+                break
+            await asyncio.sleep(0.5)
+        if wlan.status() != 3:
+            raise OSError(f'status {wlan.status()}')
+        return wlan.ifconfig()[0]
+
+    def _link_up(self, ip):
+        self.ip = ip
+        self.failures = 0
+        self.connects += 1
+        self.up_since = utime.time()
+        self.connected.set()
+        print(f'Connected, device IP: {ip}')
+        if self.on_up:
+            self.on_up(ip)
+
+    def _link_down(self):
+        if self.connected.is_set():
+            self.connected.clear()
+            if not self.suspended:
+                self.drops += 1
+                print('Wi-Fi link lost')
+
+    def suspend(self):
+        """Turn the radio off, for sleep. run() leaves it off until resume()."""
+        self.suspended = True
+        self._link_down()
+        self.wlan.active(False)
+
+    def resume(self):
+        self.suspended = False
+        self._wakeup.set()
+
+    async def _wait(self, seconds):
+        # Sleep, but come back early if resume() is called
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        while True:
+            if self.suspended:
+                await self._wait(CHECK_INTERVAL)
+                continue
+            if self.wlan.isconnected():
+                if not self.connected.is_set():
+                    self._link_up(self.wlan.ifconfig()[0])
+                await self._wait(CHECK_INTERVAL)
+                continue
+            self._link_down()
+            try:
+                ip = await self._connect()
+            except Exception as e:
+                self.failures += 1
+                delay = min(RETRY_MAX, RETRY_MIN * 2 ** (self.failures - 1))
+                print(f'Wi-Fi connection failed ({e}), retrying in {delay} seconds')
+                await self._wait(delay)
+                continue
+            if not self.suspended:
+                self._link_up(ip)
+
+    def status(self):
+        return {
+            "connected": self.isconnected(),
+            "ip": self.ip,
+            "up_since": self.up_since,
+            "failures": self.failures,
+            "connects": self.connects,
+            "drops": self.drops,
+            "suspended": self.suspended
+        }
@@ -0,0 +1,179 @@
+# zones.py
+
+import heapq
+from motor import MotorController, IDLE
+from history import SOURCE_SCHEDULE, SOURCE_MANUAL
+
+# What to do about waterings whose time passed while the board was off or asleep
+MISSED_ONCE = 'once'  # Water once now, then carry on with the schedule
+MISSED_SKIP = 'skip'  # Wait for the next scheduled time
+MISSED_ALL = 'all'  # Make up every missed watering, spaced apart
+MISSED_POLICIES = (MISSED_ONCE, MISSED_SKIP, MISSED_ALL)
+
+MISSED_GRACE = 300  # Seconds late a watering can be and still count as on time
+CATCH_UP_SPACING = 3600  # Seconds between make-up waterings
+MAX_CATCH_UP = 4  # Make-up waterings after one outage, however long it was
+
+class Zone:
+    def __init__(self, zone_id, pins, duration, interval, supply=0, missed=MISSED_ONCE,
+                 catch_up_spacing=CATCH_UP_SPACING):
+        self.id = zone_id
+        self.pins = pins  # (pwm, dir1, dir2) on the L293D
+        self.duration = duration
+        self.interval = interval  # Seconds between waterings
+        self.supply = supply  # Zones with the same supply never pump at once
+        self.missed = missed  # One of MISSED_POLICIES
+        self.catch_up_spacing = catch_up_spacing
+        self.next_watering = None
+        self.anchor = None  # Next time on the zone's schedule, anchor + k * interval
+        self.catch_up = 0  # Make-up waterings still to run before the anchor
+        self.generation = 0  # Bumped on every reschedule, older heap entries are stale
+        self.source = SOURCE_SCHEDULE  # What triggered the current or last run
+        self.motor = MotorController(*pins)
+
+    def info(self, now):
+        return {
+            "id": self.id,
+            "duration": self.duration,
+            "delay": self.interval / 86400,
+            "next_watering": self.next_watering,
+            "time_remaining": max(0, self.next_watering - now) if self.next_watering is not None else None,
+            "motor": self.motor.state
+        }
+
+class ZoneScheduler:
+    """Keeps every zone's next watering in a heap ordered by due time.
+
+    Rescheduling a zone pushes a new entry and bumps the zone's generation
+    rather than searching the heap, so both finding the next due zone and
+    rescheduling cost O(log n). Pump runs are serialized per supply: a zone
+    that comes due while another zone on its supply is pumping waits in a
+    FIFO until that run finishes.
+
+    Each zone's waterings stay on a fixed grid, anchor + k * interval, so
+    neither tick latency nor pump run time adds up over the cycles. A
+    watering found more than MISSED_GRACE seconds late was missed, and the
+    zone's missed policy decides what happens to it.
+    """
+
+    def __init__(self, listener=None):
+        self.zones = {}
+        self.heap = []  # (due time, generation, zone id)
+        self.active = {}  # supply -> zone currently pumping
+        self.waiting = {}  # supply -> [zones queued for the pump]
+        self.listener = listener  # Called as listener(event, zone)
+
+    def _notify(self, event, zone):
+        if self.listener:
+            try:
+                self.listener(event, zone)
+            except Exception as e:
+                # Bookkeeping must never stop poll() from driving the motors
+                print(f"Zone {zone.id}: error handling {event}: {e}")
+
+    def add(self, zone, next_watering):
+        self.zones[zone.id] = zone
+        self.schedule(zone, next_watering)
+
+    def get(self, zone_id):
+        return self.zones.get(zone_id)
+
+    def schedule(self, zone, next_watering):
+        """Start the zone's schedule over from next_watering."""
+        zone.anchor = next_watering
+        zone.catch_up = 0
+        self._push(zone, next_watering)
+
+    def _push(self, zone, next_watering):
+        zone.next_watering = next_watering
+        zone.generation += 1
+        heapq.heappush(self.heap, (next_watering, zone.generation, zone.id))
+
+    def _peek(self):
+        heap = self.heap
+        while heap:
+            due, generation, zone_id = heap[0]
+            zone = self.zones.get(zone_id)
+            if zone is not None and zone.generation == generation:
+                return due, zone
+            heapq.heappop(heap)
+        return None, None
+
+    def next_due(self):
+        return self._peek()[0]
+
+    def tick(self, now):
+        """Start every zone that is due and reschedule it. Returns the zones."""
+        due_zones = []
+        while True:
+            due, zone = self._peek()
+            if zone is None or due > now:
+                break
+            heapq.heappop(self.heap)
+            if self._advance(zone, due, now):
+                self.run(zone, SOURCE_SCHEDULE)
+            due_zones.append(zone)
+        return due_zones
+
+    def _advance(self, zone, due, now):
+        # Moves the zone to its next watering. Returns whether to water now.
+        if zone.catch_up and due < zone.anchor:
+            # A make-up watering from an earlier outage
+            zone.catch_up -= 1
+        else:
+            windows = 0
+            if zone.anchor <= now:
+                windows = (now - zone.anchor) // zone.interval + 1
+                zone.anchor += windows * zone.interval
+            if now - due > MISSED_GRACE:
+                print(f"Zone {zone.id}: missed {max(1, windows)} watering(s), policy {zone.missed}")
+                if zone.missed == MISSED_SKIP:
+                    self._push(zone, zone.anchor)
+                    return False
+                if zone.missed == MISSED_ALL:
+                    zone.catch_up = min(windows - 1, MAX_CATCH_UP) if windows > 1 else 0
+        if zone.catch_up and now + zone.catch_up_spacing < zone.anchor:
+            self._push(zone, now + zone.catch_up_spacing)
+        else:
+            zone.catch_up = 0
+            self._push(zone, zone.anchor)
+        return True
+
+    def run(self, zone, source=SOURCE_MANUAL):
+        """Start a watering cycle now, or queue it behind its supply."""
+        if self.active.get(zone.supply) is zone or zone in self.waiting.get(zone.supply, ()):
+            return False
+        zone.source = source
+        if zone.supply in self.active:
+            self.waiting.setdefault(zone.supply, []).append(zone)
+            return True
+        return self._start(zone)
+
+    def _start(self, zone):
+        if not zone.motor.start(zone.duration):
+            return False
+        self.active[zone.supply] = zone
+        self._notify('watering_started', zone)
+        return True
+
+    def stop(self, zone):
+        queue = self.waiting.get(zone.supply)
+        if queue and zone in queue:
+            queue.remove(zone)
+            return True
+        return zone.motor.stop()
+
+    def busy(self):
+        return bool(self.active)
+
+    def poll(self):
+        """Advance the running motors and start queued zones as supplies free up."""
+        for supply, zone in list(self.active.items()):
+            if zone.motor.poll() != IDLE:
+                continue
+            del self.active[supply]
+            self._notify('watering_finished', zone)
+            queue = self.waiting.get(supply)
+            while queue:
+                if self._start(queue.pop(0)):
+                    break
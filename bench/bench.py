@@ -0,0 +1,342 @@
+# bench.py - Latency, throughput, scheduler drift and memory benchmarks
+#
+#   python bench/bench.py [--requests N] [--concurrency C] [--days D] [--output FILE]
+#
+# Both firmware variants run on CPython with the sim/ stand-ins. Latency and
+# requests per second are measured over real sockets against a server in a
+# child process. main_keepalive is api/main.py again, with each client
+# reusing one persistent connection instead of connecting per request.
+# Drift and per-request memory are measured in worker processes: drift
+# runs api/main.py on the virtual clock for D simulated days, memory
+# pushes single requests through the request path under tracemalloc.
+# Results are printed as JSON and written to FILE if given.
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SIM = os.path.join(ROOT, 'sim')
+API = os.path.join(ROOT, 'api')
+
+ENDPOINTS = (
+    ('GET', '/watering_info', b''),
+    ('POST', '/update_watering', b'{"duration": 5, "delay": 1}'),
+    ('POST', '/start_motor', b''),
+)
+
+# How each target is started: module directory, clock speed, code with
+# {port} filled in and whether clients keep their connection open.
+# motor_api.py sleeps a simulated second between requests, so it runs on a
+# fast clock.
+MAIN_CODE = "import asyncio, main; main.PORT = {port}; asyncio.run(main.main())"
+TARGETS = {
+    'main': (API, '1', MAIN_CODE, False),
+    'main_keepalive': (API, '1', MAIN_CODE, True),
+    'motor_api': (ROOT, '1000', "import motor_api; motor_api.PORT = {port}; motor_api.main()", False),
+}
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def encode_request(method, path, body, keep_alive=False):
+    version = "HTTP/1.1\r\nConnection: keep-alive" if keep_alive else "HTTP/1.0"
+    return (
+        f"{method} {path} {version}\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+def is_ok(response):
+    return response[:7] == b'HTTP/1.' and response[9:10] == b'2'
+
+async def timed_request(port, request):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, is_ok(response)
+
+async def timed_keepalive_request(conn, port, request):
+    # conn is [reader, writer], opened on first use and again whenever the server closes it
+    started = time.perf_counter()
+    if conn[0] is None:
+        conn[:] = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = conn
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = 0
+    close = False
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection':
+            close = value.strip().lower() == b'close'
+    await reader.readexactly(length)
+    if close:
+        writer.close()
+        conn[:] = [None, None]
+    return time.perf_counter() - started, is_ok(head)
+
+async def load(port, request, count, concurrency, keep_alive=False):
+    latencies = []
+    errors = 0
+    remaining = count
+
+    async def client():
+        nonlocal remaining, errors
+        conn = [None, None]
+        while remaining > 0:
+            remaining -= 1
+            try:
+                if keep_alive:
+                    elapsed, ok = await timed_keepalive_request(conn, port, request)
+                else:
+                    elapsed, ok = await timed_request(port, request)
+            except (OSError, EOFError):
+                errors += 1
+                if conn[1] is not None:
+                    conn[1].close()
+                conn[:] = [None, None]
+                continue
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+        if conn[1] is not None:
+            conn[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "rps": round(len(latencies) / wall, 1)
+    }
+
+def wait_for_port(port, proc, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with {proc.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Server did not start")
+
+def bench_http(target, count, concurrency):
+    path, speed, code, keep_alive = TARGETS[target]
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((SIM, path)), SIM_SPEED=speed)
+    proc = subprocess.Popen(
+        [sys.executable, '-c', code.format(port=port)],
+        cwd=tempfile.mkdtemp(prefix='pico-bench-'), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(port, proc)
+        results = {}
+        for method, path, body in ENDPOINTS:
+            request = encode_request(method, path, body, keep_alive)
+            results[path] = asyncio.run(load(port, request, count, concurrency, keep_alive))
+        return results
+    finally:
+        proc.kill()
+        proc.wait()
+
+def run_worker(name, *args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((SIM, API)), SIM_SPEED='0')
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', name] + [str(a) for a in args],
+        cwd=tempfile.mkdtemp(prefix='pico-bench-'), env=env, capture_output=True, check=True
+    )
+    return json.loads(out.stdout.decode().strip().splitlines()[-1])
+
+# Workers run with sim/ and api/ on the path, the root motor_api.py is loaded by file
+
+def worker_drift(days):
+    import machine
+    import main
+    import utime
+
+    main.PORT = free_port()
+    interval = 86400
+
+    async def run():
+        asyncio.create_task(main.main())
+        await asyncio.sleep(1)
+        main.update_watering_schedule(5, interval / 86400)
+        first_due = main.default_zone.next_watering
+        await asyncio.sleep(days * 86400)
+        return first_due
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.monotonic()
+        first_due = asyncio.run(run())
+        host_seconds = time.monotonic() - started
+    dir1 = main.default_zone.pins[1]
+    starts = [int(entry[0] + utime.clock_offset) for entry in machine.pin_trace(dir1, 'pin') if entry[3]]
+    # Lateness of each run against the schedule it was due on, and against
+    # the grid the first run set up
+    late = [start - (first_due + k * interval) for k, start in enumerate(starts)]
+    steps = [late[0]] + [b - a for a, b in zip(late, late[1:])] if late else []
+    return {
+        "simulated_days": days,
+        "host_seconds": round(host_seconds, 2),
+        "waterings": len(starts),
+        "max_step_s": max(steps) if steps else None,
+        "drift_s": late[-1] if late else None
+    }
+
+class _FakeWriter:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data.extend(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return ('bench', 0)
+
+class _FakeSocket:
+    def __init__(self, data):
+        self.data = data
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, n):
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
+
+async def _measure(fn, count):
+    # fn returns an awaitable or None; each call is one request
+    peaks = []
+    await _call(fn)  # Warm caches so they don't count against the first request
+    tracemalloc.start()
+    for _ in range(count):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await _call(fn)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return {"p50_bytes": percentile(peaks, 50), "max_bytes": max(peaks)}
+
+async def _call(fn):
+    result = fn()
+    if result is not None:
+        await result
+
+def worker_memory(count):
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        import webserver
+
+        def serve(request):
+            async def go():
+                reader = asyncio.StreamReader()
+                reader.feed_data(request)
+                reader.feed_eof()
+                await webserver.serve_client(reader, _FakeWriter(), main.app)
+            return go
+
+        async def measure_main():
+            return {
+                path: await _measure(serve(encode_request(method, path, body)), count)
+                for method, path, body in ENDPOINTS
+            }
+
+        for zone in main.zone_list:
+            main.scheduler.add(zone, main.utime.time() + zone.interval)
+        results['main'] = asyncio.run(measure_main())
+
+        spec = importlib.util.spec_from_file_location('motor_api', os.path.join(ROOT, 'motor_api.py'))
+        motor_api = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(motor_api)
+
+        def legacy(request):
+            def go():
+                data = motor_api.read_request(_FakeSocket(request))
+                motor_api.handle_request(data)
+            return go
+
+        async def measure_legacy():
+            return {
+                path: await _measure(legacy(encode_request(method, path, body)), count)
+                for method, path, body in ENDPOINTS
+            }
+
+        results['motor_api'] = asyncio.run(measure_legacy())
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--days', type=int, default=30, help='simulated days for the drift run')
+    parser.add_argument('--targets', default='main,main_keepalive,motor_api')
+    parser.add_argument('--output')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('worker_args', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker = {'drift': worker_drift, 'memory': worker_memory}[args.worker]
+        print(json.dumps(worker(*[int(a) for a in args.worker_args])))
+        return
+
+    targets = args.targets.split(',')
+    results = {
+        "time": int(time.time()),
+        "python": platform.python_version(),
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "days": args.days},
+        "latency": {target: bench_http(target, args.requests, args.concurrency) for target in targets},
+        "memory": run_worker('memory', min(args.requests, 200)),
+        "drift": run_worker('drift', args.days),
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
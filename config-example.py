@@ -1,2 +1,23 @@
 ssid = 'YOUR SSID'
-password = 'YOUR PASSWORD'
\ No newline at end of file
+password = 'YOUR PASSWORD'
+
+# Name the board announces when a gateway or dashboard looks for devices (up to 16 characters)
+name = ''
+
+# Sleep between waterings: None, 'light' or 'deep' (deep needs DS3231 INT/SQW wired to RUN)
+low_power = None
+
+# Waterings missed while the board was off: 'once' waters once on boot, 'skip' waits for
+# the next scheduled time, 'all' makes up each one an hour apart (at most 4)
+missed_watering = 'once'
+
+# Run the scheduler and pumps on the second core, apart from Wi-Fi and the web server.
+# Ignored with low_power
+dual_core = False
+
+# Optional zones, each with its own pump channel. A zone can also water when its
+# capacitive soil-moisture sensor (ADC pin, powered from a GPIO while sampling) reads dry:
+# zones = [
+#     {"id": 0, "pins": (16, 14, 15), "duration": 10, "delay": 14,
+#      "moisture": {"adc": 26, "power": 22, "dry": 50000, "wet": 20000, "low": 30, "high": 45}},
+# ]
@@ -0,0 +1,23 @@
+export const dynamic = "force-dynamic";
+
+export async function GET() {
+  const encoder = new TextEncoder();
+  let timer;
+  const stream = new ReadableStream({
+    start(controller) {
+      const heartbeat = () =>
+        controller.enqueue(encoder.encode("event: heartbeat\ndata: {}\n\n"));
+      heartbeat();
+      timer = setInterval(heartbeat, 15000);
+    },
+    cancel() {
+      clearInterval(timer);
+    },
+  });
+  return new Response(stream, {
+    headers: {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache",
+    },
+  });
+}
@@ -1,5 +1,5 @@
 "use client";
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Label } from "@/components/ui/label";
 import { Input } from "@/components/ui/input";
 import { Button } from "@/components/ui/button";
@@ -18,15 +18,28 @@ export default function Component() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [backendStatus, setBackendStatus] = useState("Checking...");
+  const zoneId = useRef(null); // Zone shown on the dashboard, set by /watering_info
 
   useEffect(() => {
     checkBackendStatus();
     fetchWateringInfo();
-    const interval = setInterval(() => {
-      checkBackendStatus();
-      fetchWateringInfo();
-    }, 60000); // Check every minute
-    return () => clearInterval(interval);
+    // The Pico pushes schedule changes and heartbeats over one long-lived connection
+    const events = new EventSource(`${API_URL}/events`);
+    events.onopen = () => setBackendStatus("Online");
+    events.onerror = () => setBackendStatus("Offline");
+    events.addEventListener("schedule_updated", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.zone === zoneId.current) {
+        updateStateWithWateringInfo(data);
+      }
+    });
+    events.addEventListener("heartbeat", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.time_remaining !== undefined) {
+        setTimeRemaining(data.time_remaining);
+      }
+    });
+    return () => events.close();
   }, []);
 
   useEffect(() => {
@@ -38,7 +51,7 @@ export default function Component() {
 
   const checkBackendStatus = async () => {
     try {
-      const response = await fetch(`${API_URL}/watering_info`);
+      const response = await fetch(`${API_URL}/health`, { method: "HEAD" });
       setBackendStatus(response.ok ? "Online" : "Offline");
     } catch (err) {
       setBackendStatus("Offline");
@@ -47,7 +60,10 @@ export default function Component() {
 
   const fetchWateringInfo = async () => {
     try {
-      const response = await fetch(`${API_URL}/watering_info`);
+      // Always a full fetch, the countdown in the body moves even when the ETag doesn't
+      const response = await fetch(`${API_URL}/watering_info`, {
+        cache: "no-store",
+      });
       const data = await response.json();
       updateStateWithWateringInfo(data);
     } catch (err) {
@@ -80,6 +96,9 @@ export default function Component() {
   };
 
   const updateStateWithWateringInfo = (data) => {
+    if (data.zone !== undefined) {
+      zoneId.current = data.zone;
+    }
     setDuration(data.duration.toString());
     setDelay(data.delay.toString());
     setTimeRemaining(data.time_remaining);
@@ -0,0 +1,157 @@
+# client.py - Pooled, rate-limited HTTP client for one Pico
+#
+# Each device gets one DeviceClient. At most POOL_SIZE requests are in
+# flight to it at once, the rest wait their turn, and requests are spaced
+# by a token bucket so a burst from the gateway can't swamp the board.
+# Connections the device keeps alive are parked and reused, ones it
+# closes are simply reopened.
+
+import asyncio
+import json
+import time
+
+POOL_SIZE = 2  # Requests in flight per device, the firmware serves clients one at a time
+RATE = 5.0  # Requests per second per device, sustained
+BURST = 5  # Requests a device can take back to back
+CONNECT_TIMEOUT = 3  # Seconds
+REQUEST_TIMEOUT = 5  # Seconds for a whole request, connect included
+MAX_BODY = 64 * 1024  # Bytes, a device answer bigger than this is an error
+
+class DeviceError(Exception):
+    """The device could not be reached or sent back something unreadable."""
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waited = 0.0  # Seconds requests spent held back, in total
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers  # Lower-case names
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+class DeviceClient:
+    def __init__(self, host, port, pool_size=POOL_SIZE, rate=RATE, burst=BURST):
+        self.host = host
+        self.port = port
+        self.slots = asyncio.Semaphore(pool_size)
+        self.bucket = TokenBucket(rate, burst)
+        self.idle = []  # (reader, writer) kept alive by the device
+        self.requests = 0
+        self.errors = 0
+        self.connects = 0
+        self.reused = 0
+
+    async def request(self, method, path, body=b'', headers=None):
+        async with self.slots:
+            await self.bucket.take()
+            self.requests += 1
+            try:
+                return await asyncio.wait_for(self._exchange(method, path, body, headers), REQUEST_TIMEOUT)
+            except (OSError, EOFError, asyncio.TimeoutError, ValueError) as e:
+                # EOFError covers asyncio.IncompleteReadError, a device closing mid-body
+                self.errors += 1
+                raise DeviceError(f"{self.host}:{self.port}: {e or type(e).__name__}")
+
+    async def _exchange(self, method, path, body, headers):
+        data = self._encode(method, path, body, headers)
+        while self.idle:
+            reader, writer = self.idle.pop()
+            try:
+                response = await self._send(reader, writer, data)
+            except (OSError, ValueError):
+                writer.close()  # The device dropped it while parked, try the next one
+                continue
+            self.reused += 1
+            return response
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        self.connects += 1
+        return await self._send(reader, writer, data)
+
+    def _encode(self, method, path, body, headers):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", "Connection: keep-alive"]
+        if body:
+            lines.append("Content-Type: application/json")
+        lines.append(f"Content-Length: {len(body)}")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+    async def _send(self, reader, writer, data):
+        try:
+            writer.write(data)
+            await writer.drain()
+            response, keep = await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+        if keep:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ValueError("connection closed before a response")
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get('content-length')
+        if int(status) in (204, 304):
+            length = 0  # Never a body, and the board sends no Content-Length for them
+            body = b''
+        elif length is not None:
+            length = int(length)
+            if length > MAX_BODY:
+                raise ValueError("response too large")
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read(MAX_BODY + 1)  # Delimited by the device closing
+            if len(body) > MAX_BODY:
+                raise ValueError("response too large")
+        connection = headers.get('connection', '').lower()
+        if version == b'HTTP/1.1':
+            keep = connection != 'close' and length is not None
+        else:
+            keep = connection == 'keep-alive' and length is not None
+        return Response(int(status), headers, body), keep
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connects": self.connects,
+            "reused": self.reused,
+            "idle": len(self.idle),
+            "rate_limited_s": round(self.bucket.waited, 3)
+        }
@@ -0,0 +1,131 @@
+# discovery.py - Find boards and read their status over UDP
+#
+#   python gateway/discovery.py [--target HOST[:PORT[-LAST]]] [--status]
+#
+# Host side of the firmware's UDP channel (api/udp.py): the formats here
+# mirror the ones there. A DISCOVER probe, usually broadcast, is answered
+# by every board with an ANNOUNCE. A STATUS_REQUEST is answered with one
+# fixed-layout STATUS datagram, much cheaper than an HTTP exchange.
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import struct
+
+MAGIC = b'PW'
+VERSION = 1
+DISCOVER = 1
+ANNOUNCE = 2
+STATUS_REQUEST = 3
+STATUS = 4
+
+DEFAULT_ZONE = 0xFF
+REQUEST_FORMAT = '<2sBBHB'
+ANNOUNCE_FORMAT = '<2sBBHHHB16s'
+STATUS_FORMAT = '<2sBBHHBBIIIIHII'
+MOTOR_STATES = ('idle', 'forward', 'reverse', 'cooldown')
+
+PORT = 8080  # The firmware answers UDP on its HTTP port number
+BROADCAST = '255.255.255.255'
+DISCOVERY_WAIT = 1.0  # Seconds to collect announcements
+STATUS_TIMEOUT = 0.5  # Seconds to wait for one status reply
+
+def parse_target(target):
+    """'host[:port[-last]]' -> (host, [ports])."""
+    host, _, ports = target.partition(':')
+    if not ports:
+        return host or BROADCAST, [PORT]
+    first, _, last = ports.partition('-')
+    return host or BROADCAST, list(range(int(first), int(last or first) + 1))
+
+def request(kind, seq, zone=DEFAULT_ZONE):
+    return struct.pack(REQUEST_FORMAT, MAGIC, VERSION, kind, seq, zone)
+
+def parse_announce(data, ip):
+    magic, version, kind, seq, boot_id, http_port, zones, name = struct.unpack(ANNOUNCE_FORMAT, data)
+    name = name.rstrip(b'\0').decode() or None
+    address = f"{ip}:{http_port}"
+    return {"name": name or address, "address": address, "boot_id": boot_id, "zones": zones}
+
+def parse_status(data):
+    (magic, version, kind, seq, boot_id, zone, motor, schedule_version, next_watering,
+     time_remaining, interval, duration, uptime, heap_free) = struct.unpack(STATUS_FORMAT, data)
+    return {
+        "boot_id": boot_id,
+        "zone": zone,
+        "motor": MOTOR_STATES[motor] if motor < len(MOTOR_STATES) else None,
+        "version": schedule_version,
+        "next_watering": next_watering,
+        "time_remaining": time_remaining,
+        "interval": interval,
+        "duration": duration,
+        "uptime": uptime,
+        "heap_free": heap_free or None
+    }
+
+class _Collector(asyncio.DatagramProtocol):
+    def __init__(self, kind, seq):
+        self.kind = kind
+        self.seq = seq
+        self.replies = []  # (data, (ip, port))
+        self.received = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 6 and data[:2] == MAGIC and data[3] == self.kind and data[4] | data[5] << 8 == self.seq:
+            self.replies.append((data, addr))
+            self.received.set()
+
+async def _exchange(targets, kind, reply_kind, zone, wait, first_only=False):
+    loop = asyncio.get_running_loop()
+    seq = random.getrandbits(16)
+    transport, collector = await loop.create_datagram_endpoint(
+        lambda: _Collector(reply_kind, seq), local_addr=('0.0.0.0', 0), allow_broadcast=True)
+    try:
+        data = request(kind, seq, zone)
+        for host, ports in targets:
+            for port in ports:
+                transport.sendto(data, (host, port))
+        if first_only:
+            await asyncio.wait_for(collector.received.wait(), wait)
+        else:
+            await asyncio.sleep(wait)
+    finally:
+        transport.close()
+    return collector.replies
+
+async def discover(targets=((BROADCAST, [PORT]),), wait=DISCOVERY_WAIT):
+    """Every board that answered a DISCOVER sent to targets, as registry entries."""
+    found = {}
+    for data, (ip, _) in await _exchange(targets, DISCOVER, ANNOUNCE, DEFAULT_ZONE, wait):
+        try:
+            device = parse_announce(data, ip)
+        except (struct.error, UnicodeError):
+            continue
+        found[device["address"]] = device
+    return list(found.values())
+
+async def status(host, port=PORT, zone=DEFAULT_ZONE, timeout=STATUS_TIMEOUT):
+    """One board's status, raises asyncio.TimeoutError if it doesn't answer."""
+    replies = await _exchange(((host, [port]),), STATUS_REQUEST, STATUS, zone, timeout, first_only=True)
+    return parse_status(replies[0][0])
+
+async def main(args):
+    targets = [parse_target(target) for target in args.target or [BROADCAST]]
+    devices = await discover(targets, args.wait)
+    if args.status:
+        for device in devices:
+            host, _, port = device["address"].rpartition(':')
+            try:
+                device["status"] = await status(host, int(port))
+            except (asyncio.TimeoutError, struct.error):
+                device["status"] = None
+    print(json.dumps(devices, indent=2))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', action='append', help="host[:port[-last]] to probe, default the broadcast address")
+    parser.add_argument('--wait', type=float, default=DISCOVERY_WAIT, help="seconds to collect announcements")
+    parser.add_argument('--status', action='store_true', help="also read each board's status")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,363 @@
+# gateway.py - One API in front of many Picos
+#
+#   python gateway/gateway.py [--port 8000] [--devices devices.json] [--scan CIDR[:PORT]]
+#                             [--discover HOST[:PORT[-LAST]]] [--refresh 30]
+#
+# Keeps a registry of devices, refreshes a cached copy of each one's
+# /watering_info in the background and serves it from memory, so browser
+# tabs poll the gateway instead of every board. Commands are fanned out to
+# the chosen devices concurrently, through each device's pooled,
+# rate-limited DeviceClient. Runs on CPython only.
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import discovery
+from client import DeviceClient, DeviceError
+
+PORT = 8000
+DEVICE_PORT = 8080  # Where the firmware listens when an address leaves the port out
+REFRESH_INTERVAL = 30  # Seconds between /watering_info refreshes
+SCAN_TIMEOUT = 1  # Seconds a scanned address gets to answer
+SCAN_CONCURRENCY = 64  # Addresses probed at once
+MAX_SCAN_ADDRESSES = 1024  # A /22, wider networks are refused
+MAX_REQUEST = 16 * 1024  # Bytes, bigger requests to the gateway are refused
+COMMANDS = ('/update_watering', '/start_motor', '/stop_motor')
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+CORS_HEADERS = (
+    "Access-Control-Allow-Origin: *\r\n"
+    "Access-Control-Allow-Methods: GET, POST, DELETE, OPTIONS\r\n"
+    "Access-Control-Allow-Headers: Content-Type\r\n"
+    "Access-Control-Max-Age: 86400\r\n"
+)
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def split_address(address):
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, DEVICE_PORT
+    return host, int(port)
+
+class Device:
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.client = DeviceClient(*split_address(address))
+        self.info = None  # Last /watering_info body
+        self.etag = None
+        self.info_at = None  # time.monotonic() the body was sent, a 304 doesn't move it
+        self.fetched_at = None  # time.monotonic() of the last good answer
+        self.error = None  # Why the last refresh failed, None if it didn't
+
+    async def refresh(self):
+        headers = {"If-None-Match": self.etag} if self.etag else None
+        try:
+            response = await self.client.request('GET', '/watering_info', headers=headers)
+            if response.status == 200:
+                self.info = response.json()
+                self.etag = response.headers.get('etag')
+                self.info_at = time.monotonic()
+            elif response.status != 304:
+                raise DeviceError(f"/watering_info answered {response.status}")
+        except (DeviceError, ValueError) as e:
+            self.error = str(e)
+            return False
+        self.fetched_at = time.monotonic()
+        self.error = None
+        return True
+
+    def status(self, now):
+        info = None
+        age = None
+        if self.info is not None:
+            age = now - self.fetched_at
+            info = dict(self.info)
+            # The countdown keeps running from when the body was sent, however often it was confirmed since
+            if info.get('time_remaining') is not None:
+                info['time_remaining'] = max(0, info['time_remaining'] - int(now - self.info_at))
+        return {
+            "name": self.name,
+            "address": self.address,
+            "online": self.error is None and self.fetched_at is not None,
+            "error": self.error,
+            "age_s": round(age, 1) if age is not None else None,
+            "watering_info": info
+        }
+
+class Gateway:
+    def __init__(self, path=None, refresh_interval=REFRESH_INTERVAL):
+        self.path = path  # JSON file the registry is kept in, None to keep it in memory only
+        self.refresh_interval = refresh_interval
+        self.devices = {}  # name -> Device
+        self.refreshes = 0
+
+    async def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for entry in json.load(f).get('devices', ()):
+                await self.add(entry['name'], entry['address'], save=False)
+
+    def save(self):
+        if not self.path:
+            return
+        devices = [{"name": d.name, "address": d.address} for d in self.devices.values()]
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({"devices": devices}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    async def add(self, name, address, save=True):
+        device = self.devices.get(name)
+        if device is not None:
+            if device.address == address:
+                return device
+            await device.client.close()  # Its pooled connections go to the old address
+        device = Device(name, address)
+        self.devices[name] = device
+        if save:
+            self.save()
+        return device
+
+    async def remove(self, name):
+        device = self.devices.pop(name, None)
+        if device is None:
+            return False
+        await device.client.close()
+        self.save()
+        return True
+
+    def select(self, names):
+        """The devices named in a comma-separated list, all of them for None."""
+        if not names:
+            return list(self.devices.values())
+        selected = []
+        for name in names.split(','):
+            device = self.devices.get(name)
+            if device is None:
+                raise HTTPError(404, f"Unknown device {name}")
+            selected.append(device)
+        return selected
+
+    async def refresh(self, devices=None):
+        devices = list(self.devices.values()) if devices is None else devices
+        results = await asyncio.gather(*(device.refresh() for device in devices), return_exceptions=True)
+        for device, result in zip(devices, results):
+            if isinstance(result, Exception):
+                # Not a device error, those are caught in refresh(), but one device mustn't stop the rest
+                print(f"Refreshing {device.name} failed: {result!r}")
+                device.error = str(result) or type(result).__name__
+        self.refreshes += 1
+
+    async def refresh_task(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    async def fan_out(self, devices, method, path, body):
+        async def send(device):
+            try:
+                response = await device.client.request(method, path, body)
+                result = {"status": response.status, "body": response.json()}
+            except (DeviceError, ValueError) as e:
+                return {"status": None, "error": str(e)}
+            if path == '/update_watering' and response.status == 200:
+                await device.refresh()
+            return result
+
+        results = await asyncio.gather(*(send(device) for device in devices))
+        return {device.name: result for device, result in zip(devices, results)}
+
+    async def scan(self, network, port=DEVICE_PORT):
+        """Register every address in network that answers HEAD /health like the firmware."""
+        network = ipaddress.ip_network(network, strict=False)
+        if network.num_addresses > MAX_SCAN_ADDRESSES:
+            raise ValueError(f"{network} has more than {MAX_SCAN_ADDRESSES} addresses")
+        hosts = iter(network)
+        found = []
+
+        async def probe(host):
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), SCAN_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                return None
+            try:
+                writer.write(b"HEAD /health HTTP/1.0\r\n\r\n")
+                await writer.drain()
+                line = await asyncio.wait_for(reader.readline(), SCAN_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                return None
+            finally:
+                writer.close()
+            return f"{host}:{port}" if line.split()[1:2] == [b'204'] else None
+
+        async def worker():
+            # A fixed set of workers share the addresses, so only SCAN_CONCURRENCY probes exist at once
+            for host in hosts:
+                found.append(await probe(str(host)))
+
+        await asyncio.gather(*(worker() for _ in range(min(SCAN_CONCURRENCY, network.num_addresses))))
+        added = []
+        known = {device.address for device in self.devices.values()}
+        for address in sorted(filter(None, found), key=lambda a: ipaddress.ip_address(a.rpartition(':')[0])):
+            if address not in known:
+                await self.add(address, address)
+                added.append(address)
+        return added
+
+    async def discover(self, targets):
+        """Register every board that answers a UDP discovery probe sent to targets."""
+        added = []
+        known = {device.address for device in self.devices.values()}
+        for found in await discovery.discover(targets):
+            if found["address"] in known:
+                continue
+            name = found["name"] if found["name"] not in self.devices else found["address"]
+            await self.add(name, found["address"])
+            added.append(name)
+        return added
+
+    async def handle(self, method, path, query, body):
+        now = time.monotonic()
+        if path == '/devices':
+            if method == 'GET':
+                return {"devices": [device.status(now) for device in self.devices.values()]}
+            if method == 'POST':
+                data = parse_json(body)
+                if not isinstance(data, dict) or not data.get('address'):
+                    raise HTTPError(400, "address is required")
+                device = await self.add(str(data.get('name') or data['address']), str(data['address']))
+                await device.refresh()
+                return device.status(time.monotonic())
+            if method == 'DELETE':
+                if not await self.remove(query.get('name', '')):
+                    raise HTTPError(404, "Unknown device")
+                return {"removed": query['name']}
+            raise HTTPError(405, "Method not allowed")
+        if path == '/watering_info' and method == 'GET':
+            return {"devices": {device.name: device.status(now) for device in self.select(query.get('device'))}}
+        if path in COMMANDS and method == 'POST':
+            # The body goes to every device as is, each answers for itself
+            return {"results": await self.fan_out(self.select(query.get('device')), 'POST', path, body)}
+        if path == '/scan' and method == 'POST':
+            if 'network' not in query:
+                raise HTTPError(400, "network is required")
+            try:
+                return {"added": await self.scan(query['network'], int(query.get('port', DEVICE_PORT)))}
+            except ValueError as e:
+                raise HTTPError(400, f"Invalid network or port: {e}")
+        if path == '/discover' and method == 'POST':
+            try:
+                target = discovery.parse_target(query.get('target', discovery.BROADCAST))
+            except ValueError:
+                raise HTTPError(400, "Invalid target")
+            return {"added": await self.discover([target])}
+        if path == '/stats' and method == 'GET':
+            return {
+                "refreshes": self.refreshes,
+                "devices": {device.name: device.client.stats() for device in self.devices.values()}
+            }
+        raise HTTPError(404, "Not found")
+
+def parse_json(body):
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON")
+
+def encode_response(status, data=None):
+    body = json.dumps(data).encode() if data is not None else b''
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n{CORS_HEADERS}Connection: close\r\n"
+    if body:
+        head += "Content-Type: application/json\r\n"
+    return (head + f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target = request_line.decode('latin-1').split()[:2]
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length > MAX_REQUEST:
+        raise HTTPError(413, "Request too large")
+    body = await reader.readexactly(length) if length else b''
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return method, url.path, query, body
+
+async def serve_client(gateway, reader, writer):
+    try:
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, query, body = request
+            if method == 'OPTIONS':
+                writer.write(encode_response(204))
+            else:
+                writer.write(encode_response(200, await gateway.handle(method, path, query, body)))
+        except HTTPError as e:
+            writer.write(encode_response(e.status, {"error": e.message}))
+        except (ValueError, asyncio.IncompleteReadError):
+            writer.write(encode_response(400, {"error": "Bad request"}))
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            writer.write(encode_response(500, {"error": "Internal error"}))
+        await writer.drain()
+    except OSError:
+        pass  # Client went away
+    finally:
+        writer.close()
+
+async def main(args):
+    gateway = Gateway(args.devices, args.refresh)
+    await gateway.load()
+    for address in args.device:
+        await gateway.add(address, address)
+    for network in args.scan:
+        network, _, port = network.partition(':')
+        added = await gateway.scan(network, int(port or DEVICE_PORT))
+        print(f"Scan of {network} found {len(added)} new devices")
+    if args.discover:
+        added = await gateway.discover([discovery.parse_target(target) for target in args.discover])
+        print(f"Discovery found {len(added)} new devices")
+    asyncio.create_task(gateway.refresh_task())
+    server = await asyncio.start_server(lambda r, w: serve_client(gateway, r, w), args.host, args.port)
+    print(f"Gateway for {len(gateway.devices)} devices on http://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--devices', help="json file to keep the device registry in")
+    parser.add_argument('--device', action='append', default=[], help="host[:port] to register, repeatable")
+    parser.add_argument('--scan', action='append', default=[], help="CIDR[:port] to probe for devices, repeatable")
+    parser.add_argument('--discover', action='append', default=[],
+                        help="host[:port[-last]] to send UDP discovery probes to, repeatable")
+    parser.add_argument('--refresh', type=float, default=REFRESH_INTERVAL, help="seconds between refreshes")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
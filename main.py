@@ -20,19 +20,19 @@ run_time = 20
 delay_time = 1209600
 motor_lock = _thread.allocate_lock()
 exit_flag = False
-last_watering_time = 0
+next_watering_time = 0  # Waterings fall on this plus whole multiples of delay_time
 
 def motor_control():
-    global run_time, delay_time, exit_flag, last_watering_time
+    global run_time, delay_time, exit_flag, next_watering_time
     pwm = PWM(speed_gp)
     pwm.freq(50)
+    next_watering_time = time.time()
     while not exit_flag:
         with motor_lock:
             current_run_time = run_time
             current_delay_time = delay_time
         
         if current_run_time > 0:
-            last_watering_time = time.time()  # Update last watering time
             # Forward direction
             print("Starting motor forward")
             dir1_gp.value(1)
@@ -58,8 +58,10 @@ def motor_control():
             dir2_gp.value(0)
             print("Stopping motor")
         
-        start_time = time.time()
-        while time.time() - start_time < current_delay_time and not exit_flag:
+        # Stay on the original schedule however long the run took, skipping windows already past
+        current_time = time.time()
+        next_watering_time += ((current_time - next_watering_time) // current_delay_time + 1) * current_delay_time
+        while time.time() < next_watering_time and not exit_flag:
             time.sleep(1)
     
     print("Motor control thread exiting")
@@ -97,10 +99,9 @@ def validate_input(value, min_value=1, max_value=None):
         return None
 
 def calculate_time_remaining():
-    global last_watering_time, delay_time
+    global next_watering_time
     current_time = time.time()
-    elapsed_time = current_time - last_watering_time
-    remaining_time = max(0, delay_time - elapsed_time)
+    remaining_time = max(0, next_watering_time - current_time)
     
     days, remainder = divmod(int(remaining_time), 86400)
     hours, remainder = divmod(remainder, 3600)
@@ -109,7 +110,7 @@ def calculate_time_remaining():
     return f"{days} days, {hours:02d}:{minutes:02d}:{seconds:02d}"
 
 def main():
-    global run_time, delay_time, exit_flag, last_watering_time
+    global run_time, delay_time, exit_flag
     
     ip = connect_wifi()
     
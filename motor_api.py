@@ -6,9 +6,13 @@ from machine import Pin, PWM, RTC
 import json
 import config
 
-utime.sleep(2)  # Wait for 2 seconds before starting
-
 PORT = 8080  # Choose an unused port
+MAX_HEADER_SIZE = 1024  # Request line and headers
+MAX_BODY_SIZE = 512
+REQUEST_TIMEOUT = 5  # Seconds a client gets to deliver a complete request
+BACKLOG = 4  # Clients that can queue for the server, all of them are served on each pass
+WIFI_RETRY_MIN = 2  # Seconds before retrying a failed connection, doubled on every failure
+WIFI_RETRY_MAX = 300
 
 # Motor control setup with L293D
 pwmPIN = 16
@@ -21,6 +25,9 @@ dir1_gp = Pin(dir1Pin, Pin.OUT)
 dir2_gp = Pin(dir2Pin, Pin.OUT)
 speed_gp.freq(50)  # Set PWM frequency to 50Hz
 
+# Request buffer, reused for every client
+request_buf = bytearray(MAX_HEADER_SIZE + 4 + MAX_BODY_SIZE)  # The body starts after the blank line
+
 # RTC setup
 rtc = RTC()
 
@@ -30,6 +37,11 @@ watering_delay = 86400  # Default 1 day in seconds
 next_watering_time = utime.time() + watering_delay
 last_sync_time = 0
 
+# Wi-Fi state, the main loop never waits on the network
+wlan = network.WLAN(network.STA_IF)
+wifi_failures = 0
+wifi_retry_at = utime.ticks_ms()
+
 # Sync time with NTP server after connecting to WiFi
 def sync_time():
     try:
@@ -41,28 +53,26 @@ def sync_time():
 def check_and_sync_time():
     global last_sync_time
     current_time = utime.time()
-    if current_time - last_sync_time > 86400:  # 86400 seconds in a day
+    if current_time - last_sync_time > 86400 and wlan.isconnected():  # 86400 seconds in a day
         sync_time()
         last_sync_time = current_time
 
-def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
+def check_wifi():
+    # Starts or checks a connection attempt without blocking. Returns the IP once connected.
+    global wifi_failures, wifi_retry_at
+    if wlan.isconnected():
+        wifi_failures = 0
+        return wlan.ifconfig()[0]
+    if utime.ticks_diff(utime.ticks_ms(), wifi_retry_at) < 0:
+        return None
+    if wifi_failures:
+        print(f'Network connection failed (status {wlan.status()}), retrying')
+    delay = min(WIFI_RETRY_MAX, WIFI_RETRY_MIN * 2 ** wifi_failures)
+    wifi_failures += 1
+    wifi_retry_at = utime.ticks_add(utime.ticks_ms(), delay * 1000)
     wlan.active(True)
     wlan.connect(config.ssid, config.password)
-    max_wait = 10
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print('Waiting for connection...')
-        utime.sleep(1)
-    if wlan.status() != 3:
-        raise RuntimeError('Network connection failed')
-    else:
-        print('Connected')
-        status = wlan.ifconfig()
-        print('Device IP:', status[0])
-    return status[0]
+    return None
 
 def run_motor(duration, reverse=False):
     if reverse:
@@ -123,6 +133,48 @@ def update_watering_schedule(duration, delay):
     }
 
 
+def read_request(cl):
+    # Returns the request headers and body, or None if the client was too slow or too big
+    deadline = utime.ticks_add(utime.ticks_ms(), REQUEST_TIMEOUT * 1000)
+    length = 0
+    header_end = -1
+    body_end = None
+    while body_end is None or length < body_end:
+        remaining = utime.ticks_diff(deadline, utime.ticks_ms())
+        if remaining <= 0:
+            return None
+        cl.settimeout(remaining / 1000)
+        limit = len(request_buf) if body_end is None else body_end
+        try:
+            chunk = cl.recv(limit - length)
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        request_buf[length:length + len(chunk)] = chunk
+        length += len(chunk)
+        if header_end < 0:
+            # bytearray has no find() on MicroPython
+            header_end = bytes(memoryview(request_buf)[:length]).find(b"\r\n\r\n")
+            if header_end < 0:
+                if length >= MAX_HEADER_SIZE:
+                    return None
+                continue
+            if header_end > MAX_HEADER_SIZE:
+                return None
+            content_length = 0
+            for line in bytes(request_buf[:header_end]).split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    try:
+                        content_length = int(value)
+                    except ValueError:
+                        return None
+            if content_length < 0 or content_length > MAX_BODY_SIZE:
+                return None
+            body_end = header_end + 4 + content_length
+    return bytes(request_buf[:body_end])
+
 def handle_request(request):
     # Convert request to string if it's bytes
     if isinstance(request, bytes):
@@ -135,12 +187,12 @@ def handle_request(request):
         "Access-Control-Allow-Origin: *\r\n"
         "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
         "Access-Control-Allow-Headers: Content-Type\r\n"
-        "\r\n"
+        "Connection: close\r\n"
     )
 
     # Handle CORS preflight request
     if request.startswith('OPTIONS'):
-        return headers.encode('utf-8')
+        return (headers + "Content-Length: 0\r\n\r\n").encode('utf-8')
 
     response_body = ""
     if 'POST /update_watering' in request:
@@ -170,7 +222,8 @@ def handle_request(request):
         response_body = json.dumps({'error': 'Invalid endpoint'})
     
     # Combine headers and body, then convert to bytes
-    full_response = (headers + response_body).encode('utf-8')
+    body = response_body.encode('utf-8')
+    full_response = (headers + f"Content-Length: {len(body)}\r\n\r\n").encode('utf-8') + body
     return full_response
     
 def check_watering():
@@ -178,7 +231,8 @@ def check_watering():
     current_time = utime.time()
     if current_time >= next_watering_time:
         run_motor(watering_duration)
-        next_watering_time = current_time + watering_delay
+        # Stay on the original schedule however long the run took, skipping windows already past
+        next_watering_time += ((current_time - next_watering_time) // watering_delay + 1) * watering_delay
         
 def start_motor():
     dir1_gp.value(1)
@@ -192,41 +246,45 @@ def stop_motor():
     dir2_gp.value(0)
     return json.dumps({"status": "Motor stopped"})
 
-def main():
-    ip = connect_wifi()
-    
-    sync_time()
-    
-    addr = socket.getaddrinfo('0.0.0.0', 8080)[0][-1]  # Use port 8080
+def open_server(ip):
+    addr = socket.getaddrinfo('0.0.0.0', PORT)[0][-1]
     s = socket.socket()
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind(addr)
-    s.listen(1)
-    print(f'Listening on http://{ip}:8080')
+    s.listen(BACKLOG)
+    s.setblocking(False)  # Non-blocking socket accept
+    print(f'Listening on http://{ip}:{PORT}')
+    return s
+
+def main():
+    s = None
     
     while True:
+        ip = check_wifi()
+        if ip and s is None:
+            # The server attaches once the network is up, watering doesn't wait for it
+            s = open_server(ip)
         check_and_sync_time()
         check_watering()
         
-        # Non-blocking socket accept
-        s.setblocking(False)
-        try:
-            cl, addr = s.accept()
-            print(f'Client connected from {addr}')
-            cl.setblocking(False)
-            request = b""
-            while b"\r\n\r\n" not in request:
+        if s is not None:
+            # Everyone who queued up during the last second, not just the first one
+            for _ in range(BACKLOG):
+                try:
+                    cl, addr = s.accept()
+                except OSError:
+                    break  # Nobody else waiting
                 try:
-                    request += cl.recv(1024)
+                    print(f'Client connected from {addr}')
+                    request = read_request(cl)
+                    if request:
+                        response = handle_request(request)
+                        cl.send(response)
                 except OSError:
                     pass
-            response = handle_request(request)
-            cl.send(response)
-            cl.close()
-        except OSError:
-            pass
+                cl.close()
         
         utime.sleep(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,2 @@
+ssid = 'SIMULATED'
+password = 'SIMULATED'
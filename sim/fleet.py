@@ -0,0 +1,54 @@
+# fleet.py - Run several simulated boards at once, for trying out the gateway
+#
+#   python sim/fleet.py [count] [first port] [devices file]
+#
+# Each board is api/main.py in its own process and scratch directory, on
+# consecutive ports from the first one (default 8081). With a devices file
+# the boards are written to it in the gateway's registry format. Runs until
+# interrupted.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+api = os.path.join(here, '..', 'api')
+
+def start(count, first_port):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((here, api)))
+    boards = []
+    for i in range(count):
+        port = first_port + i
+        proc = subprocess.Popen(
+            [sys.executable, '-c', f"import asyncio, main; main.PORT = {port}; asyncio.run(main.main())"],
+            cwd=tempfile.mkdtemp(prefix=f'pico-fleet-{i}-'), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        boards.append((f"pico-{i}", f"127.0.0.1:{port}", proc))
+    return boards
+
+def run(count=4, first_port=8081, devices_file=None):
+    boards = start(count, first_port)
+    if devices_file:
+        with open(devices_file, 'w') as f:
+            json.dump({"devices": [{"name": name, "address": address} for name, address, _ in boards]}, f, indent=2)
+    for name, address, _ in boards:
+        print(f"{name} on http://{address}")
+    try:
+        while all(proc.poll() is None for _, _, proc in boards):
+            time.sleep(1)
+        print("A board exited")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for _, _, proc in boards:
+            proc.kill()
+            proc.wait()
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    first_port = int(sys.argv[2]) if len(sys.argv) > 2 else 8081
+    run(count, first_port, sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,219 @@
+# machine.py - CPython stand-in for the RP2040 machine module
+#
+# Every Pin value and PWM duty change is appended to trace as
+# (simulated epoch seconds, pin id, 'pin' or 'pwm', value), so motor runs can
+# be checked after a simulation. The I2C bus has a simulated DS3231 at 0x68
+# that keeps time with utime's virtual clock. SIM_RTC_LOST_POWER=1 starts it
+# with the oscillator-stopped flag set. ADC readings come from adc_inputs.
+
+import collections
+import math
+import os
+import utime
+
+TRACE_LIMIT = 100000
+trace = collections.deque(maxlen=TRACE_LIMIT)
+
+last_on = {}  # pin id -> simulated time its value or duty last went from zero to non-zero
+
+def _record(pin_id, kind, value, previous):
+    t = utime.true_time()
+    trace.append((t, pin_id, kind, value))
+    if value and not previous:
+        last_on[pin_id] = t
+
+def pin_trace(pin_id, kind=None):
+    return [entry for entry in trace if entry[1] == pin_id and (kind is None or entry[2] == kind)]
+
+def pwm_runs(pin_id):
+    """(start, end) simulated times the PWM on pin_id had a non-zero duty."""
+    runs = []
+    started = None
+    for t, _, _, duty in pin_trace(pin_id, 'pwm'):
+        if duty and started is None:
+            started = t
+        elif not duty and started is not None:
+            runs.append((started, t))
+            started = None
+    if started is not None:
+        runs.append((started, None))
+    return runs
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 0 if value is None else value
+        self._irq = None
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        v = 1 if v else 0
+        if v != self._value:
+            _record(self.id, 'pin', v, self._value)
+        self._value = v
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self._irq = handler
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        if d != self._duty:
+            _record(self.pin.id, 'pwm', d, self._duty)
+        self._duty = d
+
+    def deinit(self):
+        self.duty_u16(0)
+
+adc_inputs = {}  # pin id -> 16-bit reading, or a function of simulated epoch seconds returning one
+
+class ADC:
+    def __init__(self, pin):
+        self.id = pin.id if isinstance(pin, Pin) else pin
+
+    def read_u16(self):
+        source = adc_inputs.get(self.id, 32768)
+        value = source(utime.true_time()) if callable(source) else source
+        return max(0, min(65535, int(value)))
+
+class RTC:
+    def datetime(self, dt=None):
+        if dt is None:
+            t = utime.localtime()
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+        # (year, month, mday, weekday, hours, minutes, seconds, subseconds)
+        utime.set_time(utime.mktime((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, 0)))
+
+def _bcd(n):
+    return ((n // 10) << 4) | (n % 10)
+
+def _unbcd(b):
+    return (b >> 4) * 10 + (b & 0x0F)
+
+class DS3231Device:
+    """Register-level DS3231: time, alarm 1, control, status and temperature."""
+
+    def __init__(self, lost_power=False):
+        self.regs = bytearray(19)
+        self.offset = 0  # Seconds the chip is off from true time
+        self.alarm_at = None  # Next time alarm 1 matches
+        self.temperature = 22.25
+        if lost_power:
+            self.regs[0x0F] = 0x80
+
+    def now(self):
+        return int(utime.true_time() + self.offset)
+
+    def _next_alarm(self):
+        r = self.regs
+        if r[0x0A] & 0x80:
+            return None  # Only date matching is simulated
+        seconds = _unbcd(r[0x07] & 0x7F)
+        minutes = _unbcd(r[0x08] & 0x7F)
+        hours = _unbcd(r[0x09] & 0x3F)
+        mday = _unbcd(r[0x0A] & 0x3F)
+        now = self.now()
+        midnight = now - now % 86400
+        for day in range(62):
+            t = midnight + day * 86400
+            if utime.gmtime(t)[2] == mday:
+                t += hours * 3600 + minutes * 60 + seconds
+                if t > now:
+                    return t
+        return None
+
+    def read(self, reg, n):
+        r = self.regs
+        t = utime.gmtime(self.now())
+        r[0x00] = _bcd(t[5])
+        r[0x01] = _bcd(t[4])
+        r[0x02] = _bcd(t[3])
+        r[0x03] = t[6] + 1
+        r[0x04] = _bcd(t[2])
+        r[0x05] = _bcd(t[1]) | (0x80 if t[0] >= 2100 else 0)
+        r[0x06] = _bcd(t[0] % 100)
+        if self.alarm_at is not None and self.now() >= self.alarm_at:
+            r[0x0F] |= 0x01
+            self.alarm_at = self._next_alarm()
+        whole = math.floor(self.temperature)  # Two's complement, the fraction is always added
+        r[0x11] = whole & 0xFF
+        r[0x12] = int((self.temperature - whole) * 4) << 6
+        return bytes(r[reg:reg + n])
+
+    def write(self, reg, data):
+        self.regs[reg:reg + len(data)] = data
+        r = self.regs
+        if reg <= 0x06:
+            year = 2000 + _unbcd(r[0x06]) + (100 if r[0x05] & 0x80 else 0)
+            t = utime.mktime((year, _unbcd(r[0x05] & 0x1F), _unbcd(r[0x04] & 0x3F),
+                              _unbcd(r[0x02] & 0x3F), _unbcd(r[0x01] & 0x7F), _unbcd(r[0x00] & 0x7F), 0, 0))
+            self.offset = t - int(utime.true_time())
+        if reg <= 0x0A and reg + len(data) > 0x07:
+            self.alarm_at = self._next_alarm()
+
+i2c_devices = {0x68: DS3231Device(os.environ.get('SIM_RTC_LOST_POWER') == '1')}  # address -> device
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+
+    def scan(self):
+        return sorted(i2c_devices)
+
+    def _device(self, addr):
+        device = i2c_devices.get(addr)
+        if device is None:
+            raise OSError(5)  # EIO, nothing acknowledged the address
+        return device
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._device(addr).read(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._device(addr).write(memaddr, bytes(buf))
+
+PWRON_RESET = 1
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+
+def reset_cause():
+    return PWRON_RESET
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+def lightsleep(ms=None):
+    utime.sleep_ms(ms or 0)
+
+def deepsleep(ms=None):
+    lightsleep(ms)
+    reset()
@@ -0,0 +1,77 @@
+# network.py - CPython stand-in for the Pico W network module
+#
+# Connection attempts can be scripted: put statuses in connect_script and
+# each connect() uses up one of them, STAT_GOT_IP or a failure. Once the
+# script runs out every attempt succeeds. SIM_WIFI_FAILS=n makes the first
+# n attempts fail. drop() takes an established link down.
+
+import os
+import utime
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+connect_delay = 0.5  # Simulated seconds from connect() to the outcome
+connect_script = [STAT_NO_AP_FOUND] * int(os.environ.get('SIM_WIFI_FAILS', 0))
+connects = 0  # connect() calls so far
+
+# Shared by every WLAN object for the same interface, like the real radio
+_interfaces = {}
+
+class _Interface:
+    def __init__(self):
+        self.active = False
+        self.status = STAT_IDLE
+        self.outcome = STAT_IDLE
+        self.ready_at = 0
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._if = _interfaces.setdefault(interface, _Interface())
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._if.active
+        self._if.active = bool(is_active)
+        if not is_active:
+            self._if.status = STAT_IDLE
+
+    def connect(self, ssid=None, password=None):
+        global connects
+        connects += 1
+        iface = self._if
+        iface.outcome = connect_script.pop(0) if connect_script else STAT_GOT_IP
+        iface.status = STAT_CONNECTING
+        iface.ready_at = utime.now() + connect_delay
+
+    def disconnect(self):
+        self._if.status = STAT_IDLE
+
+    def _update(self):
+        iface = self._if
+        if iface.status == STAT_CONNECTING and utime.now() >= iface.ready_at:
+            iface.status = iface.outcome if iface.active else STAT_CONNECT_FAIL
+        return iface.status
+
+    def isconnected(self):
+        return self._update() == STAT_GOT_IP
+
+    def status(self, param=None):
+        return self._update()
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+def drop(interface=STA_IF):
+    """Take the link down, as if the access point went away."""
+    iface = _interfaces.get(interface)
+    if iface is not None and iface.status == STAT_GOT_IP:
+        iface.status = STAT_CONNECT_FAIL
@@ -0,0 +1,16 @@
+# ntptime.py - CPython stand-in, sets the device clock to the simulation's true time
+#
+# Put exceptions in fail_script to make the next settime() calls raise them.
+
+import utime
+
+host = "pool.ntp.org"
+fail_script = []
+
+def time():
+    return int(utime.true_time())
+
+def settime():
+    if fail_script:
+        raise fail_script.pop(0)
+    utime.set_time(time())
@@ -0,0 +1,71 @@
+# replay.py - Run the firmware for simulated days and fire API requests at it
+#
+#   python sim/replay.py [days] [requests]
+#
+# api/main.py runs unmodified on the virtual clock at full speed, in a
+# scratch directory so its state files don't mix with a real run. Requests
+# go straight to the router, spread evenly over the simulated time.
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SIM_SPEED', '0')
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.join(here, '..', 'api')]
+
+import asyncio
+import json
+import machine
+import utime
+import main
+import webserver
+
+REQUESTS = (
+    ('GET', '/watering_info', b''),
+    ('GET', '/zones', b''),
+    ('GET', '/motor_status', b''),
+    ('POST', '/start_motor', b''),
+    ('POST', '/stop_motor', b''),
+    ('POST', '/update_watering', b'{"duration": 5, "delay": 2}'),
+)
+
+async def replay(days, count):
+    asyncio.create_task(main.main())
+    await asyncio.sleep(1)
+    buf = bytearray(webserver.BUFFER_SIZE)
+    statuses = {}
+    step = days * 86400 / max(1, count)
+    for _ in range(count):
+        await asyncio.sleep(step * random.random() * 2)
+        method, path, body = random.choice(REQUESTS)
+        response = main.app.dispatch(webserver.Request(method, path, {}, {}, body))
+        if response.write_into(buf) is None:
+            response.encode()
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+    await asyncio.sleep(60)  # Let a running cycle finish
+    return statuses
+
+def run(days=30, count=1000):
+    os.chdir(tempfile.mkdtemp(prefix='pico-sim-'))
+    main.PORT = 0  # Any free port, so a real run can keep 8080
+    random.seed(1)
+    started = time.monotonic()
+    sim_started = utime.now()
+    statuses = asyncio.run(replay(days, count))
+    dir1 = main.default_zone.pins[1]
+    waterings = [entry for entry in machine.pin_trace(dir1, 'pin') if entry[3]]
+    return {
+        "simulated_days": round((utime.now() - sim_started) / 86400, 2),
+        "host_seconds": round(time.monotonic() - started, 2),
+        "requests": statuses,
+        "waterings": len(waterings),
+        "history": len(main.history),
+        "state_dir": os.getcwd()
+    }
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    print(json.dumps(run(*args)))
@@ -0,0 +1,30 @@
+# soil.py - Scripted soil-moisture curves for the simulated ADC
+#
+#   machine.adc_inputs[26] = soil.Soil(pump_pin=16)
+#
+# The soil dries linearly between waterings and is soaked again by every
+# pump run recorded by the simulated PWM, so it closes the loop with the firmware.
+
+import random
+import machine
+
+class Soil:
+    def __init__(self, pump_pin, wet=20000, dry=50000, days_to_dry=10, noise=800, start=0.5):
+        self.pump_pin = pump_pin
+        self.wet = wet  # Raw reading right after watering
+        self.dry = dry  # Raw reading once fully dried out
+        self.seconds_to_dry = days_to_dry * 86400
+        self.noise = noise  # Peak random noise added to each read
+        self.start = start  # How dry the soil is when the simulation starts, 0 to 1
+        self.started = None
+        self.random = random.Random(1)
+
+    def dryness(self, t):
+        if self.started is None:
+            self.started = t
+        since = machine.last_on.get(self.pump_pin, self.started - self.start * self.seconds_to_dry)
+        return min(1.0, (t - since) / self.seconds_to_dry)
+
+    def __call__(self, t):
+        value = self.wet + (self.dry - self.wet) * self.dryness(t)
+        return value + self.random.uniform(-self.noise, self.noise)
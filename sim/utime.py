@@ -0,0 +1,114 @@
+# utime.py - CPython stand-in for MicroPython's utime, on a virtual clock
+#
+# SIM_SPEED sets how fast simulated time runs against the host clock: 1 is
+# real time, 1000 runs a day in under a minute and 0 jumps straight to the
+# next timer whenever nothing is ready. SIM_START sets the epoch seconds the
+# simulation starts at, it defaults to the host time. asyncio loops created
+# after this module is imported run on the same clock, so firmware sleeps
+# are accelerated too.
+
+import asyncio
+import calendar
+import os
+import selectors
+import time as _time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+speed = float(os.environ.get('SIM_SPEED', 1))
+start = float(os.environ.get('SIM_START', _time.time()))
+_elapsed = 0.0  # Simulated seconds since start, up to _anchor
+_anchor = _time.monotonic()  # Host time _elapsed was last brought up to date
+clock_offset = 0  # How far the device clock is from true time, RTC writes change it
+
+def now():
+    """Simulated seconds since the simulation started."""
+    if speed > 0:
+        return _elapsed + (_time.monotonic() - _anchor) * speed
+    return _elapsed
+
+def advance(seconds):
+    """Move simulated time forward without waiting."""
+    global _elapsed, _anchor
+    _elapsed = now() + seconds
+    _anchor = _time.monotonic()
+
+def set_speed(factor):
+    global speed, _elapsed, _anchor
+    _elapsed = now()
+    _anchor = _time.monotonic()
+    speed = factor
+
+def true_time():
+    """What an NTP server would say."""
+    return start + now()
+
+def set_time(secs):
+    """Set the device clock, as machine.RTC().datetime() does."""
+    global clock_offset
+    clock_offset = secs - true_time()
+
+def time():
+    return int(true_time() + clock_offset)
+
+def sleep(seconds):
+    if speed > 0:
+        _time.sleep(seconds / speed)
+    else:
+        advance(seconds)
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
+
+def sleep_us(us):
+    sleep(us / 1000000)
+
+def ticks_ms():
+    return int(now() * 1000) & _TICKS_MAX
+
+def ticks_us():
+    return int(now() * 1000000) & _TICKS_MAX
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+def localtime(secs=None):
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+gmtime = localtime
+
+def mktime(t):
+    return calendar.timegm((t[0], t[1], t[2], t[3], t[4], t[5], 0, 0, 0))
+
+class _VirtualSelector(selectors.DefaultSelector):
+    # The loop passes timeouts in simulated seconds
+    def select(self, timeout=None):
+        if speed > 0:
+            return super().select(None if timeout is None else timeout / speed)
+        events = super().select(0)
+        if not events and timeout:
+            advance(timeout)
+        elif not events and timeout is None:
+            events = super().select(None)  # Nothing scheduled, wait for a socket
+        return events
+
+class _VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__(_VirtualSelector())
+
+    def time(self):
+        return now()
+
+class _VirtualLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    def new_event_loop(self):
+        return _VirtualLoop()
+
+asyncio.set_event_loop_policy(_VirtualLoopPolicy())
@@ -0,0 +1,14 @@
+# conftest.py - Run the firmware modules on CPython against the sim/ stand-ins
+#
+# The virtual clock is frozen (SIM_SPEED=0), so tests move time on with
+# utime.advance() and nothing depends on how fast the host is.
+
+import os
+import sys
+
+os.environ['SIM_SPEED'] = '0'
+os.environ['SIM_START'] = '1767225600'  # 2026-01-01 00:00:00 UTC
+
+here = os.path.dirname(os.path.abspath(__file__))
+for path in ('sim', 'api', 'gateway'):
+    sys.path.insert(0, os.path.join(here, '..', path))
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import pytest
+import utime
+import webserver
+from webserver import Request
+
+DAY = 86400
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # The state store and history files go here
+    import main
+    zone = main.default_zone
+    if zone.id not in main.scheduler.zones:
+        main.scheduler.add(zone, utime.time() + DAY)
+    main.reschedule(zone, utime.time() + DAY, DAY, 10, save=False)
+    yield main
+    main.stop_motor(zone)
+    while main.scheduler.busy():
+        utime.advance(1)
+        main.scheduler.poll()
+
+def call(api, method, path, body=None, headers=None):
+    # Dispatches like serve_client and decodes what would go on the wire
+    data = b'' if body is None else json.dumps(body).encode()
+    response = api.app.dispatch(Request(method, path, {}, headers or {}, data))
+    head, _, payload = response.encode().partition(b'\r\n\r\n')
+    lines = head.decode().split('\r\n')
+    fields = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        fields[name.lower()] = value.strip()
+    return int(lines[0].split()[1]), fields, json.loads(payload) if payload else None
+
+def test_watering_info_revalidates(api):
+    status, headers, info = call(api, 'GET', '/watering_info')
+    assert status == 200
+    etag = headers['etag']
+    assert etag.startswith('W/"')  # The countdown in the body moves under the same tag
+    assert info["time_remaining"] == DAY
+
+    status, headers, body = call(api, 'GET', '/watering_info', headers={'if-none-match': etag})
+    assert status == 304 and body is None
+    assert 'content-length' not in headers and headers['etag'] == etag
+
+    utime.advance(10)
+    status, headers, info = call(api, 'GET', '/watering_info')
+    assert headers['etag'] == etag
+    assert info["time_remaining"] == DAY - 10
+
+    assert call(api, 'POST', '/update_watering', {"duration": 5, "delay": 2})[0] == 200
+    status, headers, info = call(api, 'GET', '/watering_info', headers={'if-none-match': etag})
+    assert status == 200 and headers['etag'] != etag
+    assert info["duration"] == 5 and info["time_remaining"] == 2 * DAY
+
+def test_health(api):
+    status, headers, body = call(api, 'HEAD', '/health')
+    assert status == 204 and body is None
+    assert 'content-length' not in headers
+
+def test_batch_applies_in_order(api):
+    status, _, body = call(api, 'POST', '/batch', {"ops": [
+        {"op": "update_watering", "duration": 7, "delay": 2},
+        {"op": "info"},
+        {"op": "start_motor"},
+        {"op": "start_motor"},
+    ]})
+    assert status == 200
+    results = body["results"]
+    assert [r["op"] for r in results] == ["update_watering", "info", "start_motor", "start_motor"]
+    assert results[1]["duration"] == 7 and results[1]["delay"] == 2
+    assert results[2]["status"] == "Motor running for 7 seconds"
+    assert results[3]["status"] == "Motor is already running"
+    assert api.store.dirty()  # Queued for one flush, not written per update
+
+@pytest.mark.parametrize('ops, expected', [
+    ([{"op": "update_watering", "duration": 7}, {"op": "reboot"}], 400),
+    ([{"op": "update_watering", "duration": 7}, {"op": "update_watering", "duration": float('nan')}], 400),
+    ([{"op": "update_watering", "duration": 7}, {"op": "start_motor", "zone": 99}], 404),
+    ([{"op": "info"}] * 17, 400),
+    ([], 400),
+])
+def test_bad_batch_changes_nothing(api, ops, expected):
+    # NaN isn't JSON, but Python's json writes and reads it
+    assert call(api, 'POST', '/batch', {"ops": ops})[0] == expected
+    assert api.default_zone.duration == 10
+    assert not api.scheduler.busy()
+
+class StreamWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self.gone = False  # Set to make the next drain fail like a closed socket
+
+    def write(self, data):
+        self.out += data
+
+    async def drain(self):
+        if self.gone:
+            raise OSError(104, 'ECONNRESET')
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 50000)
+
+def test_events_stream(api):
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"GET /events HTTP/1.1\r\n\r\n")
+        writer = StreamWriter()
+        task = asyncio.create_task(webserver.serve_client(reader, writer, api.app))
+        await asyncio.sleep(0.1)
+        assert len(api.events.subscribers) == 1
+        api.start_motor(api.default_zone)
+        await asyncio.sleep(0.1)
+        writer.gone = True
+        api.events.publish('heartbeat', {})
+        await task
+        return writer.out.decode()
+
+    out = asyncio.run(scenario())
+    head, _, stream = out.partition('\r\n\r\n')
+    assert 'text/event-stream' in head and 'Content-Length' not in head
+    assert stream.startswith('retry: 5000\n\n')
+    assert 'event: watering_started\ndata: {"zone": 0, "duration": 10}\n\n' in stream
+    assert not api.events.subscribers  # Dropped once the client went away
+    assert len(webserver._pool.free) == webserver.MAX_CONNECTIONS
+
+def test_events_subscribers_are_capped(api, monkeypatch):
+    monkeypatch.setattr(api.events, 'subscribers', [object()] * api.events.max_subscribers)
+    assert call(api, 'GET', '/events')[0] == 503
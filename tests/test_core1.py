@@ -0,0 +1,142 @@
+import threading
+import time
+import utime
+from ring import Ring, SLOT_WIDTH
+from core1 import (Core1, CMD_RUN, EV_STARTED, EV_FINISHED, EV_SCHEDULED, ZONE_IDLE,
+                   to_ms, from_ms)
+from history import SOURCE_MANUAL, SOURCE_MOISTURE, FLAG_CANCELLED
+from zones import Zone, ZoneScheduler
+
+YEARS = 3650 * 86400  # Far enough out that no schedule fires while core 1 spins the virtual clock
+
+def test_ring_fills_and_drains():
+    ring = Ring(3)
+    out = [0] * SLOT_WIDTH
+    assert not ring.get(out)
+    assert ring.free() == 3
+    for i in range(3):
+        assert ring.put(1, i)
+    assert not ring.put(1, 3)  # Full
+    assert ring.dropped == 1
+    assert len(ring) == 3 and ring.free() == 0
+    assert ring.get(out) and out == [1, 0, 0, 0, 0, 0]
+    assert ring.put(2, 3, 4, 5, 6, 7)  # Wraps around
+    got = []
+    while ring.get(out):
+        got.append(list(out))
+    assert got == [[1, 1, 0, 0, 0, 0], [1, 2, 0, 0, 0, 0], [2, 3, 4, 5, 6, 7]]
+    assert ring.free() == 3
+
+def test_ring_across_threads():
+    count = 20000
+    ring = Ring(16)
+
+    def produce():
+        for i in range(count):
+            while not ring.put(1, i, i * 3, -i, i & 0xFF, count - i):
+                time.sleep(0)  # Full, let the consumer catch up
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    out = [0] * SLOT_WIDTH
+    received = 0
+    deadline = time.monotonic() + 30
+    while received < count and time.monotonic() < deadline:
+        if not ring.get(out):
+            time.sleep(0)
+            continue
+        # In order, none lost or torn
+        assert out == [1, received, received * 3, -received, received & 0xFF, count - received]
+        received += 1
+    producer.join()
+    assert received == count
+    assert not ring.get(out)
+
+def test_ms_conversion():
+    assert to_ms(10) == 10000 and from_ms(10000) == 10
+    assert isinstance(from_ms(10000), int)
+    assert to_ms(2.5) == 2500 and from_ms(2500) == 2.5
+
+def wait_event(core1, kind, timeout=5):
+    event = [0] * SLOT_WIDTH
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if core1.events.get(event):
+            if event[0] == kind:
+                return event
+        else:
+            time.sleep(0.001)
+    raise AssertionError(f"no event {kind} from core 1")
+
+def wait_state(core1, zone, state, timeout=5):
+    deadline = time.monotonic() + timeout
+    while core1.zone_state(zone) != state:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def stop(core1):
+    core1.running = False
+    time.sleep(0.05)  # One loop at most, the thread exits on its own
+
+def make_core1():
+    scheduler = ZoneScheduler()
+    zone = Zone(0, (16, 14, 15), 2.5, 86400)
+    other = Zone(1, (17, 18, 19), 3600, 86400)  # Long enough to still be running when stopped
+    scheduler.add(zone, utime.time() + YEARS)
+    scheduler.add(other, utime.time() + YEARS)
+    core1 = Core1(scheduler)
+    core1.start()
+    return core1, zone, other
+
+def test_run_round_trip():
+    core1, zone, other = make_core1()
+    try:
+        assert core1.run(zone, SOURCE_MOISTURE)
+        started = wait_event(core1, EV_STARTED)
+        assert started[1:3] == [0, 2500]
+        finished = wait_event(core1, EV_FINISHED)
+        assert finished[1] == 0
+        assert from_ms(finished[3]) == 2.5
+        assert 2400 <= finished[4] <= 2600  # Forward ms, to one core 1 loop
+        assert finished[5] == SOURCE_MOISTURE << 8
+        wait_state(core1, zone, ZONE_IDLE)
+    finally:
+        stop(core1)
+
+def test_stop_round_trip():
+    core1, zone, other = make_core1()
+    try:
+        assert core1.run(other)
+        wait_event(core1, EV_STARTED)
+        assert core1.stop(other)
+        finished = wait_event(core1, EV_FINISHED)
+        assert finished[5] == FLAG_CANCELLED | SOURCE_MANUAL << 8
+    finally:
+        stop(core1)
+
+def test_schedule_round_trip():
+    core1, zone, other = make_core1()
+    try:
+        next_watering = utime.time() + YEARS + 7
+        assert core1.schedule(zone, next_watering, 3600, 12.25)
+        scheduled = wait_event(core1, EV_SCHEDULED)
+        assert scheduled[1:3] == [0, next_watering]
+        assert zone.interval == 3600
+        assert zone.duration == 12.25
+        assert zone.next_watering == zone.anchor == next_watering
+    finally:
+        stop(core1)
+
+def test_commands_beyond_the_ring_are_refused():
+    scheduler = ZoneScheduler()
+    zone = Zone(0, (16, 14, 15), 5, 86400)
+    scheduler.add(zone, utime.time() + YEARS)
+    core1 = Core1(scheduler)  # Not started, nothing drains the ring
+    sent = 0
+    while core1.run(zone):
+        sent += 1
+    assert sent == core1.commands.capacity - 1
+    assert core1.commands.dropped == 1
+    assert core1.commands.free() == 0
+    out = [0] * SLOT_WIDTH
+    assert core1.commands.get(out) and out[:3] == [CMD_RUN, 0, SOURCE_MANUAL]
@@ -0,0 +1,128 @@
+import machine
+import pytest
+import utime
+from ds3231 import DS3231, A1F, A2F, OSF, A1IE, A2IE, INTCN, REG_CONTROL, REG_STATUS
+
+class CountingI2C(machine.I2C):
+    def __init__(self):
+        super().__init__(0)
+        self.reads = []  # (register, bytes)
+        self.writes = []
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self.reads.append((memaddr, len(buf)))
+        super().readfrom_mem_into(addr, memaddr, buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self.writes.append((memaddr, len(buf)))
+        super().writeto_mem(addr, memaddr, buf)
+
+@pytest.fixture
+def chip(monkeypatch):
+    device = machine.DS3231Device()
+    monkeypatch.setitem(machine.i2c_devices, 0x68, device)
+    return device
+
+@pytest.fixture
+def i2c(chip):
+    return CountingI2C()
+
+def set_clock(rtc, t):
+    rtc.set_time(utime.mktime(t))
+
+def test_time_is_one_burst_each_way(chip, i2c):
+    rtc = DS3231(i2c)
+    rtc.set_datetime((2026, 3, 14, 15, 9, 26, 5, 73))
+    assert i2c.writes == [(0x00, 7)]  # The status read after it only writes if OSF was set
+    i2c.reads.clear()
+    assert rtc.datetime() == (2026, 3, 14, 15, 9, 26, 5)
+    assert i2c.reads == [(0x00, 7)]
+
+def test_registers_are_bcd(chip, i2c):
+    rtc = DS3231(i2c)
+    rtc.set_datetime((2099, 12, 31, 23, 59, 58, 3, 365))
+    assert bytes(chip.regs[0:7]) == bytes((0x58, 0x59, 0x23, 0x04, 0x31, 0x12, 0x99))
+    rtc.set_datetime((2100, 1, 1, 0, 0, 0, 4, 1))
+    assert chip.regs[0x05] == 0x81  # Century bit
+    assert rtc.datetime()[0] == 2100
+
+def test_time_round_trip(chip, i2c):
+    rtc = DS3231(i2c)
+    now = utime.time()
+    rtc.set_time(now)
+    assert rtc.time() == now
+    utime.advance(90)
+    assert rtc.time() == now + 90
+
+def test_setting_the_time_clears_oscillator_stopped(chip, i2c):
+    chip.regs[REG_STATUS] = OSF
+    rtc = DS3231(i2c)
+    assert rtc.lost_power()
+    rtc.set_time(utime.time())
+    assert not rtc.lost_power()
+
+def test_alarm1(chip, i2c):
+    rtc = DS3231(i2c)
+    set_clock(rtc, (2026, 6, 10, 8, 0, 0))
+    alarm = utime.mktime((2026, 6, 12, 6, 30, 15))
+    rtc.set_alarm(alarm)
+    assert bytes(chip.regs[0x07:0x0B]) == bytes((0x15, 0x30, 0x06, 0x12))
+    assert chip.regs[REG_CONTROL] & (INTCN | A1IE) == INTCN | A1IE
+    assert rtc.get_alarm() == alarm
+
+def test_alarm_rolls_over_to_a_month_with_the_day(chip, i2c):
+    rtc = DS3231(i2c)
+    set_clock(rtc, (2026, 1, 31, 12, 0, 0))
+    # Day 31 at 10:00 has passed this month and February has no 31st
+    rtc.set_alarm(utime.mktime((2026, 1, 31, 10, 0, 0)))
+    assert rtc.get_alarm() == utime.mktime((2026, 3, 31, 10, 0, 0))
+    # Later the same day is still this month
+    rtc.set_alarm(utime.mktime((2026, 1, 31, 18, 0, 0)))
+    assert rtc.get_alarm() == utime.mktime((2026, 1, 31, 18, 0, 0))
+
+def test_alarm_rolls_over_the_year(chip, i2c):
+    rtc = DS3231(i2c)
+    set_clock(rtc, (2026, 12, 20, 0, 0, 0))
+    rtc.set_alarm(utime.mktime((2026, 12, 5, 7, 0, 0)))
+    assert rtc.get_alarm() == utime.mktime((2027, 1, 5, 7, 0, 0))
+
+def test_alarm2(chip, i2c):
+    rtc = DS3231(i2c)
+    set_clock(rtc, (2026, 6, 10, 8, 0, 0))
+    rtc.set_alarm2(utime.mktime((2026, 6, 11, 21, 45, 30)))
+    assert i2c.writes[-2] == (0x0B, 3)
+    assert bytes(chip.regs[0x0B:0x0E]) == bytes((0x45, 0x21, 0x11))
+    assert chip.regs[REG_CONTROL] & (INTCN | A2IE) == INTCN | A2IE
+    # Alarm 2 has no seconds register
+    assert rtc.get_alarm2() == utime.mktime((2026, 6, 11, 21, 45, 0))
+
+def test_flags(chip, i2c):
+    rtc = DS3231(i2c)
+    chip.regs[REG_STATUS] = OSF | A2F | A1F
+    assert rtc.alarm_fired()
+    assert rtc.alarm_fired(A2F)
+    rtc.clear_flags()
+    assert chip.regs[REG_STATUS] == OSF  # Only the alarm flags by default
+    assert not rtc.alarm_fired() and not rtc.alarm_fired(A2F)
+    rtc.clear_flags(OSF)
+    assert chip.regs[REG_STATUS] == 0
+    i2c.writes.clear()
+    rtc.clear_flags()
+    assert i2c.writes == []  # Nothing to clear, nothing written
+
+def test_alarm_flag_from_the_chip(chip, i2c):
+    rtc = DS3231(i2c)
+    rtc.set_time(utime.time())
+    rtc.set_alarm(utime.time() + 5)
+    assert not rtc.alarm_fired()
+    utime.advance(5)
+    assert rtc.alarm_fired()
+    rtc.clear_flags(A1F)
+    assert not rtc.alarm_fired()
+
+@pytest.mark.parametrize('celsius', [22.25, 0.0, 31.75, -3.75, -0.25])
+def test_temperature(chip, i2c, celsius):
+    chip.temperature = celsius
+    rtc = DS3231(i2c)
+    assert rtc.temperature() == celsius
+    assert i2c.reads == [(0x11, 2)]
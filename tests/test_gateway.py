@@ -0,0 +1,147 @@
+import asyncio
+import json
+import pytest
+import time
+from client import DeviceClient, DeviceError, Response
+from gateway import Device, Gateway, HTTPError
+
+def run(coro):
+    # A plain loop: the gateway runs on the host clock, not the firmware's virtual one
+    loop = asyncio.SelectorEventLoop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+class ScriptedClient:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    async def request(self, method, path, body=b'', headers=None):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def info_response(time_remaining, etag='"1-1"'):
+    body = json.dumps({"zone": 0, "next_watering": 1800000000, "time_remaining": time_remaining}).encode()
+    return Response(200, {"etag": etag}, body)
+
+def test_countdown_keeps_running_across_304s(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    device = Device('a', '127.0.0.1:1')
+    device.client = ScriptedClient(info_response(600), Response(304, {}, b''), Response(304, {}, b''))
+    assert run(device.refresh())
+    clock[0] += 30
+    assert run(device.refresh())
+    clock[0] += 30
+    assert run(device.refresh())
+    status = device.status(clock[0] + 5)
+    assert status["watering_info"]["time_remaining"] == 535
+    assert status["age_s"] == 5.0  # Since the last answer, 304 or not
+    assert status["online"]
+
+def test_new_body_restarts_the_countdown(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    device = Device('a', '127.0.0.1:1')
+    device.client = ScriptedClient(info_response(600), info_response(86400, '"1-2"'))
+    run(device.refresh())
+    clock[0] += 100
+    run(device.refresh())
+    assert device.status(clock[0] + 10)["watering_info"]["time_remaining"] == 86390
+    assert device.etag == '"1-2"'
+
+def test_refresh_survives_a_failing_device():
+    gateway = Gateway()
+    good = run(gateway.add('good', '127.0.0.1:1', save=False))
+    bad = run(gateway.add('bad', '127.0.0.1:2', save=False))
+    good.client = ScriptedClient(info_response(600))
+    bad.client = ScriptedClient(RuntimeError("boom"))
+    run(gateway.refresh())
+    assert gateway.refreshes == 1
+    assert good.status(time.monotonic())["online"]
+    assert bad.error == "boom"
+
+def test_moving_a_device_closes_its_old_connections():
+    class ClosingClient:
+        closed = False
+
+        async def close(self):
+            self.closed = True
+
+    gateway = Gateway()
+    old = run(gateway.add('pico', '127.0.0.1:1', save=False))
+    old.client = ClosingClient()
+    assert run(gateway.add('pico', '127.0.0.1:1', save=False)) is old
+    assert not old.client.closed
+    new = run(gateway.add('pico', '127.0.0.1:2', save=False))
+    assert new is not old and old.client.closed
+
+def test_scan_refuses_wide_networks():
+    gateway = Gateway()
+    with pytest.raises(ValueError):
+        run(gateway.scan('10.0.0.0/21'))
+    with pytest.raises(HTTPError) as e:
+        run(gateway.handle('POST', '/scan', {"network": "10.0.0.0/8"}, b''))
+    assert e.value.status == 400
+
+async def serve_once(payload):
+    # A device that answers every connection with payload and hangs up
+    async def handle(reader, writer):
+        await reader.readuntil(b'\r\n\r\n')
+        writer.write(payload)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+def test_body_cut_short_is_a_device_error():
+    async def scenario():
+        server, port = await serve_once(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{\"zone\": 0")
+        async with server:
+            client = DeviceClient('127.0.0.1', port)
+            with pytest.raises(DeviceError):
+                await client.request('GET', '/watering_info')
+            assert client.errors == 1
+            device = Device('a', f'127.0.0.1:{port}')
+            assert not await device.refresh()
+            assert device.error
+
+    run(scenario())
+
+def test_keep_alive_connection_is_reused():
+    async def scenario():
+        async def handle(reader, writer):
+            while True:
+                try:
+                    await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        async with server:
+            client = DeviceClient('127.0.0.1', server.sockets[0].getsockname()[1], rate=1000, burst=10)
+            for _ in range(3):
+                assert (await client.request('GET', '/watering_info')).json() == {}
+            assert client.connects == 1 and client.reused == 2
+            await client.close()
+
+    run(scenario())
+
+def test_scan_registers_what_answers_like_a_board():
+    async def scenario():
+        server, port = await serve_once(b"HTTP/1.1 204 No Content\r\n\r\n")
+        gateway = Gateway()
+        async with server:
+            added = await gateway.scan('127.0.0.0/30', port)
+        return added, port, gateway
+
+    added, port, gateway = run(scenario())
+    assert added == [f"127.0.0.1:{port}"]
+    assert list(gateway.devices) == added
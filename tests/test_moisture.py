@@ -0,0 +1,132 @@
+import asyncio
+import machine
+import pytest
+import soil
+import utime
+from moisture import MoistureSensor, BURST, LOCKOUT, SAMPLE_INTERVAL
+
+ADC_PIN = 26
+POWER_PIN = 22
+PUMP_PIN = 40
+
+@pytest.fixture
+def adc(monkeypatch):
+    # Install a scripted curve: a number, a function of time, or a list read one value per ADC read
+    def install(source):
+        if isinstance(source, list):
+            values = iter(source)
+            source = lambda t: next(values)
+        monkeypatch.setitem(machine.adc_inputs, ADC_PIN, source)
+    return install
+
+def sample(sensor):
+    return asyncio.run(sensor.sample())
+
+def at_percent(sensor, percent):
+    # The filtered reading that maps to percent
+    sensor.filtered = sensor.dry - (sensor.dry - sensor.wet) * percent // 100
+    assert sensor.percent() == percent
+
+def test_median_ignores_spikes(adc):
+    sensor = MoistureSensor(ADC_PIN, POWER_PIN)
+    adc([30100, 65535, 30200, 30300, 0, 30400, 30500, 60000, 30250])
+    assert sample(sensor) == 30300
+    assert sensor.raw == 30300
+    # Powered for the burst only
+    assert [value for _, _, _, value in machine.pin_trace(POWER_PIN, 'pin')][-2:] == [1, 0]
+
+def test_burst_is_read_in_one_go(adc):
+    reads = []
+    adc(lambda t: reads.append(t) or 40000)
+    sensor = MoistureSensor(ADC_PIN)
+    sample(sensor)
+    assert len(reads) == BURST
+
+def test_ema(adc):
+    sensor = MoistureSensor(ADC_PIN)
+    adc(20000)
+    assert sample(sensor) == 20000  # The first sample is taken as is
+    adc(40000)
+    assert sample(sensor) == 25000
+    assert sample(sensor) == 28750
+    adc(20000)
+    assert sample(sensor) == 26562  # Integer steps round down, also when falling
+    for _ in range(40):
+        sample(sensor)
+    assert sensor.filtered == 20000
+
+def test_percent():
+    sensor = MoistureSensor(ADC_PIN)
+    assert sensor.percent() is None
+    assert not sensor.check(utime.time())
+    sensor.filtered = 50000
+    assert sensor.percent() == 0
+    sensor.filtered = 20000
+    assert sensor.percent() == 100
+    sensor.filtered = 70000
+    assert sensor.percent() == 0
+    sensor.filtered = 10000
+    assert sensor.percent() == 100
+
+def test_hysteresis():
+    sensor = MoistureSensor(ADC_PIN, low=30, high=45)
+    now = utime.time()
+    fired = []
+    for percent in (50, 40, 31, 30, 25, 40, 45, 44, 30, 46, 35, 30):
+        at_percent(sensor, percent)
+        now += LOCKOUT  # Far enough apart that only the hysteresis matters
+        fired.append(sensor.check(now))
+    # Fires at low, stays off until back above high (45 is not enough), then fires again at low
+    assert fired == [False, False, False, True, False, False, False, False, False, False, False, True]
+    assert sensor.triggers == 2
+
+def test_lockout():
+    sensor = MoistureSensor(ADC_PIN)
+    now = utime.time()
+    at_percent(sensor, 20)
+    assert sensor.check(now)
+    at_percent(sensor, 60)
+    assert not sensor.check(now + 60)  # Re-armed
+    at_percent(sensor, 20)
+    assert not sensor.check(now + LOCKOUT - 1)
+    assert sensor.check(now + LOCKOUT)
+
+def test_rearm():
+    sensor = MoistureSensor(ADC_PIN)
+    now = utime.time()
+    at_percent(sensor, 20)
+    assert sensor.check(now)
+    assert not sensor.check(now + 60)
+    sensor.rearm()  # The watering couldn't start
+    assert sensor.triggers == 0
+    assert sensor.check(now + 60)
+    assert sensor.triggers == 1
+    sensor.rearm()
+    sensor.rearm()  # Only takes back one trigger
+    assert sensor.triggers == 0
+
+def test_closed_loop_with_drying_soil(adc):
+    # Soil dries out over 10 days and every pump run soaks it, for 40 days
+    curve = soil.Soil(PUMP_PIN, days_to_dry=10, start=0.5)
+    adc(curve)
+    sensor = MoistureSensor(ADC_PIN)
+    pump = machine.PWM(machine.Pin(PUMP_PIN))
+    triggers = []
+
+    async def run():
+        end = utime.time() + 40 * 86400
+        while utime.time() < end:
+            await sensor.sample()
+            if sensor.check(utime.time()):
+                triggers.append(utime.time())
+                pump.duty_u16(65535)
+                pump.duty_u16(0)
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    asyncio.run(run())
+    # 30% moisture is read once the soil is 69% dried out: 1.9 days in, then every 6.9.
+    # Read noise moves that by an hour or two.
+    assert len(triggers) == 6
+    assert abs(triggers[0] - curve.started - 1.9 * 86400) < 3 * 3600
+    for before, after in zip(triggers, triggers[1:]):
+        assert abs(after - before - 6.9 * 86400) < 3 * 3600
@@ -0,0 +1,85 @@
+import machine
+import pytest
+import utime
+from ds3231 import DS3231
+from power import PowerManager, LIGHT, DEEP, MAX_SLEEP_MS
+
+HOUR = 3600
+
+@pytest.fixture
+def rtc(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # STATS_FILE goes here
+    monkeypatch.setitem(machine.i2c_devices, 0x68, machine.DS3231Device())
+    rtc = DS3231(machine.I2C(0))
+    rtc.set_time(utime.time())
+    return rtc
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Every lightsleep and deepsleep length in ms, the clock still moves on for lightsleep
+    calls = []
+
+    def lightsleep(ms):
+        calls.append(('light', ms))
+        utime.sleep_ms(ms)
+
+    def deepsleep(ms):
+        calls.append(('deep', ms))
+        raise SystemExit  # What a reset looks like from here
+
+    monkeypatch.setattr(machine, 'lightsleep', lightsleep)
+    monkeypatch.setattr(machine, 'deepsleep', deepsleep)
+    return calls
+
+def test_lightsleep_in_chunks_until_the_alarm(rtc, sleeps):
+    power = PowerManager(LIGHT, rtc)
+    wake_at = utime.time() + 3 * HOUR + 20
+    power.sleep_until(wake_at)
+    assert [ms for _, ms in sleeps] == [MAX_SLEEP_MS] * 3 + [20000]
+    assert utime.time() >= wake_at
+    assert power.wakeups == 4
+    assert power.woke_by_alarm
+    assert not rtc.alarm_fired()  # Cleared once seen
+
+def test_lightsleep_stops_early_on_the_alarm(rtc, sleeps):
+    power = PowerManager(LIGHT, rtc)
+    wake_at = utime.time() + 2 * HOUR
+    power.sleep_until(wake_at)
+    # The alarm is seen after the second chunk, so there is no zero-length third one
+    assert len(sleeps) == 2
+    assert power.wakeups == 2
+
+def test_deepsleep_is_capped(rtc, sleeps):
+    power = PowerManager(DEEP, rtc)
+    wake_at = utime.time() + 14 * 86400
+    with pytest.raises(SystemExit):
+        power.sleep_until(wake_at)
+    assert sleeps == [('deep', MAX_SLEEP_MS)]
+    assert rtc.get_alarm() == wake_at  # The DS3231 does the real wake-up
+    # RAM is lost in deepsleep, the next boot picks the count up from the file
+    assert PowerManager(DEEP, rtc).wakeups == 1
+
+def test_check_alarm(rtc, sleeps):
+    power = PowerManager(DEEP, rtc)
+    rtc.set_alarm(utime.time() + 10)
+    assert not power.check_alarm()
+    utime.advance(10)
+    assert power.check_alarm()
+    assert not power.check_alarm()  # Only once per alarm
+
+def test_check_alarm_without_the_chip(rtc, monkeypatch):
+    power = PowerManager(DEEP, rtc)
+    monkeypatch.delitem(machine.i2c_devices, 0x68)
+    assert not power.check_alarm()
+
+def test_stats(rtc, sleeps):
+    power = PowerManager(LIGHT, rtc)
+    utime.advance(30)  # Awake for 30 seconds
+    power.sleep_until(utime.time() + HOUR - 30)
+    utime.advance(30)
+    stats = power.stats()
+    assert stats["mode"] == LIGHT
+    assert stats["wakeups"] == 1
+    assert stats["awake_seconds"] == 60
+    assert stats["wakeups_per_day"] == pytest.approx(24, rel=0.01)
+    assert stats["awake_ratio"] == pytest.approx(60 / HOUR, rel=0.01)
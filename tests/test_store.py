@@ -0,0 +1,72 @@
+import pytest
+from store import StateStore, MAX_VALUE
+
+@pytest.fixture(autouse=True)
+def in_tmp(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+def reopen():
+    s = StateStore()
+    return s, s.load()
+
+def test_round_trip():
+    s = StateStore()
+    s.put(0, 1800000000, 86400, 10)
+    s.put(1, 1800000500, 3600, 2.5)  # The dashboard sends Number(duration)
+    s.flush()
+    _, state = reopen()
+    assert state == {0: (1800000000, 86400, 10), 1: (1800000500, 3600, 2.5)}
+    assert isinstance(state[0][2], int)
+
+def test_out_of_range_values_are_clamped():
+    s = StateStore()
+    s.put(0, 1800000000, 86400, 70000)
+    s.put(1, 10 ** 300, -5, 10 ** 9)
+    s.flush()
+    _, state = reopen()
+    assert state[0] == (1800000000, 86400, 70000)
+    assert state[1] == (MAX_VALUE, 0, MAX_VALUE / 1000)
+
+def test_appends_then_compacts():
+    s = StateStore(max_records=4)
+    s.put(0, 1, 2, 3)
+    s.flush()  # First flush writes a snapshot
+    assert s.compactions == 1
+    s.put(0, 4, 5, 6)
+    s.flush()
+    s.put(0, 4, 5, 6)  # Unchanged, nothing to write
+    assert not s.dirty()
+    s.put(0, 7, 8, 9)
+    s.put(1, 1, 1, 1)
+    s.flush()
+    assert s.compactions == 2
+    assert reopen()[1] == {0: (7, 8, 9), 1: (1, 1, 1)}
+
+def test_torn_tail_keeps_the_last_good_state():
+    s = StateStore()
+    s.put(0, 1, 2, 3)
+    s.flush()
+    s.put(0, 4, 5, 6)
+    s.flush()
+    with open(s.files[s.active], 'ab') as f:
+        f.write(b'\x53\x57\x03')  # A record cut short by a power loss
+    s2, state = reopen()
+    assert state == {0: (4, 5, 6)}
+    assert s2.compactions == 1
+
+def test_failed_write_is_retried():
+    s = StateStore()
+    s.put(0, 1, 2, 3)
+    s.flush()
+    s.put(0, 4, 5, 6)
+
+    def broken(path, mode, records):
+        raise OSError(28)  # ENOSPC
+
+    s._write = broken
+    with pytest.raises(OSError):
+        s.flush()
+    assert s.dirty()
+    del s._write
+    s.flush()
+    assert reopen()[1] == {0: (4, 5, 6)}
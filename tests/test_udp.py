@@ -0,0 +1,45 @@
+import struct
+import utime
+from udp import (UdpService, MAGIC, VERSION, DISCOVER, ANNOUNCE, STATUS_REQUEST, STATUS,
+                 ANNOUNCE_FORMAT, STATUS_FORMAT)
+
+def request(kind, seq, zone=None):
+    data = struct.pack('<2sBBH', MAGIC, VERSION, kind, seq)
+    return data if zone is None else data + bytes([zone])
+
+def make_service(status):
+    service = UdpService(0x1234, utime.ticks_ms(), 'garden', 3, status)
+    service.port = 8080
+    return service
+
+def test_discover():
+    service = make_service(lambda zone_id: None)
+    reply = struct.unpack(ANNOUNCE_FORMAT, service.handle(request(DISCOVER, 7)))
+    assert reply == (MAGIC, VERSION, ANNOUNCE, 7, 0x1234, 8080, 3, b'garden' + bytes(10))
+
+def test_status_fields_are_clamped_to_their_widths():
+    status = lambda zone_id: (300, 1, 2, 1800000000, -5, 1 << 40, 100000.5)
+    service = make_service(status)
+    reply = struct.unpack(STATUS_FORMAT, service.handle(request(STATUS_REQUEST, 9, 0)))
+    assert reply[:6] == (MAGIC, VERSION, STATUS, 9, 0x1234, 0xFF)
+    assert reply[6:12] == (1, 2, 1800000000, 0, 0xFFFFFFFF, 0xFFFF)
+    assert service.rejected == 0
+
+def test_a_failing_status_is_rejected():
+    def status(zone_id):
+        raise ValueError("no such zone")
+
+    class Socket:
+        sent = []
+
+        def sendto(self, data, addr):
+            self.sent.append(data)
+
+    service = make_service(status)
+    sock = Socket()
+    service._answer(sock, request(STATUS_REQUEST, 1, 0), ('127.0.0.1', 1))
+    service._answer(sock, b'junk', ('127.0.0.1', 1))
+    service._answer(sock, request(DISCOVER, 2), ('127.0.0.1', 1))
+    assert service.requests == 3
+    assert service.rejected == 2
+    assert service.replies == 1 and len(sock.sent) == 1
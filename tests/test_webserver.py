@@ -0,0 +1,248 @@
+import asyncio
+import pytest
+import utime
+import webserver
+from webserver import HTTPError, Router, KEEP_ALIVE_TIMEOUT, MAX_CONNECTIONS, MAX_HEADER_SIZE, MAX_BODY_SIZE
+
+class Client:
+    """One connection to serve_client: feeds its reader and collects what it writes."""
+
+    def __init__(self, router):
+        self.reader = asyncio.StreamReader()
+        self.out = bytearray()
+        self.closed = False
+        self.task = asyncio.create_task(webserver.serve_client(self.reader, self, router))
+
+    def send(self, data):
+        self.reader.feed_data(data)
+
+    def hang_up(self):
+        self.reader.feed_eof()
+
+    def responses(self):
+        return parse_responses(self.out)
+
+    # The writer side, as serve_client sees it
+    def write(self, data):
+        self.out += data  # Copied now, data can point into a pooled buffer
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 50000)
+
+def parse_responses(data):
+    # (status, headers, body) for every response in data, bodies delimited by Content-Length
+    responses = []
+    data = bytes(data)
+    while data:
+        head, _, data = data.partition(b'\r\n\r\n')
+        lines = head.decode().split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        responses.append((int(lines[0].split()[1]), headers, data[:length]))
+        data = data[length:]
+    return responses
+
+def get(path, version='HTTP/1.1', headers=''):
+    return f"GET {path} {version}\r\nHost: pico\r\n{headers}\r\n".encode()
+
+def run(scenario):
+    # The virtual clock is frozen, so every timeout fires as soon as nothing else can run
+    async def guarded():
+        return await asyncio.wait_for(scenario(), 600)
+    return asyncio.run(guarded())
+
+def request_status(router, data):
+    async def scenario():
+        client = Client(router)
+        client.send(data)
+        client.hang_up()
+        await client.task
+        return client
+
+    return [status for status, _, _ in run(scenario).responses()]
+
+@pytest.fixture
+def router():
+    router = Router()
+
+    @router.route('GET', '/ping')
+    def ping(request):
+        return {"pong": True, "query": request.query}
+
+    @router.route('POST', '/echo')
+    def echo(request):
+        return request.json()
+
+    @router.route('GET', '/refused')
+    def refused(request):
+        raise HTTPError(503, "Not now")
+
+    @router.route('GET', '/boom')
+    def boom(request):
+        raise KeyError('bug')
+
+    yield router
+    # Every connection gave its buffer back
+    assert len(webserver._pool.free) == MAX_CONNECTIONS
+    assert not webserver._idle and not webserver._evicted
+
+def test_keep_alive_until_idle(router):
+    async def scenario():
+        client = Client(router)
+        client.send(get('/ping'))
+        await asyncio.sleep(1)
+        client.send(get('/ping?n=2'))
+        await asyncio.sleep(1)
+        assert not client.closed
+        idle_from = utime.now()
+        await client.task
+        return client, utime.now() - idle_from
+
+    client, idle = run(scenario)
+    responses = client.responses()
+    assert [status for status, _, _ in responses] == [200, 200]
+    assert responses[1][2] == b'{"pong": true, "query": {"n": "2"}}'
+    assert all(headers['connection'] == 'keep-alive' for _, headers, _ in responses)
+    assert client.closed
+    assert KEEP_ALIVE_TIMEOUT - 1 <= idle <= KEEP_ALIVE_TIMEOUT + 1
+
+def test_requests_per_connection_are_capped(router, monkeypatch):
+    monkeypatch.setattr(webserver, 'MAX_REQUESTS', 3)
+
+    async def scenario():
+        client = Client(router)
+        for _ in range(3):
+            client.send(get('/ping'))
+            await asyncio.sleep(0.1)
+        await client.task
+        return client
+
+    client = run(scenario)
+    connections = [headers['connection'] for _, headers, _ in client.responses()]
+    assert connections == ['keep-alive', 'keep-alive', 'close']
+
+def test_http_1_0_and_connection_close(router):
+    async def scenario():
+        old = Client(router)
+        old.send(get('/ping', 'HTTP/1.0'))
+        opted_in = Client(router)
+        opted_in.send(get('/ping', 'HTTP/1.0', 'Connection: keep-alive\r\n'))
+        closing = Client(router)
+        closing.send(get('/ping', headers='Connection: close\r\n'))
+        await asyncio.sleep(0.1)
+        states = [client.closed for client in (old, opted_in, closing)]
+        opted_in.hang_up()
+        await asyncio.gather(old.task, opted_in.task, closing.task)
+        return states
+
+    assert run(scenario) == [True, False, True]
+
+def test_pipelined_request_closes_the_connection(router):
+    async def scenario():
+        client = Client(router)
+        client.send(get('/ping') + get('/ping'))
+        await client.task
+        return client
+
+    responses = run(scenario).responses()
+    assert len(responses) == 1
+    assert responses[0][1]['connection'] == 'close'
+
+def test_new_client_evicts_the_longest_idle_connection(router):
+    async def scenario():
+        clients = []
+        for _ in range(MAX_CONNECTIONS):
+            client = Client(router)
+            client.send(get('/ping'))
+            await asyncio.sleep(0.1)
+            clients.append(client)
+        latecomer = Client(router)
+        latecomer.send(get('/ping', headers='Connection: close\r\n'))
+        await latecomer.task
+        closed = [client.closed for client in clients]
+        for client in clients[1:]:
+            client.hang_up()
+        await asyncio.gather(*(client.task for client in clients))
+        return latecomer, closed
+
+    latecomer, closed = run(scenario)
+    assert [status for status, _, _ in latecomer.responses()] == [200]
+    assert closed == [True] + [False] * (MAX_CONNECTIONS - 1)
+
+def test_503_when_every_connection_is_busy(router):
+    async def scenario():
+        # Each of these is partway through a request, so none can be evicted
+        busy = [Client(router) for _ in range(MAX_CONNECTIONS)]
+        for client in busy:
+            client.send(b"GET /ping HTTP/1.1\r\n")
+        await asyncio.sleep(0.1)
+        refused = Client(router)
+        await refused.task
+        await asyncio.gather(*(client.task for client in busy))
+        return refused, busy
+
+    refused, busy = run(scenario)
+    assert [status for status, _, _ in refused.responses()] == [503]
+    # The slow clients run out of time in the end
+    assert all(client.responses()[0][0] == 408 for client in busy)
+
+def test_request_timeout(router):
+    async def scenario():
+        client = Client(router)
+        client.send(b"POST /echo HTTP/1.1\r\nContent-Length: 10\r\n\r\n{")
+        await client.task
+        return client
+
+    assert [status for status, _, _ in run(scenario).responses()] == [408]
+
+def test_largest_request_fits(router):
+    body = b'"' + b'x' * (MAX_BODY_SIZE - 2) + b'"'
+    head = b"POST /echo HTTP/1.1\r\nContent-Length: %d\r\nX-Pad: " % len(body)
+    head += b'a' * (MAX_HEADER_SIZE - len(head)) + b"\r\n\r\n"
+    assert request_status(router, head + body) == [200]
+
+def test_body_too_large(router):
+    assert request_status(router, b"POST /echo HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (MAX_BODY_SIZE + 1)) == [413]
+
+def test_headers_too_large(router):
+    assert request_status(router, b"GET /ping HTTP/1.1\r\nX-Pad: " + b'a' * MAX_HEADER_SIZE) == [431]
+
+def test_malformed_requests(router):
+    assert request_status(router, b"GET /ping\r\n\r\n") == [400]
+    assert request_status(router, b"GET /ping HTTP/1.1\r\nno colon\r\n\r\n") == [400]
+    assert request_status(router, b"POST /echo HTTP/1.1\r\nContent-Length: -1\r\n\r\n") == [400]
+    assert request_status(router, b"POST /echo HTTP/1.1\r\nContent-Length: 10\r\n\r\n{}") == [400]
+
+def test_dispatch(router):
+    async def scenario():
+        client = Client(router)
+        client.send(b"POST /echo?x=1 HTTP/1.1\r\nContent-Length: 8\r\n\r\n[1, \"a\"]")
+        await asyncio.sleep(0.1)
+        for request in (get('/nowhere'), b"DELETE /ping HTTP/1.1\r\n\r\n", b"OPTIONS /ping HTTP/1.1\r\n\r\n",
+                        get('/refused'), get('/boom'), get('/ping', headers='Connection: close\r\n')):
+            client.send(request)
+            await asyncio.sleep(0.1)
+        await client.task
+        return client
+
+    responses = run(scenario).responses()
+    assert [status for status, _, _ in responses] == [200, 404, 405, 204, 503, 500, 200]
+    assert responses[0][2] == b'[1, "a"]'
+    assert responses[2][1]['allow'] == 'GET'
+    assert 'content-length' not in responses[3][1]
+    assert responses[4][2] == b'{"error": "Not now"}'
+    assert responses[5][2] == b'{"error": "Internal error"}'
+    # A handler that raises still leaves the connection usable
+    assert responses[5][1]['connection'] == 'keep-alive'
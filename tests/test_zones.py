@@ -0,0 +1,236 @@
+import utime
+from zones import (Zone, ZoneScheduler, MISSED_ONCE, MISSED_SKIP, MISSED_ALL, MISSED_GRACE,
+                   CATCH_UP_SPACING, MAX_CATCH_UP)
+
+DAY = 86400
+
+def make_zone(zone_id, interval=DAY, duration=5, supply=0, **kwargs):
+    return Zone(zone_id, (100 + zone_id, 1000 + zone_id, 2000 + zone_id), duration, interval, supply, **kwargs)
+
+class Recorder:
+    def __init__(self):
+        self.events = []  # (time, event, zone id)
+
+    def __call__(self, event, zone):
+        self.events.append((utime.time(), event, zone.id))
+
+    def started(self):
+        return [zone_id for _, event, zone_id in self.events if event == 'watering_started']
+
+def run_until(scheduler, end):
+    # Ticks every second while a pump runs, otherwise jumps to the next due time
+    while True:
+        now = utime.time()
+        scheduler.tick(now)
+        scheduler.poll()
+        if now >= end and not scheduler.busy():
+            return
+        step = 1
+        if not scheduler.busy():
+            due = scheduler.next_due()
+            step = max(1, min(end if due is None else due, end) - now)
+        utime.advance(step)
+
+def test_hundreds_of_zones_over_months():
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    start = utime.time()
+    end = start + 90 * DAY
+    zones = [make_zone(i, DAY * (1 + i % 14), 5 + i % 10, supply=i % 12) for i in range(300)]
+    first = {}
+    for zone in zones:
+        first[zone.id] = start + 60 + (zone.id * 997) % zone.interval
+        scheduler.add(zone, first[zone.id])
+    run_until(scheduler, end)
+
+    # Every grid time up to the end was watered, exactly once
+    starts = {}
+    for t, event, zone_id in recorder.events:
+        if event == 'watering_started':
+            starts.setdefault(zone_id, []).append(t)
+    for zone in zones:
+        expected = (end - first[zone.id]) // zone.interval + 1
+        assert len(starts[zone.id]) == expected
+        for k, t in enumerate(starts[zone.id]):
+            assert t >= first[zone.id] + k * zone.interval
+        # Still on the grid after three months of pump runs and queueing
+        assert (zone.anchor - first[zone.id]) % zone.interval == 0
+        assert zone.next_watering == zone.anchor
+
+    # Never two zones pumping from one supply
+    active = {}
+    for _, event, zone_id in recorder.events:
+        supply = zones[zone_id].supply
+        if event == 'watering_started':
+            assert supply not in active
+            active[supply] = zone_id
+        else:
+            assert active.pop(supply) == zone_id
+    assert not active
+
+    # Stale entries are dropped as they reach the top, the heap doesn't grow with the cycles
+    assert len(scheduler.heap) <= 2 * len(zones)
+
+def test_supply_queue_is_fifo():
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    later = utime.time() + 30 * DAY
+    a, b, c = make_zone(0), make_zone(1), make_zone(2)
+    other = make_zone(3, supply=1)
+    for zone in (a, b, c, other):
+        scheduler.add(zone, later)
+    assert scheduler.run(a)
+    assert scheduler.run(c)
+    assert scheduler.run(b)
+    assert scheduler.run(other)
+    assert not scheduler.run(c)  # Already waiting
+    assert recorder.started() == [0, 3]  # The other supply doesn't wait
+    assert scheduler.waiting[0] == [c, b]
+    run_until(scheduler, utime.time())
+    assert recorder.started() == [0, 3, 2, 1]
+
+def test_stop_takes_a_zone_out_of_the_queue():
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    later = utime.time() + 30 * DAY
+    a, b, c = make_zone(0), make_zone(1), make_zone(2)
+    for zone in (a, b, c):
+        scheduler.add(zone, later)
+    scheduler.run(a)
+    scheduler.run(b)
+    scheduler.run(c)
+    assert scheduler.stop(b)
+    run_until(scheduler, utime.time())
+    assert recorder.started() == [0, 2]
+
+def test_failing_listener_doesnt_leave_a_motor_running():
+    def listener(event, zone):
+        raise ValueError('bookkeeping failed')
+
+    scheduler = ZoneScheduler(listener)
+    later = utime.time() + 30 * DAY
+    a, b = make_zone(0), make_zone(1)
+    for zone in (a, b):
+        scheduler.add(zone, later)
+    assert scheduler.run(a)
+    assert scheduler.run(b)
+    run_until(scheduler, utime.time())
+    assert not scheduler.busy()
+    assert a.motor.state == b.motor.state == 'idle'
+
+def test_rescheduling_leaves_stale_entries_behind():
+    scheduler = ZoneScheduler()
+    now = utime.time()
+    zone = make_zone(0)
+    scheduler.add(zone, now + 100)
+    scheduler.schedule(zone, now + 1000)
+    scheduler.schedule(zone, now + 500)
+    assert len(scheduler.heap) == 3
+    assert scheduler.next_due() == now + 500
+    assert len(scheduler.heap) == 2  # The stale now + 100 entry was popped on the way
+    assert scheduler.tick(now + 100) == []
+    assert scheduler.tick(now + 499) == []
+    assert scheduler.tick(now + 500) == [zone]
+    assert zone.next_watering == now + 500 + zone.interval
+    # The now + 1000 entry is stale too and never fires
+    assert scheduler.tick(now + 1000) == []
+    assert scheduler.next_due() == now + 500 + zone.interval
+    assert len(scheduler.heap) == 1
+
+def outage(policy, days_off, interval=DAY):
+    # The zone was due at t0, the board was off until days_off intervals and a half later
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    t0 = utime.time() + 60
+    zone = make_zone(0, interval, missed=policy)
+    scheduler.add(zone, t0)
+    utime.advance(60 + days_off * interval + interval // 2)
+    return recorder, scheduler, zone, t0
+
+def test_on_time_watering():
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    t0 = utime.time() + 60
+    zone = make_zone(0)
+    scheduler.add(zone, t0)
+    assert scheduler.tick(t0 - 1) == []
+    # A tick within MISSED_GRACE is still on time, and the next one keeps to the grid
+    utime.advance(60 + MISSED_GRACE)
+    assert scheduler.tick(utime.time()) == [zone]
+    assert recorder.started() == [0]
+    assert zone.next_watering == zone.anchor == t0 + DAY
+
+def test_missed_once():
+    recorder, scheduler, zone, t0 = outage(MISSED_ONCE, 3)
+    now = utime.time()
+    assert scheduler.tick(now) == [zone]
+    assert recorder.started() == [0]
+    assert zone.next_watering == zone.anchor == t0 + 4 * DAY
+    run_until(scheduler, zone.anchor)
+    assert recorder.started() == [0, 0]
+    assert recorder.events[-2][0] == t0 + 4 * DAY
+    assert zone.anchor == t0 + 5 * DAY
+
+def test_missed_skip():
+    recorder, scheduler, zone, t0 = outage(MISSED_SKIP, 3)
+    assert scheduler.tick(utime.time()) == [zone]
+    assert recorder.started() == []
+    assert zone.next_watering == zone.anchor == t0 + 4 * DAY
+    run_until(scheduler, zone.anchor)
+    assert recorder.started() == [0]
+    assert zone.anchor == t0 + 5 * DAY
+
+def test_missed_all():
+    recorder, scheduler, zone, t0 = outage(MISSED_ALL, 3)
+    now = utime.time()
+    assert scheduler.tick(now) == [zone]
+    # Four windows were missed: one watering now and three more, CATCH_UP_SPACING apart
+    assert zone.catch_up == 3
+    assert zone.next_watering == now + CATCH_UP_SPACING
+    run_until(scheduler, now + 4 * CATCH_UP_SPACING)
+    starts = [t for t, event, _ in recorder.events if event == 'watering_started']
+    assert starts == [now + k * CATCH_UP_SPACING for k in range(4)]
+    assert zone.catch_up == 0
+    assert zone.next_watering == zone.anchor == t0 + 4 * DAY
+
+def test_missed_all_is_capped():
+    recorder, scheduler, zone, t0 = outage(MISSED_ALL, 30)
+    run_until(scheduler, utime.time() + DAY // 3)
+    assert recorder.started() == [0] * (1 + MAX_CATCH_UP)
+    assert zone.next_watering == zone.anchor == t0 + 31 * DAY
+
+def test_catch_up_gives_way_to_the_schedule():
+    # Make-up waterings that would run into the next scheduled one are dropped
+    recorder, scheduler, zone, t0 = outage(MISSED_ALL, 5, interval=3 * CATCH_UP_SPACING)
+    scheduler.tick(utime.time())
+    assert zone.catch_up == MAX_CATCH_UP
+    run_until(scheduler, zone.anchor)
+    assert recorder.started() == [0, 0, 0]  # Now, one make-up and the scheduled one
+    assert (zone.anchor - t0) % zone.interval == 0
+
+def test_overdue_time_after_a_reboot():
+    # main() adds zones with the anchor saved before the board went down
+    saved = utime.time() - 2 * DAY - 7200
+    for policy, waterings in ((MISSED_ONCE, 1), (MISSED_SKIP, 0), (MISSED_ALL, 3)):
+        recorder = Recorder()
+        scheduler = ZoneScheduler(recorder)
+        zone = make_zone(0, missed=policy)
+        scheduler.add(zone, saved)
+        run_until(scheduler, utime.time() + 4 * CATCH_UP_SPACING)
+        assert len(recorder.started()) == waterings
+        assert zone.anchor == saved + 3 * DAY
+        assert zone.next_watering == zone.anchor
+
+def test_late_ticks_and_long_runs_dont_drift():
+    recorder = Recorder()
+    scheduler = ZoneScheduler(recorder)
+    t0 = utime.time() + 60
+    zone = make_zone(0, 3600, duration=600)
+    scheduler.add(zone, t0)
+    for k in range(48):
+        # Ticks land up to four minutes late and the pump runs for ten
+        utime.advance(t0 + k * 3600 + (k * 37) % 240 - utime.time())
+        assert scheduler.tick(utime.time()) == [zone]
+        run_until(scheduler, utime.time())
+        assert zone.anchor == t0 + (k + 1) * 3600
+    assert len(recorder.started()) == 48